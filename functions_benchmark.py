@@ -0,0 +1,1166 @@
+"""
+
+Functions:
+- build_synthetic_shipments
+- build_tracking_page_html
+- build_tracking_api_payload
+- serve_stand_in_tracking_page
+- benchmark_concurrent_scraping
+- benchmark_page_readiness
+- compare_fetch_backends
+- benchmark_parsing
+- benchmark_parallel_parsing
+- benchmark_streaming_memory
+- build_synthetic_report_frame
+- build_synthetic_final_report
+- benchmark_report_writers
+- benchmark_delta_report
+- benchmark_shipment_analytics
+- benchmark_report_memory
+- benchmark_calculate_processing_days
+- build_synthetic_workbook
+- time_stage
+- run_benchmark_suite
+- compare_with_baseline
+
+Classes:
+- StandInDriver
+
+"""
+
+
+from functions_process_df import SPANISH_MONTHS
+
+
+
+def build_synthetic_shipments(references, client_prefix="DSD/", seed=0):
+    """
+    Generate reproducible shipment values used by the stand-in tracking page and API.
+
+    Args:
+    - references (list): Shipment numbers.
+    - client_prefix (str): Prefix of the client references. Every fourth shipment gets a foreign "EXT/" prefix.
+    - seed (int): Seed for the random values, so the same references always give the same shipments.
+
+    Returns:
+    - list: One dict per shipment with its raw values (history sorted from latest to oldest).
+    """
+    import random
+    from datetime import datetime, timedelta
+
+    rng = random.Random()
+    statuses = ["En tránsito", "En entrega", "Entregado"]
+    destinations = [("Laval", "France"), ("Lahonce", "France"), ("Porto", "Portugal"), ("Milano", "Italy"), ("Köln", "Germany")]
+    locations = ["Blagnac", "Creteil", "Change", "Nimes", ""]
+    actions = ["El envío está en camino.", "El envío llegó al punto de conexión",
+               "Envío entregado en buen estado", "Envío retrasado en tránsito. Acciones de recuperación en curso."]
+
+    shipments = []
+    for position, reference in enumerate(references):
+        reference = str(reference)
+        rng.seed(f"{seed}-{reference}")
+        origin_date = datetime(2023, rng.randint(1, 12), rng.randint(1, 28))
+
+        history = [
+            {
+                "date": origin_date + timedelta(days=day, hours=rng.randint(0, 23), minutes=rng.randint(0, 59)),
+                "location": rng.choice(locations),
+                "action": rng.choice(actions),
+            }
+            for day in range(3, 0, -1)
+        ]
+
+        shipments.append({
+            "shipment_number": reference,
+            "client_reference": f"{'EXT/' if position % 4 == 3 else client_prefix}{rng.randint(100000, 999999)}",
+            "status": rng.choice(statuses),
+            "origin_date": origin_date,
+            "destination": rng.choice(destinations),
+            "history": history,
+            "exception": rng.random() < 0.1,
+        })
+
+    return shipments
+
+# Example usage:
+# shipments = build_synthetic_shipments(["607252040", "607247685"])
+
+
+
+def build_tracking_page_html(references, client_prefix="DSD/", seed=0, filler_blocks=200):
+    """
+    Build a synthetic TNT tracking page with the real pb-search-results structure.
+
+    Every reference gets one pb-shipment container with its client reference, status,
+    origin date, destination, history table and, for some of them, an exception badge.
+
+    Args:
+    - references (list): Shipment numbers shown on the page.
+    - client_prefix (str): Prefix of the client references.
+    - seed (int): Seed for the random values.
+    - filler_blocks (int): Number of header/footer blocks around the results, to mimic the weight of the real page.
+
+    Returns:
+    - str: HTML of the page.
+    """
+    filler_html = "".join(
+        f'<div class="__c-nav"><ul><li><a href="/express/es_es/site/{block}.html">Enlace {block}</a></li>'
+        f'<li><span>Servicio {block}</span></li></ul><script>window.dataLayer = [{block}];</script></div>'
+        for block in range(filler_blocks)
+    )
+
+    shipments_html = []
+    for shipment in build_synthetic_shipments(references, client_prefix=client_prefix, seed=seed):
+        origin_date = shipment["origin_date"]
+        city, country = shipment["destination"]
+        badge = '<span class="__c-badge __c-badge--warning">Excepción</span>' if shipment["exception"] else ''
+
+        history_rows = "".join(
+            '<tr>'
+            f'<td class="__c-shipment-history__date">{event["date"]:%d/%m/%y} {event["date"].hour}:{event["date"]:%M}</td>'
+            f'<td class="__u-hide--small-medium">{event["location"]}</td>'
+            f'<td>{event["action"]}</td>'
+            '</tr>'
+            for event in shipment["history"]
+        )
+
+        shipments_html.append(
+            '<pb-shipment>'
+            '<pb-shipment-reference><div><dl>'
+            f'<dt>Número de envío</dt><dd>{shipment["shipment_number"]}</dd>'
+            f'<dt>Referencia del cliente</dt><dd>{shipment["client_reference"]}</dd>'
+            '</dl></div></pb-shipment-reference>'
+            '<div>'
+            '<div class="__c-shipment__details">'
+            f'{badge}'
+            '<sham-shipment-status-tnt><div><div class="__c-shipment-status-tnt__summary">'
+            f'<sham-step-label><span>{shipment["status"]}</span></sham-step-label>'
+            '</div></div></sham-shipment-status-tnt>'
+            '<sham-shipment-addresses><div>'
+            '<div class="__c-shipment-address __c-shipment-address--from"><div class="__c-shipment-address__text">'
+            '<div>Origen</div><div>Barcelona,  Spain</div>'
+            f'<div><sham-shipment-origin-date>{origin_date.day} de {SPANISH_MONTHS[origin_date.month - 1]} de {origin_date.year}</sham-shipment-origin-date></div>'
+            '</div></div>'
+            '<div class="__c-shipment-address __c-shipment-address--to"><div>Destino</div><div>'
+            f'<div class="__c-heading __c-heading--h4 __c-heading--bold __u-mb--none">{city},  {country}</div>'
+            '</div></div>'
+            '</div></sham-shipment-addresses>'
+            '</div>'
+            '<div class="__c-shipment__history __u-print-only"><sham-shipment-history><table><tbody>'
+            f'{history_rows}'
+            '</tbody></table></sham-shipment-history></div>'
+            '</div>'
+            '</pb-shipment>'
+        )
+
+    return (
+        '<html><head><title>Seguimiento</title></head><body>'
+        '<div class="contentPageFullWidth newBase page basicpage"><div><div><pb-root><div><div><div>'
+        '<pb-track-trace><pb-search-results>'
+        f'<div class="__u-mb--xl">{"".join(shipments_html)}</div>'
+        '</pb-search-results></pb-track-trace>'
+        '</div></div></div></pb-root></div></div></div>'
+        f'<footer>{filler_html}</footer>'
+        '</body></html>'
+    )
+
+# Example usage:
+# html = build_tracking_page_html(["607252040", "607247685"])
+
+
+
+def build_tracking_api_payload(references, client_prefix="DSD/", seed=0):
+    """
+    Build a tracking API payload, in the assumed (unverified) schema, for the same shipments as build_tracking_page_html.
+
+    Args:
+    - references (list): Shipment numbers requested.
+    - client_prefix (str): Prefix of the client references.
+    - seed (int): Seed for the random values.
+
+    Returns:
+    - dict: JSON payload in the layout read by functions_http_backend.map_consignment_to_record.
+    """
+    consignments = []
+    for shipment in build_synthetic_shipments(references, client_prefix=client_prefix, seed=seed):
+        city, country = shipment["destination"]
+        consignments.append({
+            "consignmentNumber": shipment["shipment_number"],
+            "customerReference": shipment["client_reference"],
+            "originDate": shipment["origin_date"].strftime("%Y-%m-%d"),
+            "destinationAddress": {"city": city, "country": country},
+            "status": {"statusDescription": shipment["status"], "isException": shipment["exception"]},
+            "statusData": [
+                {
+                    "localEventDate": event["date"].strftime("%Y-%m-%dT%H:%M:%S"),
+                    "depotName": event["location"],
+                    "statusDescription": event["action"],
+                }
+                for event in shipment["history"]
+            ],
+        })
+
+    return {"tracker.output": {"consignment": consignments, "notFound": []}}
+
+# Example usage:
+# payload = build_tracking_api_payload(["607252040", "607247685"])
+
+
+
+def serve_stand_in_tracking_page(latency=0.25, unknown_references=()):
+    """
+    Start a local HTTP server that answers tracking URLs with a synthetic page.
+
+    The server reads the `cons` (page) or `con` (API) query parameter, waits `latency`
+    seconds to mimic the tracking site, and returns build_tracking_page_html, or
+    build_tracking_api_payload as JSON for paths under /api/.
+
+    Args:
+    - latency (float): Seconds each request takes before the answer is returned.
+    - unknown_references (iterable): Shipment numbers left out of every answer, as numbers TNT does not know.
+
+    Returns:
+    - ThreadingHTTPServer: Running server (call `shutdown()` when done).
+    - str: Base URL of the page, to pass to create_chunked_urls.
+    - str: Base URL of the API, to pass to the HTTP fetch backend.
+    """
+    import json
+    import threading
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import urlparse, parse_qs
+
+    unknown_references = {str(ref) for ref in unknown_references}
+
+    class StandInHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            parsed_url = urlparse(self.path)
+            query = parse_qs(parsed_url.query)
+            is_api = parsed_url.path.startswith("/api/")
+            references = [ref for ref in query.get("con" if is_api else "cons", [""])[0].split(",")
+                          if ref and ref not in unknown_references]
+
+            time.sleep(latency)
+
+            if is_api:
+                body = json.dumps(build_tracking_api_payload(references)).encode("utf-8")
+                content_type = "application/json"
+            else:
+                body = build_tracking_page_html(references).encode("utf-8")
+                content_type = "text/html; charset=utf-8"
+
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    root_url = f"http://127.0.0.1:{server.server_address[1]}"
+    return server, f"{root_url}/seguimiento.html", f"{root_url}/api/v3/shipment"
+
+# Example usage:
+# server, page_url, api_url = serve_stand_in_tracking_page(latency=0.25)
+# server.shutdown()
+
+
+
+class StandInDriver:
+    """
+    Minimal WebDriver stand-in that loads pages over plain HTTP.
+
+    It implements the part of the WebDriver interface used by the scraping functions
+    (get, find_elements, page_source, current_url, quit), so ChromeDriverPool can
+    run against the local stand-in tracking page without a browser.
+
+    With render_delay > 0 the shipments appear that many seconds after get(), like the
+    Angular components of the real page: until then pb-search-results is empty.
+
+    Args:
+    - render_delay (float): Seconds between the page load and the rendering of the results.
+    """
+
+    def __init__(self, render_delay=0.0):
+        self.current_url = "about:blank"
+        self.render_delay = render_delay
+        self._loaded_source = ""
+        self._loaded_at = 0.0
+
+    def get(self, url):
+        import time
+        from urllib.request import urlopen
+
+        with urlopen(url) as response:
+            self._loaded_source = response.read().decode("utf-8")
+        self._loaded_at = time.monotonic()
+        self.current_url = url
+
+    @property
+    def page_source(self):
+        import re
+        import time
+
+        if time.monotonic() - self._loaded_at >= self.render_delay:
+            return self._loaded_source
+        return re.sub(r"<pb-search-results>.*</pb-search-results>", "<pb-search-results></pb-search-results>",
+                      self._loaded_source, flags=re.S)
+
+    def find_elements(self, by, value):
+        from bs4 import BeautifulSoup, SoupStrainer
+
+        soup = BeautifulSoup(self.page_source, "html.parser", parse_only=SoupStrainer("pb-search-results"))
+        return soup.select(value)
+
+    def quit(self):
+        pass
+
+
+
+def benchmark_concurrent_scraping(worker_counts=(1, 2, 4, 8), n_references=600, latency=0.25):
+    """
+    Measure scrape_structure_from_urls throughput against the local stand-in tracking page.
+
+    Args:
+    - worker_counts (tuple): Numbers of browser workers to compare.
+    - n_references (int): Number of synthetic shipment numbers (chunked in URLs of 30).
+    - latency (float): Seconds the stand-in page takes to answer each chunk URL.
+
+    Returns:
+    - pd.DataFrame: Elapsed time, pages per second and speed-up for each worker count.
+    """
+    import time
+    import pandas as pd
+    from functions_extract import create_chunked_urls
+    from functions_driver_pool import ChromeDriverPool
+    from functions_web_scraping import scrape_structure_from_urls
+
+    server, base_url, _ = serve_stand_in_tracking_page(latency=latency)
+    references = [str(607200000 + i) for i in range(n_references)]
+    url_list = create_chunked_urls(references, base_url=base_url)
+
+    results = []
+    try:
+        for max_workers in worker_counts:
+            with ChromeDriverPool(None, driver_factory=StandInDriver) as driver_pool:
+                start_time = time.perf_counter()
+                all_shipment_divs = scrape_structure_from_urls(url_list, None, driver_pool=driver_pool, max_workers=max_workers)
+                elapsed_time = time.perf_counter() - start_time
+
+            # Chunk order must not depend on the worker count
+            first_numbers = [div.select_one('pb-shipment-reference div dl dd:nth-child(2)').get_text(strip=True)
+                             for div in all_shipment_divs]
+            results.append({
+                "Workers": max_workers,
+                "Pages": len(url_list),
+                "Seconds": round(elapsed_time, 3),
+                "Pages/s": round(len(url_list) / elapsed_time, 2),
+                "Chunk Order Kept": first_numbers == sorted(first_numbers),
+            })
+    finally:
+        server.shutdown()
+
+    results = pd.DataFrame(results)
+    results["Speed-up"] = (results["Seconds"].iloc[0] / results["Seconds"]).round(2)
+    return results
+
+# Example usage:
+# benchmark_concurrent_scraping(worker_counts=(1, 2, 4, 8))
+
+
+
+def benchmark_page_readiness(render_delays=(0.2, 0.5), n_references=150, latency=0.05, n_unknown=0):
+    """
+    Compare reading the page right after the load with the readiness waits, on pages whose results render late.
+
+    "no wait" reads page_source as soon as the page is loaded (what the fixed implicit wait
+    did); "readiness" polls until every shipment of the chunk has rendered. Both runs go
+    through review_structure_scraped, so the cost of the retries is included. With
+    n_unknown > 0, some chunks hold numbers the stand-in page never shows, which the
+    readiness waits must not wait the whole deadline for.
+
+    Args:
+    - render_delays (tuple): Seconds the stand-in results take to render after the load.
+    - n_references (int): Number of synthetic shipment numbers (chunked in URLs of 30).
+    - latency (float): Seconds the stand-in page takes to answer each chunk URL.
+    - n_unknown (int): Number of those shipment numbers left out of the pages (reported as Missing Shipments).
+
+    Returns:
+    - pd.DataFrame: Elapsed time, pages not ready, retry rounds and missing shipments for each strategy and delay.
+    """
+    import time
+    import pandas as pd
+    from functions_extract import create_chunked_urls
+    from functions_driver_pool import ChromeDriverPool
+    from functions_metrics import RunMetrics
+    from functions_page_readiness import AdaptiveDeadline
+    from functions_web_scraping import scrape_structure_from_urls, review_structure_scraped
+
+    references = [str(607200000 + i) for i in range(n_references)]
+    server, base_url, _ = serve_stand_in_tracking_page(latency=latency, unknown_references=references[:n_unknown])
+    url_list = create_chunked_urls(references, base_url=base_url)
+
+    strategies = {
+        "no wait": lambda: AdaptiveDeadline(initial_timeout=0, min_timeout=0, max_timeout=0),
+        "readiness": AdaptiveDeadline,
+    }
+
+    results = []
+    try:
+        for render_delay in render_delays:
+            for strategy, make_deadline in strategies.items():
+                metrics = RunMetrics()
+                with ChromeDriverPool(None, driver_factory=lambda: StandInDriver(render_delay),
+                                      page_deadline=make_deadline()) as driver_pool:
+                    start_time = time.perf_counter()
+                    all_shipment_divs = scrape_structure_from_urls(url_list, None, driver_pool=driver_pool, max_workers=4, metrics=metrics)
+                    review_structure_scraped(references, all_shipment_divs, url_list, None, driver_pool=driver_pool,
+                                             max_workers=4, metrics=metrics)
+                    elapsed_time = time.perf_counter() - start_time
+
+                results.append({
+                    "Render Delay": render_delay,
+                    "Strategy": strategy,
+                    "Seconds": round(elapsed_time, 3),
+                    "Pages": metrics.counters.get("pages_fetched", 0),
+                    "Pages Not Ready": metrics.counters.get("pages_not_ready", 0),
+                    "Retry Rounds": metrics.counters.get("review_retries", 0),
+                    "Missing Shipments": metrics.gauges.get("missing_references"),
+                })
+    finally:
+        server.shutdown()
+
+    return pd.DataFrame(results)
+
+# Example usage:
+# benchmark_page_readiness(render_delays=(0.2, 0.5))
+# benchmark_page_readiness(render_delays=(0.5,), n_references=70, n_unknown=1)
+
+
+
+def compare_fetch_backends(n_references=120):
+    """
+    Check that the Selenium and HTTP fetch backends give the same DataFrame.
+
+    Both backends run against the local stand-in server: the Selenium path loads the
+    synthetic pages through StandInDriver, the HTTP path requests the API payloads that
+    build_tracking_api_payload writes for the same shipments. Those payloads follow the
+    same assumed schema as the mappers, so this checks the mappers against the page
+    parser, not against the real TNT API.
+
+    Args:
+    - n_references (int): Number of synthetic shipment numbers.
+
+    Returns:
+    - pd.DataFrame: Elapsed seconds and number of rows for each backend.
+    """
+    import time
+    import pandas as pd
+    from functions_extract import create_chunked_urls
+    from functions_driver_pool import ChromeDriverPool
+    from functions_web_scraping import scrape_structure_from_urls, scrape_shipment_data
+    from functions_http_backend import fetch_shipment_data_http
+
+    server, base_url, api_url = serve_stand_in_tracking_page(latency=0.05)
+    references = {str(607200000 + i) for i in range(n_references)}
+
+    try:
+        start_time = time.perf_counter()
+        with ChromeDriverPool(None, driver_factory=StandInDriver) as driver_pool:
+            all_shipment_divs = scrape_structure_from_urls(create_chunked_urls(references, base_url=base_url), None, driver_pool=driver_pool)
+        selenium_df = scrape_shipment_data(all_shipment_divs)
+        selenium_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        http_df = fetch_shipment_data_http(references, api_url=api_url)
+        http_time = time.perf_counter() - start_time
+    finally:
+        server.shutdown()
+
+    pd.testing.assert_frame_equal(selenium_df, http_df)
+
+    return pd.DataFrame([
+        {"Backend": "selenium", "Rows": len(selenium_df), "Seconds": round(selenium_time, 3)},
+        {"Backend": "http", "Rows": len(http_df), "Seconds": round(http_time, 3)},
+    ])
+
+# Example usage:
+# compare_fetch_backends()
+
+
+
+def benchmark_parsing(n_pages=20, parsers=("html.parser", "lxml")):
+    """
+    Micro-benchmark of the page parsing path: shipments parsed per second for each parser backend.
+
+    Every backend parses the same synthetic pages and must give identical records.
+    The "html.parser (full page)" row is the previous path, which built the whole page tree.
+
+    Args:
+    - n_pages (int): Number of 30-shipment pages parsed per variant.
+    - parsers (tuple): Parser backends to compare with the scoped parse.
+
+    Returns:
+    - pd.DataFrame: Seconds and shipments per second for each variant.
+    """
+    import time
+    import pandas as pd
+    from functions_parsing import parse_search_results
+    from functions_web_scraping import scrape_shipment_data
+
+    pages = [build_tracking_page_html([str(607200000 + page * 30 + i) for i in range(30)]) for page in range(n_pages)]
+    n_shipments = 30 * n_pages
+
+    variants = [("html.parser (full page)", "html.parser", False)] + [(parser, parser, True) for parser in parsers]
+
+    results = []
+    reference_df = None
+    for label, parser, scoped in variants:
+        start_time = time.perf_counter()
+        all_shipment_divs = []
+        for page_source in pages:
+            all_shipment_divs.extend(parse_search_results(page_source, parser=parser, scoped=scoped))
+        df = scrape_shipment_data(all_shipment_divs)
+        elapsed_time = time.perf_counter() - start_time
+
+        # Same pages must give identical records on every backend
+        if reference_df is None:
+            reference_df = df
+        else:
+            pd.testing.assert_frame_equal(reference_df, df)
+
+        results.append({
+            "Variant": label,
+            "Seconds": round(elapsed_time, 3),
+            "Shipments/s": round(n_shipments / elapsed_time, 1),
+        })
+
+    return pd.DataFrame(results)
+
+# Example usage:
+# benchmark_parsing(n_pages=20)
+
+
+
+def benchmark_parallel_parsing(n_pages=96, process_counts=(1, 2, 4, 8), parser="html.parser"):
+    """
+    Measure how parse_pages scales with the number of parse processes.
+
+    Every process count parses the same raw pages and must give identical records in page order.
+
+    Args:
+    - n_pages (int): Number of 30-shipment raw pages.
+    - process_counts (tuple): Numbers of processes to compare (1 parses in the current process).
+    - parser (str): BeautifulSoup parser backend.
+
+    Returns:
+    - pd.DataFrame: Seconds, pages per second and speed-up for each process count.
+    """
+    import os
+    import time
+    import pandas as pd
+    from functions_parsing import parse_pages
+
+    pages = [build_tracking_page_html([str(607200000 + page * 30 + i) for i in range(30)]) for page in range(n_pages)]
+
+    results = []
+    reference_records = None
+    for processes in process_counts:
+        start_time = time.perf_counter()
+        page_records = parse_pages(pages, parser=parser, max_processes=processes, min_pages_for_pool=1)
+        elapsed_time = time.perf_counter() - start_time
+
+        if reference_records is None:
+            reference_records = page_records
+        elif page_records != reference_records:
+            raise AssertionError(f"parse_pages with {processes} processes gave different records.")
+
+        results.append({
+            "Processes": processes,
+            "CPUs": os.cpu_count(),
+            "Seconds": round(elapsed_time, 3),
+            "Pages/s": round(n_pages / elapsed_time, 1),
+        })
+
+    results = pd.DataFrame(results)
+    results["Speed-up"] = (results["Seconds"].iloc[0] / results["Seconds"]).round(2)
+    return results
+
+# Example usage:
+# benchmark_parallel_parsing(n_pages=96, process_counts=(1, 2, 4, 8))
+
+
+
+def benchmark_streaming_memory(chunk_counts=(10, 40, 80), max_workers=4, parser="html.parser"):
+    """
+    Compare the peak memory of the divs list and of the streaming pipeline as the number of chunk URLs grows.
+
+    "divs list" keeps the shipment divs of every page (scrape_structure_from_urls) until
+    scrape_shipment_data builds the DataFrame; "streaming" parses each page into record tuples
+    as it is loaded (stream_shipment_records). Both run against the local stand-in tracking
+    page, parse in this process and must give the same DataFrame. Peak memory is measured
+    with tracemalloc.
+
+    Args:
+    - chunk_counts (tuple): Numbers of 30-shipment chunk URLs to compare.
+    - max_workers (int): Number of browser workers.
+    - parser (str): BeautifulSoup parser backend.
+
+    Returns:
+    - pd.DataFrame: Peak MB, seconds and rows for each pipeline and number of chunks.
+    """
+    import time
+    import tracemalloc
+    import pandas as pd
+    from functions_extract import create_chunked_urls
+    from functions_driver_pool import ChromeDriverPool
+    from functions_pipeline import stream_shipment_records
+    from functions_web_scraping import scrape_structure_from_urls, scrape_shipment_data
+
+    def divs_list(url_list):
+        all_shipment_divs = scrape_structure_from_urls(url_list, None, driver_pool=driver_pool, max_workers=max_workers, html_parser=parser)
+        return scrape_shipment_data(all_shipment_divs)
+
+    def streaming(url_list):
+        collector = stream_shipment_records(url_list, None, driver_pool=driver_pool, max_workers=max_workers,
+                                            html_parser=parser, parse_processes=1)
+        return collector.to_dataframe()
+
+    server, base_url, _ = serve_stand_in_tracking_page(latency=0.0)
+
+    results = []
+    try:
+        for chunk_count in chunk_counts:
+            references = [str(607200000 + i) for i in range(chunk_count * 30)]
+            url_list = create_chunked_urls(references, base_url=base_url)
+
+            frames = {}
+            for pipeline, build_frame in (("divs list", divs_list), ("streaming", streaming)):
+                with ChromeDriverPool(None, driver_factory=StandInDriver) as driver_pool:
+                    tracemalloc.start()
+                    start_time = time.perf_counter()
+                    frames[pipeline] = build_frame(url_list)
+                    elapsed_time = time.perf_counter() - start_time
+                    _, peak_bytes = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+
+                results.append({
+                    "Chunks": chunk_count,
+                    "Pipeline": pipeline,
+                    "Peak MB": round(peak_bytes / 1024 / 1024, 1),
+                    "Seconds": round(elapsed_time, 3),
+                    "Rows": len(frames[pipeline]),
+                })
+
+            if not frames["divs list"].equals(frames["streaming"]):
+                raise AssertionError(f"The streaming pipeline gave a different DataFrame for {chunk_count} chunks.")
+    finally:
+        server.shutdown()
+
+    return pd.DataFrame(results)
+
+# Example usage:
+# benchmark_streaming_memory(chunk_counts=(10, 40, 80))
+
+
+
+def build_synthetic_report_frame(n_rows=100_000, seed=0):
+    """
+    Build a synthetic frame shaped like the scraped DataFrame after the date conversions of global_df_transformation.
+
+    Args:
+    - n_rows (int): Number of rows.
+    - seed (int): Seed for the random values.
+
+    Returns:
+    - pd.DataFrame: Frame with 'TNT Status', 'Shipment Origin Date' and 'Last Update' (both datetime64, the first
+      origin date NaT).
+    """
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    origin_dates = pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 300, n_rows), unit="D")
+    last_updates = origin_dates + pd.to_timedelta(rng.integers(0, 30, n_rows), unit="D")
+
+    # The first row has a malformed origin date (NaT after convert_shipment_origin_date), so its processing days are unknown
+    origin_dates = origin_dates.where(np.arange(n_rows) != 0)
+
+    return pd.DataFrame({
+        "Shipment Number": (607200000 + np.arange(n_rows)).astype(str),
+        "TNT Status": rng.choice(["En tránsito", "En entrega", "Entregado"], n_rows),
+        "Shipment Origin Date": origin_dates,
+        "Last Update": last_updates,
+    })
+
+# Example usage:
+# frame = build_synthetic_report_frame(1000)
+
+
+
+def build_synthetic_final_report(n_rows=100_000, seed=0):
+    """
+    Build a synthetic report shaped like a saved TNT Track Report (formatted string columns, report order).
+
+    Args:
+    - n_rows (int): Number of report rows.
+    - seed (int): Seed for the random values.
+
+    Returns:
+    - pd.DataFrame: Report with the 10 columns of rearrange_columns_and_save_to_excel.
+    """
+    from functions_process_df import calculate_processing_days, to_typed_report, format_report_for_export
+
+    # Strings throughout, as read back from a saved report (the typed statuses are categoricals, unknown values empty)
+    report_df = format_report_for_export(to_typed_report(calculate_processing_days(build_synthetic_report_frame(n_rows, seed=seed)))).fillna("").astype(str)
+    report_df["Client Reference"] = "DSD/" + report_df["Shipment Number"].str[-6:]
+    report_df["Shipment Destination"] = "Laval,  France"
+    report_df["Last Location"] = "Blagnac"
+    report_df["Last Action"] = "El envío está en camino."
+    report_df["TNT Exception Notification"] = ""
+
+    return report_df[['Client Reference', 'Shipment Number', 'TNT Status',
+                      'Shipment Origin Date', 'Shipment Destination',
+                      'Processing Days', 'Last Update', 'Last Location',
+                      'Last Action', 'TNT Exception Notification']]
+
+# Example usage:
+# report_df = build_synthetic_final_report(1000)
+
+
+
+def benchmark_report_writers(n_rows=100_000, formats=("xlsx", "parquet", "csv")):
+    """
+    Compare DataFrame.to_excel with the report writers on a synthetic report.
+
+    The last row writes every format from the same frame on a background thread, and
+    reports how long the caller was blocked before it could continue.
+
+    Args:
+    - n_rows (int): Number of report rows.
+    - formats (tuple): Report formats to time one by one.
+
+    Returns:
+    - pd.DataFrame: Seconds, seconds the caller was blocked and MB on disk for each writer.
+    """
+    import os
+    import tempfile
+    import time
+    import pandas as pd
+    from functions_report_writers import write_report
+
+    report_df = build_synthetic_final_report(n_rows)
+
+    def file_megabytes(paths):
+        return round(sum(os.path.getsize(path) for path in paths) / 1024 / 1024, 2)
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        excel_path = os.path.join(work_dir, "pandas_default.xlsx")
+        start_time = time.perf_counter()
+        report_df.to_excel(excel_path, index=False)
+        elapsed_time = time.perf_counter() - start_time
+        results.append({"Writer": "DataFrame.to_excel", "Seconds": round(elapsed_time, 3),
+                        "Caller Blocked Seconds": round(elapsed_time, 3), "MB": file_megabytes([excel_path])})
+
+        for report_format in formats:
+            start_time = time.perf_counter()
+            report_write = write_report(report_df, work_dir, formats=(report_format,), basename=f"single_{report_format}")
+            elapsed_time = time.perf_counter() - start_time
+            results.append({"Writer": report_format, "Seconds": round(elapsed_time, 3),
+                            "Caller Blocked Seconds": round(elapsed_time, 3), "MB": file_megabytes(report_write.paths.values())})
+
+        start_time = time.perf_counter()
+        report_write = write_report(report_df, work_dir, formats=formats, background=True, basename="background")
+        blocked_time = time.perf_counter() - start_time
+        report_write.wait()
+        elapsed_time = time.perf_counter() - start_time
+        results.append({"Writer": " + ".join(formats) + " (background)", "Seconds": round(elapsed_time, 3),
+                        "Caller Blocked Seconds": round(blocked_time, 3), "MB": file_megabytes(report_write.paths.values())})
+
+    return pd.DataFrame(results)
+
+# Example usage:
+# benchmark_report_writers(n_rows=100_000)
+
+
+
+def benchmark_delta_report(n_rows=50_000, change_rate=0.05):
+    """
+    Time the delta report against a previous report of n_rows, read from Excel and from the Parquet sidecar.
+
+    The current report changes the status of change_rate of the shipments, drops as many
+    (resolved) and adds as many new ones.
+
+    Args:
+    - n_rows (int): Number of rows of the previous report.
+    - change_rate (float): Share of the shipments changed, dropped and added.
+
+    Returns:
+    - pd.DataFrame: Seconds of each step and the number of rows of each change type.
+    """
+    import os
+    import tempfile
+    import time
+    import numpy as np
+    import pandas as pd
+    from functions_delta_report import load_report, diff_reports
+    from functions_report_writers import write_report
+
+    previous_report = build_synthetic_final_report(n_rows)
+    step_count = int(n_rows * change_rate)
+
+    # Changed statuses, dropped (resolved) rows and new rows
+    current_report = previous_report.copy()
+    changed_positions = np.arange(0, step_count)
+    current_report.loc[changed_positions, "TNT Status"] = np.where(current_report.loc[changed_positions, "TNT Status"] == "Entregado",
+                                                                    "En entrega", "Entregado")
+    new_rows = build_synthetic_final_report(step_count, seed=1)
+    new_rows["Shipment Number"] = (700000000 + np.arange(step_count)).astype(str)
+    current_report = pd.concat([current_report.iloc[:n_rows - step_count], new_rows], ignore_index=True)
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        report_paths = write_report(previous_report, work_dir, formats=("xlsx", "parquet"), basename="previous").paths
+
+        for report_format, report_path in report_paths.items():
+            start_time = time.perf_counter()
+            previous_df = load_report(report_path)
+            results.append({"Step": f"load_report ({report_format})", "Seconds": round(time.perf_counter() - start_time, 3)})
+
+        start_time = time.perf_counter()
+        delta_df = diff_reports(current_report, previous_df)
+        results.append({"Step": "diff_reports", "Seconds": round(time.perf_counter() - start_time, 3)})
+
+    results = pd.DataFrame(results)
+    for change, count in delta_df["Change"].value_counts().items():
+        results[change] = count
+    return results
+
+# Example usage:
+# benchmark_delta_report(n_rows=50_000)
+
+
+
+def benchmark_shipment_analytics(n_rows=100_000):
+    """
+    Time the derivation of the plot analytics of a report, then the cached lookups of the plots.
+
+    Args:
+    - n_rows (int): Number of report rows.
+
+    Returns:
+    - pd.DataFrame: Seconds of the first derivation, of a cached lookup and of a derivation after a change.
+    """
+    import time
+    import pandas as pd
+    import functions_z_extra
+    from functions_z_extra import get_shipment_analytics
+
+    report_df = build_synthetic_final_report(n_rows)
+    functions_z_extra._ANALYTICS_CACHE.clear()
+
+    results = []
+    for step in ("first derivation", "cached lookup", "after a report change"):
+        if step == "after a report change":
+            report_df.loc[0, "TNT Status"] = "Entregado" if report_df.loc[0, "TNT Status"] != "Entregado" else "En entrega"
+        start_time = time.perf_counter()
+        get_shipment_analytics(report_df)
+        results.append({"Step": step, "Seconds": round(time.perf_counter() - start_time, 3)})
+
+    return pd.DataFrame(results)
+
+# Example usage:
+# benchmark_shipment_analytics(n_rows=100_000)
+
+
+
+def benchmark_report_memory(n_rows=100_000):
+    """
+    Compare the memory of the processed report as formatted strings (the previous representation) and typed.
+
+    Args:
+    - n_rows (int): Number of report rows.
+
+    Returns:
+    - pd.DataFrame: MB of each column and of the whole frame: formatted as object strings, formatted in the
+      default string dtype of the installed pandas (Arrow-backed from pandas 3), and typed.
+    """
+    import pandas as pd
+    from functions_process_df import to_typed_report
+
+    formatted_df = build_synthetic_final_report(n_rows)
+    formatted_df["TNT Exception Notification"] = " "
+    typed_df = to_typed_report(formatted_df)
+
+    frame_bytes = {
+        "Formatted MB": formatted_df.astype(object).memory_usage(deep=True, index=False),
+        "Formatted str MB": formatted_df.astype(str).memory_usage(deep=True, index=False),
+        "Typed MB": typed_df.memory_usage(deep=True, index=False),
+    }
+
+    results = pd.DataFrame({name: (column_bytes / 1024 / 1024).round(2) for name, column_bytes in frame_bytes.items()})
+    results["Typed dtype"] = typed_df.dtypes.astype(str)
+    results.loc["Total"] = [round(column_bytes.sum() / 1024 / 1024, 2) for column_bytes in frame_bytes.values()] + [""]
+    return results
+
+# Example usage:
+# benchmark_report_memory(n_rows=100_000)
+
+
+
+def benchmark_calculate_processing_days(n_rows=100_000):
+    """
+    Time calculate_processing_days, to_typed_report and format_report_for_export on synthetic rows.
+
+    Args:
+    - n_rows (int): Number of synthetic rows.
+
+    Returns:
+    - pd.DataFrame: Seconds and rows per second for each step.
+    """
+    import time
+    import pandas as pd
+    from functions_process_df import calculate_processing_days, to_typed_report, format_report_for_export
+
+    dataframe = build_synthetic_report_frame(n_rows)
+
+    results = []
+    for step in (calculate_processing_days, to_typed_report, format_report_for_export):
+        start_time = time.perf_counter()
+        dataframe = step(dataframe)
+        elapsed_time = time.perf_counter() - start_time
+        results.append({"Step": step.__name__, "Rows": n_rows, "Seconds": round(elapsed_time, 4),
+                        "Rows/s": round(n_rows / elapsed_time)})
+
+    return pd.DataFrame(results)
+
+# Example usage:
+# benchmark_calculate_processing_days(100_000)
+
+
+
+def build_synthetic_workbook(workbook_path, n_rows, seed=0):
+    """
+    Write a synthetic source workbook with the columns read by extract_and_create_urls.
+
+    Args:
+    - workbook_path (str): Path of the .xlsx file to write.
+    - n_rows (int): Number of rows (about two thirds are TNT shipments not DELIVERED).
+    - seed (int): Seed for the random values.
+
+    Returns:
+    - str: workbook_path.
+    """
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    pd.DataFrame({
+        "LOGIS ID": [f"DSD{120000 + i}" for i in range(n_rows)],
+        "Carrier": rng.choice(["TNT", "TNT", "DHL"], n_rows),
+        "T&T reference": 607200000 + np.arange(n_rows),
+        "Status": rng.choice(["IN TRANSIT", "EXCEPTION", "DELIVERED"], n_rows, p=[0.6, 0.2, 0.2]),
+        "Destination": rng.choice(["France", "Italy", "Portugal"], n_rows),
+        "Comments": [f"Comment {i}" for i in range(n_rows)],
+    }).to_excel(workbook_path, index=False)
+
+    return workbook_path
+
+# Example usage:
+# build_synthetic_workbook("/tmp/Testsinmacro.xlsx", 5000)
+
+
+
+def time_stage(stage_function, repeat=3):
+    """
+    Time a stage several times and keep the best run.
+
+    Args:
+    - stage_function (callable): Function without arguments running the stage once.
+    - repeat (int): Number of runs.
+
+    Returns:
+    - float: Seconds of the fastest run.
+    """
+    import time
+
+    best_time = float("inf")
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        stage_function()
+        best_time = min(best_time, time.perf_counter() - start_time)
+
+    return best_time
+
+# Example usage:
+# seconds = time_stage(lambda: scrape_shipment_data(all_shipment_divs))
+
+
+
+def run_benchmark_suite(output_path="benchmark_results.json", baseline_path=None, sizes=(500, 5000), repeat=3, tolerance=0.20):
+    """
+    Time every pipeline stage offline, on synthetic workbooks and tracking pages, and write the results as JSON.
+
+    Stages timed for each size (number of workbook rows):
+    - extract_and_create_urls, cold (Excel parse) and cached (on-disk cache hit).
+    - parse_search_results and scrape_shipment_data on the chunk pages of the open shipments.
+    - review_structure_scraped completeness check (all shipments found, no browser).
+    - global_df_transformation steps and the Excel write.
+
+    Args:
+    - output_path (str): JSON file for the results.
+    - baseline_path (str, optional): Previous results JSON to compare with.
+    - sizes (tuple): Workbook sizes (rows).
+    - repeat (int): Runs per stage; the fastest is kept.
+    - tolerance (float): Relative slowdown over the baseline reported as a regression.
+
+    Returns:
+    - pd.DataFrame: One row per stage and size (with the baseline comparison if baseline_path is given).
+    """
+    import json
+    import os
+    import platform
+    import tempfile
+    from datetime import datetime
+    import pandas as pd
+    import functions_extract
+    from functions_extract import extract_and_create_urls, create_chunked_urls
+    from functions_parsing import parse_search_results
+    from functions_web_scraping import scrape_shipment_data, review_structure_scraped
+    from functions_process_df import (
+        convert_shipment_origin_date, process_last_update_column,
+        calculate_processing_days, to_typed_report, format_report_for_export,
+        rearrange_columns_and_save_to_excel
+        )
+
+    results = []
+
+    def record(stage, size, items, seconds):
+        results.append({"stage": stage, "size": size, "items": items, "seconds": round(seconds, 5),
+                        "items_per_second": round(items / seconds, 1) if seconds > 0 else None})
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in sizes:
+            workbook_path = build_synthetic_workbook(os.path.join(work_dir, f"workbook_{size}.xlsx"), size)
+            cache_dir = os.path.join(work_dir, f"cache_{size}")
+
+            # Stage 1: Excel extraction, cold then from the on-disk cache
+            def extract_cold():
+                functions_extract._SOURCE_FRAME_CACHE.clear()
+                for cache_file in os.listdir(cache_dir) if os.path.isdir(cache_dir) else []:
+                    os.remove(os.path.join(cache_dir, cache_file))
+                return extract_and_create_urls(workbook_path, cache_dir=cache_dir)
+
+            def extract_cached():
+                functions_extract._SOURCE_FRAME_CACHE.clear()
+                return extract_and_create_urls(workbook_path, cache_dir=cache_dir)
+
+            record("extract_and_create_urls (cold)", size, size, time_stage(extract_cold, repeat))
+            record("extract_and_create_urls (cached)", size, size, time_stage(extract_cached, repeat))
+            url_list, unique_references = extract_cached()
+
+            # Stage 2: parsing the chunk pages of the open shipments
+            references = sorted(map(str, unique_references))
+            pages = [build_tracking_page_html(references[i:i + 30]) for i in range(0, len(references), 30)]
+            all_shipment_divs = [div for page_source in pages for div in parse_search_results(page_source)]
+
+            record("parse_search_results", size, len(pages),
+                   time_stage(lambda: [parse_search_results(page_source) for page_source in pages], repeat))
+            record("scrape_shipment_data", size, len(references),
+                   time_stage(lambda: scrape_shipment_data(all_shipment_divs), repeat))
+
+            # Stage 3: completeness check (every shipment found, so no browser is opened)
+            record("review_structure_scraped", size, len(references),
+                   time_stage(lambda: review_structure_scraped(unique_references, all_shipment_divs, create_chunked_urls(references), None), repeat))
+
+            # Stage 4: DataFrame transformation to the typed report, export formatting and Excel write
+            df = scrape_shipment_data(all_shipment_divs)
+
+            def transform():
+                dataframe = df.copy()
+                dataframe = convert_shipment_origin_date(dataframe)
+                dataframe = process_last_update_column(dataframe)
+                dataframe = calculate_processing_days(dataframe)
+                return to_typed_report(dataframe)
+
+            record("global_df_transformation", size, len(df), time_stage(transform, repeat))
+            processed_df = transform()
+            record("format_report_for_export", size, len(df), time_stage(lambda: format_report_for_export(processed_df), repeat))
+            # The typed frame is formatted by the writer, as in the pipeline
+            record("excel write", size, len(df),
+                   time_stage(lambda: rearrange_columns_and_save_to_excel(processed_df, work_dir), repeat))
+
+    results = pd.DataFrame(results)
+
+    with open(output_path, "w") as output_file:
+        json.dump({
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "environment": {"python": platform.python_version(), "pandas": pd.__version__, "machine": platform.machine()},
+            "results": results.to_dict(orient="records"),
+        }, output_file, indent=2)
+
+    if baseline_path is not None:
+        results = compare_with_baseline(results, baseline_path, tolerance=tolerance)
+
+    return results
+
+# Example usage:
+# run_benchmark_suite("benchmark_results.json")
+# run_benchmark_suite("benchmark_results_new.json", baseline_path="benchmark_results.json")
+
+
+
+def compare_with_baseline(results, baseline_path, tolerance=0.20):
+    """
+    Compare benchmark results with a previous results JSON.
+
+    Args:
+    - results (pd.DataFrame): Results of run_benchmark_suite.
+    - baseline_path (str): Previous results JSON written by run_benchmark_suite.
+    - tolerance (float): Relative slowdown reported as a regression (0.20 = 20% slower).
+
+    Returns:
+    - pd.DataFrame: results with the baseline seconds, the change in % and a regression flag.
+    """
+    import json
+    import pandas as pd
+
+    with open(baseline_path) as baseline_file:
+        baseline = pd.DataFrame(json.load(baseline_file)["results"])
+
+    comparison = results.merge(baseline[["stage", "size", "seconds"]].rename(columns={"seconds": "baseline_seconds"}),
+                               on=["stage", "size"], how="left")
+    comparison["change_pct"] = ((comparison["seconds"] / comparison["baseline_seconds"] - 1) * 100).round(1)
+    comparison["regression"] = comparison["seconds"] > comparison["baseline_seconds"] * (1 + tolerance)
+
+    return comparison
+
+# Example usage:
+# compare_with_baseline(results, "benchmark_results.json")
+
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Offline benchmark of every TNT Shipment Tracker stage.")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file for the results.")
+    parser.add_argument("--baseline", default=None, help="Previous results JSON to compare with.")
+    parser.add_argument("--sizes", default="500,5000", help="Comma-separated workbook sizes (rows).")
+    parser.add_argument("--tolerance", type=float, default=0.20, help="Relative slowdown reported as a regression.")
+    args = parser.parse_args()
+
+    suite_results = run_benchmark_suite(args.output, baseline_path=args.baseline,
+                                        sizes=tuple(int(size) for size in args.sizes.split(",")), tolerance=args.tolerance)
+    print(suite_results.to_string(index=False))
+
+    if args.baseline is not None and suite_results["regression"].any():
+        raise SystemExit(1)
@@ -0,0 +1,150 @@
+"""
+
+Command line entry point of the tracker, for cron jobs and containers:
+
+    python functions_cli.py "Shipment_Data/shipments.xlsx" --chromedriver /usr/bin/chromedriver --workers 4
+
+Only this module and the small functions_* modules are loaded at startup, pandas,
+Selenium and BeautifulSoup are imported by the stage that needs them, and IPython
+is never required.
+
+Functions:
+- parse_arguments
+- main
+
+"""
+
+import time
+
+# Set when the module is loaded, to report the startup time of the command
+_STARTED_AT = time.perf_counter()
+
+
+
+def parse_arguments(argv=None):
+    """
+    Parse the command line arguments of the tracker.
+
+    Args:
+    - argv (list, optional): Arguments without the program name. Defaults to sys.argv[1:].
+
+    Returns:
+    - argparse.Namespace: Parsed arguments.
+    """
+    import argparse
+    from functions_http_backend import HTTP_BACKEND_VERIFIED
+    from functions_routing import ClientReferenceRouter, parse_route_specs
+
+    parser = argparse.ArgumentParser(description="Track the open TNT shipments of an Excel file and save the TNT Track Report.")
+    parser.add_argument("excel_file", help="Excel file with the Carrier, Status and T&T reference columns.")
+    parser.add_argument("--chromedriver", help="Path to the ChromeDriver executable (selenium backend).")
+    parser.add_argument("--output-folder", default="./TNT Track Reports", help="Folder where the report is saved.")
+    parser.add_argument("--report-format", action="append", choices=("xlsx", "parquet", "csv"),
+                        help="Report format, repeat for several (default: xlsx).")
+    parser.add_argument("--delta-report", action="store_true", help="Also write the changes since the previous report of the output folder.")
+    parser.add_argument("--event-store", help="Folder of the shipment event store (full tracking history, Parquet).")
+    parser.add_argument("--route", action="append", metavar="PREFIX=REPORT",
+                        help="Route the shipments whose client reference starts with PREFIX to their own report, repeat for "
+                             "each team (e.g. --route DSD/=dsd --route ACM/=acme). Other shipments go to 'unrouted'.")
+    # 'http' is only offered once its API schema is verified (see functions_http_backend)
+    parser.add_argument("--backend", choices=("selenium", "http") if HTTP_BACKEND_VERIFIED else ("selenium",), default="selenium",
+                        help="Fetch backend.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of browser workers.")
+    parser.add_argument("--min-request-interval", type=float, default=0.0, help="Minimum seconds between two page loads of a worker.")
+    parser.add_argument("--lean-browser", action="store_true", help="Scrape with the lean Chrome profile (no images, fonts, stylesheets or trackers).")
+    parser.add_argument("--parser", choices=("html.parser", "lxml"), default="html.parser", help="BeautifulSoup parser backend.")
+    parser.add_argument("--parse-processes", type=int, help="Processes parsing the raw pages (default: number of CPUs).")
+    parser.add_argument("--state-store", help="SQLite state store, so reruns skip the final shipments.")
+    parser.add_argument("--metrics-dir", help="Folder for the JSON run log and the Prometheus textfile.")
+    parser.add_argument("--reporter", choices=("terminal", "logging", "notebook"), default="terminal", help="Where progress messages go.")
+    parser.add_argument("--page-cache", help="Folder of the raw page cache (selenium backend).")
+    parser.add_argument("--page-cache-ttl", type=float, default=6 * 60 * 60, help="Seconds a cached page is reused.")
+    parser.add_argument("--replay", action="store_true", help="Rebuild the report from the cached pages, without a browser.")
+    parser.add_argument("--daemon", action="store_true", help="Keep running and poll each open shipment on its own schedule (needs --state-store; "
+                                                              "honors --backend, --chromedriver, --parser, --lean-browser, --min-request-interval and --metrics-dir).")
+    parser.add_argument("--max-requests-per-hour", type=int, default=120, help="Global budget of chunk requests per hour in daemon mode.")
+    parser.add_argument("--log-level", default="INFO", help="Logging level with --reporter logging.")
+
+    arguments = parser.parse_args(argv)
+    if arguments.backend == "selenium" and not arguments.chromedriver and not arguments.replay:
+        parser.error("--chromedriver is required with the selenium backend.")
+    if arguments.daemon and not arguments.state_store:
+        parser.error("--state-store is required with --daemon, it keeps the poll queue.")
+    if arguments.daemon:
+        # The daemon polls one chunk at a time into the state store, and writes no report
+        daemon_unsupported = [flag for flag, is_set in (
+            ("--workers", arguments.workers != 1), ("--parse-processes", arguments.parse_processes is not None),
+            ("--page-cache", arguments.page_cache is not None), ("--replay", arguments.replay),
+            ("--report-format", arguments.report_format is not None), ("--delta-report", arguments.delta_report),
+            ("--event-store", arguments.event_store is not None), ("--route", arguments.route is not None),
+        ) if is_set]
+        if daemon_unsupported:
+            parser.error(f"{', '.join(daemon_unsupported)} cannot be used with --daemon, it polls one chunk at a time "
+                         f"into the state store and writes no report.")
+
+    # Routes are checked here so a bad --route is a usage error; report names become subfolder names
+    arguments.routes = None
+    if arguments.route:
+        try:
+            arguments.routes = ClientReferenceRouter(parse_route_specs(arguments.route)).routes
+        except ValueError as error:
+            parser.error(f"--route: {error}")
+    return arguments
+
+# Example usage:
+# arguments = parse_arguments(["shipments.xlsx", "--chromedriver", "/usr/bin/chromedriver", "--workers", "4"])
+
+
+
+def main(argv=None):
+    """
+    Run the tracker from the command line.
+
+    Args:
+    - argv (list, optional): Arguments without the program name. Defaults to sys.argv[1:].
+
+    Returns:
+    - int: Exit code (0 when the report was saved).
+    """
+    import logging
+    import os
+    from functions_reporting import report, set_reporter
+    from functions_final_code import tnt_shipment_tracker
+    from functions_polling import run_polling_daemon
+
+    arguments = parse_arguments(argv)
+
+    if arguments.reporter == "logging":
+        logging.basicConfig(level=arguments.log_level.upper(), format="%(asctime)s %(levelname)s %(message)s")
+    set_reporter(arguments.reporter)
+    os.makedirs(arguments.output_folder, exist_ok=True)
+
+    # Module loading and argument parsing, before the first stage imports anything heavy
+    report(f"--> Startup time: **{time.perf_counter() - _STARTED_AT:.3f} seconds**")
+
+    if arguments.daemon:
+        run_polling_daemon(arguments.excel_file, arguments.state_store, chromedriver_path=arguments.chromedriver,
+                           fetch_backend=arguments.backend, html_parser=arguments.parser,
+                           max_requests_per_hour=arguments.max_requests_per_hour, lean_browser=arguments.lean_browser,
+                           min_request_interval=arguments.min_request_interval, metrics_dir=arguments.metrics_dir)
+        return 0
+
+    tnt_shipment_tracker(arguments.excel_file, arguments.chromedriver, arguments.output_folder,
+                         max_workers=arguments.workers, min_request_interval=arguments.min_request_interval,
+                         fetch_backend=arguments.backend, html_parser=arguments.parser,
+                         state_store_path=arguments.state_store, metrics_dir=arguments.metrics_dir,
+                         lean_browser=arguments.lean_browser, page_cache_dir=arguments.page_cache,
+                         page_cache_ttl=arguments.page_cache_ttl, replay=arguments.replay,
+                         parse_processes=arguments.parse_processes, report_formats=tuple(arguments.report_format or ("xlsx",)),
+                         delta_report=arguments.delta_report, event_store_dir=arguments.event_store,
+                         report_routes=arguments.routes)
+    return 0
+
+# Example usage:
+# main(["Shipment_Data/shipments.xlsx", "--chromedriver", "/usr/bin/chromedriver", "--state-store", "Shipment_Data/tnt_state.sqlite"])
+
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
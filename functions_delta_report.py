@@ -0,0 +1,227 @@
+"""
+
+Delta report: the new TNT Track Report is compared with the latest previous one, indexed by
+Shipment Number, and only the new, changed, resolved and stale shipments are written to a
+compact "TNT Track Changes <date time>" report next to the full one.
+
+Functions:
+- find_previous_report
+- load_report
+- diff_reports
+- write_delta_report
+
+"""
+
+
+# Report file names written by rearrange_columns_and_save_to_excel, and the date format of their timestamp
+REPORT_FILENAME_PATTERN = r"^TNT Track Report (\d{2}-\d{2}-\d{4} \d{2}_\d{2}_\d{2})\.(parquet|csv|xlsx)$"
+REPORT_TIMESTAMP_FORMAT = "%d-%m-%Y %H_%M_%S"
+
+# Formats a previous report is read from, fastest first (the Parquet file is the columnar sidecar)
+REPORT_READ_ORDER = ("parquet", "csv", "xlsx")
+
+# Columns compared between two runs
+DELTA_COLUMNS = ["TNT Status", "Last Update", "Last Location", "TNT Exception Notification"]
+
+# Unchanged shipments whose last TNT event is older than this are reported as stale
+STALE_AFTER_DAYS = 7
+
+
+
+def find_previous_report(folder, current_report_path=None):
+    """
+    Find the latest report saved in the folder before the current one.
+
+    Args:
+    - folder (str): Folder of the TNT Track Reports.
+    - current_report_path (str, optional): Path of the report just written, excluded with every later report.
+
+    Returns:
+    - str: Path of the previous report, in its fastest format (Parquet sidecar, then CSV, then Excel), or None.
+    """
+    import os
+    import re
+    from datetime import datetime
+
+    current_timestamp = None
+    if current_report_path is not None:
+        current_match = re.match(REPORT_FILENAME_PATTERN, os.path.basename(current_report_path))
+        if current_match:
+            current_timestamp = datetime.strptime(current_match.group(1), REPORT_TIMESTAMP_FORMAT)
+
+    # Report formats available for each timestamp
+    reports = {}
+    for filename in os.listdir(folder) if os.path.isdir(folder) else []:
+        filename_match = re.match(REPORT_FILENAME_PATTERN, filename)
+        if filename_match is None:
+            continue
+        timestamp = datetime.strptime(filename_match.group(1), REPORT_TIMESTAMP_FORMAT)
+        if current_timestamp is not None and timestamp >= current_timestamp:
+            continue
+        reports.setdefault(timestamp, {})[filename_match.group(2)] = os.path.join(folder, filename)
+
+    if not reports:
+        return None
+
+    latest_formats = reports[max(reports)]
+    return next(latest_formats[report_format] for report_format in REPORT_READ_ORDER if report_format in latest_formats)
+
+# Example usage:
+# previous_report_path = find_previous_report("./TNT Track Reports", excel_file_path)
+
+
+
+def load_report(report_path):
+    """
+    Load a saved report into a frame indexed by Shipment Number.
+
+    Args:
+    - report_path (str): Path of a .parquet, .csv or .xlsx report.
+
+    Returns:
+    - pd.DataFrame: Typed report columns (see to_typed_report) indexed by Shipment Number (str), one row per shipment.
+    """
+    import pandas as pd
+    from functions_process_df import to_typed_report
+
+    if report_path.endswith(".parquet"):
+        report_df = pd.read_parquet(report_path)
+    elif report_path.endswith(".csv"):
+        report_df = pd.read_csv(report_path, dtype={"Shipment Number": str}, encoding="utf-8-sig", keep_default_na=False)
+    else:
+        report_df = pd.read_excel(report_path, dtype={"Shipment Number": str}, keep_default_na=False)
+
+    # Reports of earlier versions hold formatted strings, newer Parquet files the typed columns
+    report_df = to_typed_report(report_df)
+    return report_df.drop_duplicates("Shipment Number", keep="last").set_index("Shipment Number")
+
+# Example usage:
+# previous_df = load_report(find_previous_report("./TNT Track Reports"))
+
+
+
+def diff_reports(current_df, previous_df, stale_after_days=STALE_AFTER_DAYS, now=None):
+    """
+    Compare the current report with the previous one, shipment by shipment, in one vectorized pass.
+
+    - New: shipment not in the previous report.
+    - Changed: status, last update, last location or exception flag differ.
+    - Resolved: shipment of the previous report no longer in the current one (closed in the source file).
+    - Stale: unchanged, and the last TNT event is older than stale_after_days.
+
+    Args:
+    - current_df (pd.DataFrame): Report of this run (global_df_transformation output).
+    - previous_df (pd.DataFrame): Previous report, indexed by Shipment Number (load_report output).
+    - stale_after_days (int): Days without a new TNT event after which an unchanged shipment is stale.
+    - now (pd.Timestamp, optional): Reference time for the stale check. Defaults to now.
+
+    Returns:
+    - pd.DataFrame: One row per new, changed, resolved or stale shipment, with a "Change" column, the changed
+      fields, the current columns and the previous value of each compared column.
+    """
+    import numpy as np
+    import pandas as pd
+    from functions_process_df import to_typed_report
+
+    now = pd.Timestamp.now() if now is None else now
+
+    # Both sides typed, so values compare the same whichever format the previous report was read from
+    current = to_typed_report(current_df)
+    current = current.drop_duplicates("Shipment Number", keep="last").set_index("Shipment Number")
+
+    # Aligned on the union of both indexes, so every comparison below is one column operation
+    all_numbers = current.index.union(previous_df.index, sort=False)
+    in_current = current.index.get_indexer(all_numbers) >= 0
+    in_previous = previous_df.index.get_indexer(all_numbers) >= 0
+    current_values = current.reindex(all_numbers, columns=DELTA_COLUMNS)
+    previous_values = previous_df.reindex(all_numbers, columns=DELTA_COLUMNS)
+
+    # Blank and missing values are the same state (no location)
+    current_text = current_values.astype(object).where(current_values.notna(), "").astype(str)
+    previous_text = previous_values.astype(object).where(previous_values.notna(), "").astype(str)
+    changed_fields = current_text.ne(previous_text)
+
+    changed = changed_fields.any(axis=1).to_numpy() & in_current & in_previous
+    last_update = current_values["Last Update"]
+    stale = (in_current & in_previous & ~changed
+             & (now - last_update > pd.Timedelta(days=stale_after_days)).to_numpy())
+
+    change = np.select([~in_previous, ~in_current, changed, stale], ["New", "Resolved", "Changed", "Stale"], default="")
+    keep = change != ""
+
+    # Resolved shipments only have their previous row (categories of both sides are merged by concat)
+    kept_numbers = all_numbers[keep]
+    resolved = ~in_current[keep]
+    rows = pd.concat([current.reindex(kept_numbers[~resolved]),
+                      previous_df.reindex(kept_numbers[resolved], columns=current.columns)]).reindex(kept_numbers)
+    rows.index.name = "Shipment Number"
+
+    # "TNT Status, Last Location" for each changed row
+    field_names = np.array([f"{column}, " for column in DELTA_COLUMNS], dtype=object)
+    changed_names = changed_fields[keep].to_numpy().dot(field_names) if keep.any() else np.array([], dtype=object)
+
+    delta_df = rows.reset_index()[list(current_df.columns)]
+    delta_df.insert(0, "Change", change[keep])
+    delta_df.insert(1, "Changed Fields", np.where(change[keep] == "Changed", pd.Series(changed_names, dtype=object).str.rstrip(", "), ""))
+    for column in DELTA_COLUMNS:
+        delta_df[f"Previous {column}"] = previous_values[column].iloc[keep].reset_index(drop=True)
+
+    # New, changed, resolved then stale, each in report order
+    change_order = pd.Categorical(delta_df["Change"], categories=["New", "Changed", "Resolved", "Stale"], ordered=True)
+    return delta_df.iloc[np.argsort(change_order.codes, kind="stable")].reset_index(drop=True)
+
+# Example usage:
+# delta_df = diff_reports(processed_df, load_report(previous_report_path))
+
+
+
+def write_delta_report(current_df, folder, current_report_path=None, stale_after_days=STALE_AFTER_DAYS, formats=("xlsx",), background=False):
+    """
+    Write the "changes since last run" report next to the full report.
+
+    The previous report is read and compared in the calling thread, so the change counts are
+    known on return; with background, only the delta files are written on a background thread.
+
+    Args:
+    - current_df (pd.DataFrame): Report of this run (global_df_transformation output).
+    - folder (str): Folder of the TNT Track Reports.
+    - current_report_path (str, optional): Path of the report just written; its timestamp names the delta report.
+    - stale_after_days (int): Days without a new TNT event after which an unchanged shipment is stale.
+    - formats (tuple): Formats of the delta report ("xlsx", "parquet", "csv").
+    - background (bool): Write the delta files on a background thread and return at once.
+
+    Returns:
+    - pd.DataFrame: Delta rows (diff_reports output), or None if there is no previous report.
+    - str: Path of the previous report compared with, or None.
+    - ReportWriteHandle: Handle of the delta files (already written unless background), or None.
+    """
+    import os
+    import re
+    from datetime import datetime
+    from functions_reporting import report
+    from functions_report_writers import write_report
+    from functions_process_df import format_report_for_export
+
+    previous_report_path = find_previous_report(folder, current_report_path)
+    if previous_report_path is None:
+        report("--> No previous report to compare with, changes report skipped.")
+        return None, None, None
+
+    delta_df = diff_reports(current_df, load_report(previous_report_path), stale_after_days=stale_after_days)
+
+    # Same timestamp as the full report, under a name the previous-report search ignores
+    current_match = re.match(REPORT_FILENAME_PATTERN, os.path.basename(current_report_path or ""))
+    timestamp = current_match.group(1) if current_match else datetime.now().strftime(REPORT_TIMESTAMP_FORMAT)
+    report_write = write_report(delta_df, folder, formats=formats, background=background, basename=f"TNT Track Changes {timestamp}",
+                                export_formatter=format_report_for_export)
+
+    change_counts = delta_df["Change"].value_counts()
+    report(f"--> Changes since {os.path.basename(previous_report_path)}: "
+           + ", ".join(f"**{change_counts.get(change, 0)} {change.lower()}**" for change in ["New", "Changed", "Resolved", "Stale"])
+           + f". {'Writing in the background' if background else 'Saved'} at: {next(iter(report_write.paths.values()))}")
+
+    return delta_df, previous_report_path, report_write
+
+# Example usage:
+# delta_df, previous_report_path, _ = write_delta_report(processed_df, folder_save_to_excel_path, excel_file_path)
+# delta_df, previous_report_path, delta_write = write_delta_report(processed_df, folder_save_to_excel_path, excel_file_path, background=True)
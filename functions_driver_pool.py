@@ -0,0 +1,215 @@
+"""
+
+Classes:
+- ChromeDriverPool
+
+"""
+
+
+# Requests blocked by the lean profile: images, fonts, stylesheets and third-party trackers / cookie banners
+LEAN_BLOCKED_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.css",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*facebook.net*",
+    "*hotjar.com*", "*cookielaw.org*", "*onetrust.com*", "*adobedtm.com*", "*demdex.net*",
+]
+
+
+class ChromeDriverPool:
+    """
+    Pool of warm headless Chrome sessions shared by every chunk URL of a run.
+
+    Sessions are launched on demand, handed back to the pool after each page and reused
+    for the next URL. A session is recycled (quit and replaced) after `max_pages_per_driver`
+    pages, when its health check fails, or when a page load crashes.
+
+    Args:
+    - chromedriver_path (str): Path to the ChromeDriver executable.
+    - max_pages_per_driver (int): Number of pages a session loads before it is recycled.
+    - driver_factory (callable, optional): Function returning a new WebDriver. Defaults to headless Chrome.
+    - page_deadline (AdaptiveDeadline, optional): Readiness deadline shared by the sessions of the pool. Defaults to a new AdaptiveDeadline.
+    - lean_profile (bool): Launch Chrome with the lean scraping profile (blocked resources, eager page load, no GPU or extensions).
+      Off by default: the sessions load the tracking page as the plain headless Chrome did.
+    - page_cache (RawPageCache, optional): Cache of raw pages checked before a session is used, and filled after each load.
+    """
+
+    def __init__(self, chromedriver_path, max_pages_per_driver=50, driver_factory=None, page_deadline=None, lean_profile=False, page_cache=None):
+        import threading
+        from functions_page_readiness import AdaptiveDeadline
+
+        self.chromedriver_path = chromedriver_path
+        self.lean_profile = lean_profile
+        self.max_pages_per_driver = max_pages_per_driver
+        self.driver_factory = driver_factory if driver_factory is not None else self._launch_chrome
+
+        # Page latencies of the run, for the readiness waits of every session
+        self.page_deadline = page_deadline if page_deadline is not None else AdaptiveDeadline()
+        self.page_cache = page_cache
+
+        # Idle sessions as [driver, pages_loaded] pairs
+        self._idle_sessions = []
+        self._lock = threading.Lock()
+
+        # Counters reported at the end of the run
+        self.launched = 0
+        self.reused = 0
+        self.recycled = 0
+        self.crashed = 0
+
+    def _launch_chrome(self):
+        """
+        Launch a new headless Chrome session, with the lean profile if enabled.
+
+        Returns:
+        - WebDriver: New Chrome session.
+        """
+        from selenium import webdriver
+
+        # Set up ChromeOptions for headless mode
+        chrome_options = webdriver.ChromeOptions()
+        chrome_options.add_argument('--headless')
+
+        if self.lean_profile:
+            # Return from get() once the DOM is parsed, the readiness wait covers the rendering
+            chrome_options.page_load_strategy = 'eager'
+            chrome_options.add_argument('--disable-gpu')
+            chrome_options.add_argument('--disable-extensions')
+            chrome_options.add_argument('--blink-settings=imagesEnabled=false')
+            chrome_options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+
+        # Set up ChromeDriver
+        chrome_service = webdriver.ChromeService(executable_path=self.chromedriver_path)
+        driver = webdriver.Chrome(service=chrome_service, options=chrome_options)
+
+        if self.lean_profile:
+            # Fonts, stylesheets and trackers can only be blocked at the network level
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': LEAN_BLOCKED_URL_PATTERNS})
+
+        return driver
+
+    @staticmethod
+    def _is_healthy(driver):
+        """
+        Check that a session still answers commands.
+
+        Args:
+        - driver (WebDriver): Session to check.
+
+        Returns:
+        - bool: True if the session is alive.
+        """
+        try:
+            driver.current_url
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _quit(driver):
+        """
+        Quit a session, ignoring errors from sessions that already died.
+
+        Args:
+        - driver (WebDriver): Session to quit.
+
+        Returns:
+        - None
+        """
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """
+        Take a healthy session from the pool, launching a new one if none is idle.
+
+        Returns:
+        - list: [driver, pages_loaded] session to be passed back to `release`.
+        """
+        while True:
+            with self._lock:
+                session = self._idle_sessions.pop() if self._idle_sessions else None
+
+            if session is None:
+                break
+
+            if self._is_healthy(session[0]):
+                with self._lock:
+                    self.reused += 1
+                return session
+
+            # Dead session: replace it
+            self._quit(session[0])
+            with self._lock:
+                self.recycled += 1
+
+        driver = self.driver_factory()
+        with self._lock:
+            self.launched += 1
+        return [driver, 0]
+
+    def release(self, session, crashed=False):
+        """
+        Return a session to the pool after one page, recycling it if needed.
+
+        Args:
+        - session (list): Session returned by `acquire`.
+        - crashed (bool): True if the page load failed with this session.
+
+        Returns:
+        - None
+        """
+        session[1] += 1
+
+        if crashed or session[1] >= self.max_pages_per_driver:
+            self._quit(session[0])
+            with self._lock:
+                self.recycled += 1
+                if crashed:
+                    self.crashed += 1
+            return
+
+        with self._lock:
+            self._idle_sessions.append(session)
+
+    def stats(self):
+        """
+        Report how sessions were used during the run.
+
+        Returns:
+        - dict: Number of sessions launched, reused, recycled and crashed.
+        """
+        with self._lock:
+            return {
+                "launched": self.launched,
+                "reused": self.reused,
+                "recycled": self.recycled,
+                "crashed": self.crashed,
+            }
+
+    def close(self):
+        """
+        Quit every idle session.
+
+        Returns:
+        - None
+        """
+        with self._lock:
+            idle_sessions, self._idle_sessions = self._idle_sessions, []
+
+        for driver, _ in idle_sessions:
+            self._quit(driver)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+# Example usage:
+# with ChromeDriverPool(chromedriver_path) as driver_pool:
+#     all_shipment_divs = scrape_structure_from_urls(url_list, chromedriver_path, driver_pool=driver_pool)
+#     print(driver_pool.stats())
@@ -0,0 +1,204 @@
+"""
+
+On-disk store of the full shipment history: every event of the tracking history table,
+in Parquet files partitioned by event date (date=YYYY-MM-DD/events.parquet) and
+deduplicated across runs on Shipment Number, Event Time and Action, so dwell times and
+hub transit times can be analysed without scraping again.
+
+Functions:
+- events_to_dataframe
+- append_events
+- read_events
+- summarize_hub_dwell_times
+- summarize_hub_transit_times
+
+"""
+
+
+# Default folder of the event store, next to the shipment data
+EVENT_STORE_DIR = "Shipment_Data/events"
+
+# Columns of the event tuples (extract_shipment_events) and of the stored events
+EVENT_COLUMNS = ["Shipment Number", "Client Reference", "Event Time", "Location", "Action"]
+
+# An event seen again in a later run has the same key
+EVENT_KEY = ["Shipment Number", "Event Time", "Action"]
+
+
+
+def events_to_dataframe(events, seen_at=None):
+    """
+    Build the event frame from the event tuples of a run.
+
+    Event times are parsed from the page format ("20/10/23 8:55"); events without a
+    valid time cannot be partitioned and are dropped.
+
+    Args:
+    - events (list): Event tuples (extract_shipment_events / map_consignment_to_events output).
+    - seen_at (pd.Timestamp, optional): Time of the run that saw the events. Defaults to now.
+
+    Returns:
+    - pd.DataFrame: One row per distinct event, with EVENT_COLUMNS and "First Seen".
+    """
+    import pandas as pd
+
+    events_df = pd.DataFrame(events, columns=EVENT_COLUMNS)
+    events_df["Event Time"] = pd.to_datetime(events_df["Event Time"], format="%d/%m/%y %H:%M", errors="coerce")
+    for column in ("Shipment Number", "Client Reference", "Location", "Action"):
+        events_df[column] = events_df[column].fillna("").astype(str).str.strip()
+    events_df["First Seen"] = pd.Timestamp.now().floor("s") if seen_at is None else seen_at
+
+    return events_df.dropna(subset=["Event Time"]).drop_duplicates(EVENT_KEY).reset_index(drop=True)
+
+# Example usage:
+# events_df = events_to_dataframe(collector.events)
+
+
+
+def append_events(events, store_dir=EVENT_STORE_DIR, seen_at=None):
+    """
+    Merge the events of a run into the store, keeping only the events not stored yet.
+
+    An event always falls in the partition of its own date, so deduplication only reads the
+    partitions the run touches. Each changed partition is rewritten next to its target and
+    renamed, so readers never see a partial file. One writer at a time.
+
+    Args:
+    - events (list or pd.DataFrame): Event tuples, or the events_to_dataframe frame.
+    - store_dir (str): Folder of the event store.
+    - seen_at (pd.Timestamp, optional): Time of the run, kept as "First Seen" of the new events. Defaults to now.
+
+    Returns:
+    - int: Number of events added to the store.
+    """
+    import os
+    import pandas as pd
+
+    events_df = events if isinstance(events, pd.DataFrame) else events_to_dataframe(events, seen_at=seen_at)
+
+    new_event_count = 0
+    for event_date, day_events in events_df.groupby(events_df["Event Time"].dt.strftime("%Y-%m-%d")):
+        partition_dir = os.path.join(store_dir, f"date={event_date}")
+        partition_path = os.path.join(partition_dir, "events.parquet")
+
+        stored_count = 0
+        if os.path.exists(partition_path):
+            stored_events = pd.read_parquet(partition_path)
+            stored_count = len(stored_events)
+            # Stored rows first, so an event seen again keeps its first "First Seen"
+            day_events = pd.concat([stored_events, day_events], ignore_index=True).drop_duplicates(EVENT_KEY)
+
+        if len(day_events) == stored_count:
+            continue
+
+        os.makedirs(partition_dir, exist_ok=True)
+        temporary_path = os.path.join(partition_dir, f"events.{os.getpid()}.tmp.parquet")
+        day_events.sort_values(["Shipment Number", "Event Time"]).to_parquet(temporary_path, index=False)
+        os.replace(temporary_path, partition_path)
+        new_event_count += len(day_events) - stored_count
+
+    return new_event_count
+
+# Example usage:
+# new_event_count = append_events(collector.events, "Shipment_Data/events")
+
+
+
+def read_events(store_dir=EVENT_STORE_DIR, start_date=None, end_date=None):
+    """
+    Read the stored events, optionally only the partitions of a date range.
+
+    Args:
+    - store_dir (str): Folder of the event store.
+    - start_date (str, optional): First event date read (YYYY-MM-DD).
+    - end_date (str, optional): Last event date read (YYYY-MM-DD).
+
+    Returns:
+    - pd.DataFrame: Stored events sorted by Shipment Number and Event Time.
+    """
+    import os
+    import pandas as pd
+
+    partition_paths = []
+    for partition_name in sorted(os.listdir(store_dir)) if os.path.isdir(store_dir) else []:
+        if not partition_name.startswith("date="):
+            continue
+        # ISO dates compare as strings
+        event_date = partition_name[len("date="):]
+        if (start_date is not None and event_date < start_date) or (end_date is not None and event_date > end_date):
+            continue
+        partition_paths.append(os.path.join(store_dir, partition_name, "events.parquet"))
+
+    if not partition_paths:
+        return pd.DataFrame(columns=EVENT_COLUMNS + ["First Seen"])
+
+    events_df = pd.concat([pd.read_parquet(path) for path in partition_paths], ignore_index=True)
+    return events_df.sort_values(["Shipment Number", "Event Time"]).reset_index(drop=True)
+
+# Example usage:
+# events_df = read_events("Shipment_Data/events", start_date="2023-10-01")
+
+
+
+def summarize_hub_dwell_times(events_df):
+    """
+    Time shipments spend at each hub: from an event at a location to the next event of the same shipment.
+
+    Args:
+    - events_df (pd.DataFrame): Stored events (read_events output).
+
+    Returns:
+    - pd.DataFrame: Per location, the number of events and shipments and the median, mean and 90th percentile dwell hours.
+    """
+    events_df = events_df.sort_values(["Shipment Number", "Event Time"])
+    next_event_time = events_df.groupby("Shipment Number")["Event Time"].shift(-1)
+    dwell_hours = (next_event_time - events_df["Event Time"]).dt.total_seconds() / 3600
+
+    # The last event of a shipment has no next event yet, and events without a location have no hub
+    dwells = events_df.assign(**{"Dwell Hours": dwell_hours}).dropna(subset=["Dwell Hours"])
+    dwells = dwells[dwells["Location"] != ""]
+
+    hub_dwells = dwells.groupby("Location").agg(**{
+        "Events": ("Dwell Hours", "size"),
+        "Shipments": ("Shipment Number", "nunique"),
+        "Median Dwell Hours": ("Dwell Hours", "median"),
+        "Mean Dwell Hours": ("Dwell Hours", "mean"),
+        "P90 Dwell Hours": ("Dwell Hours", lambda hours: hours.quantile(0.9)),
+    })
+    return hub_dwells.sort_values("Median Dwell Hours", ascending=False).round(2)
+
+# Example usage:
+# hub_dwells = summarize_hub_dwell_times(read_events())
+
+
+
+def summarize_hub_transit_times(events_df):
+    """
+    Transit times between consecutive hubs of the same shipment.
+
+    Args:
+    - events_df (pd.DataFrame): Stored events (read_events output).
+
+    Returns:
+    - pd.DataFrame: Per (From Hub, To Hub) pair, the number of transits and the median and 90th percentile hours.
+    """
+    # Keep the events with a hub, and only the first event of each stay at a hub
+    hub_events = events_df[events_df["Location"] != ""].sort_values(["Shipment Number", "Event Time"])
+    previous_location = hub_events.groupby("Shipment Number")["Location"].shift()
+    hub_arrivals = hub_events[hub_events["Location"] != previous_location]
+
+    by_shipment = hub_arrivals.groupby("Shipment Number")
+    transits = hub_arrivals.assign(**{
+        "From Hub": by_shipment["Location"].shift(),
+        "Transit Hours": (hub_arrivals["Event Time"] - by_shipment["Event Time"].shift()).dt.total_seconds() / 3600,
+    }).dropna(subset=["From Hub"]).rename(columns={"Location": "To Hub"})
+
+    hub_transits = transits.groupby(["From Hub", "To Hub"]).agg(**{
+        "Transits": ("Transit Hours", "size"),
+        "Median Transit Hours": ("Transit Hours", "median"),
+        "P90 Transit Hours": ("Transit Hours", lambda hours: hours.quantile(0.9)),
+    })
+    return hub_transits.sort_values("Transits", ascending=False).round(2)
+
+# Example usage:
+# hub_transits = summarize_hub_transit_times(read_events(start_date="2023-10-01"))
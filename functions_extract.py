@@ -1,31 +1,184 @@
 """
 Functions:
+- load_shipments_to_query
+- normalize_reference_keys
+- create_chunked_urls
 - extract_and_create_urls
 
 """
 
 
+TNT_TRACKING_URL = "https://www.tnt.com/express/es_es/site/herramientas-envio/seguimiento.html"
 
+# Only columns read from the source workbook
+SOURCE_COLUMNS = ["LOGIS ID", "Carrier", "T&T reference", "Status"]
 
-def extract_and_create_urls(excel_tests_file_path):
+# Filtered source frames of this session, keyed by (absolute path, mtime, size)
+_SOURCE_FRAME_CACHE = {}
+
+
+
+def load_shipments_to_query(excel_tests_file_path, cache_dir=None):
+    """
+    Load the TNT shipments that are not DELIVERED from the source workbook, with a cache.
+
+    Only the needed columns are read and the Carrier/Status filter is applied at load time.
+    The filtered frame is cached in memory for the session and on disk as Parquet (pickle if
+    no Parquet engine is installed), keyed by the workbook's absolute path and content hash,
+    so later reads of the same workbook skip the Excel parse. The content hash is kept in a
+    small sidecar with the mtime and size it was computed for, and the workbook is only hashed
+    again when those change.
+
+    Args:
+    - excel_tests_file_path (str): Path to the Tests Excel file.
+    - cache_dir (str, optional): Folder of the on-disk cache. Defaults to ".tnt_cache" next to the workbook.
+
+    Returns:
+    - pd.DataFrame: Rows where Carrier = "TNT" and Status != "DELIVERED", with the SOURCE_COLUMNS.
+    """
+    import hashlib
+    import json
+    import os
+    import pandas as pd
+
+    workbook_path = os.path.abspath(excel_tests_file_path)
+    workbook_stat = os.stat(workbook_path)
+    memory_key = (workbook_path, workbook_stat.st_mtime_ns, workbook_stat.st_size)
+
+    # Same workbook already loaded in this session
+    if memory_key in _SOURCE_FRAME_CACHE:
+        return _SOURCE_FRAME_CACHE[memory_key].copy()
+
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(workbook_path), ".tnt_cache")
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # Cache files of this workbook are named after its absolute path, so workbooks with the same name in other folders keep theirs
+    path_key = hashlib.sha256(workbook_path.encode()).hexdigest()[:12]
+    workbook_prefix = f"{os.path.splitext(os.path.basename(workbook_path))[0]}-{path_key}"
+    sidecar_path = os.path.join(cache_dir, f"{workbook_prefix}.json")
+
+    # Content hash of the workbook, only computed again when its mtime or size changed
+    try:
+        with open(sidecar_path, encoding="utf-8") as sidecar_file:
+            sidecar = json.load(sidecar_file)
+    except (OSError, ValueError):
+        sidecar = {}
+    if sidecar.get("mtime_ns") == workbook_stat.st_mtime_ns and sidecar.get("size") == workbook_stat.st_size:
+        content_key = sidecar["content_hash"]
+    else:
+        content_hash = hashlib.sha256()
+        with open(workbook_path, "rb") as workbook_file:
+            for block in iter(lambda: workbook_file.read(1 << 20), b""):
+                content_hash.update(block)
+        content_key = content_hash.hexdigest()[:24]
+
+        temporary_path = f"{sidecar_path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as sidecar_file:
+            json.dump({"mtime_ns": workbook_stat.st_mtime_ns, "size": workbook_stat.st_size, "content_hash": content_key}, sidecar_file)
+        os.replace(temporary_path, sidecar_path)
+
+    cache_stem = os.path.join(cache_dir, f"{workbook_prefix}-{content_key}")
+
+    if os.path.exists(cache_stem + ".parquet"):
+        shipment_to_query = pd.read_parquet(cache_stem + ".parquet")
+    elif os.path.exists(cache_stem + ".pkl"):
+        shipment_to_query = pd.read_pickle(cache_stem + ".pkl")
+    else:
+        # Read only the needed columns
+        shipment_data = pd.read_excel(workbook_path, usecols=SOURCE_COLUMNS)
+
+        # Filter data: subset where Carrier = "TNT" & Status != DELIVERED
+        shipment_to_query = shipment_data[(shipment_data["Carrier"] == "TNT") & (shipment_data["Status"] != "DELIVERED")][SOURCE_COLUMNS]
+
+        # Drop the cached frames of previous versions of this workbook (same absolute path)
+        for cache_file in os.listdir(cache_dir):
+            if cache_file.startswith(f"{workbook_prefix}-"):
+                os.remove(os.path.join(cache_dir, cache_file))
+
+        try:
+            shipment_to_query.to_parquet(cache_stem + ".parquet")
+        except Exception:
+            # No Parquet engine, or mixed types Parquet cannot store
+            if os.path.exists(cache_stem + ".parquet"):
+                os.remove(cache_stem + ".parquet")
+            shipment_to_query.to_pickle(cache_stem + ".pkl")
+
+    _SOURCE_FRAME_CACHE[memory_key] = shipment_to_query
+    return shipment_to_query.copy()
+
+# Example usage:
+# shipment_to_query = load_shipments_to_query("./Shipment_Data/Testsinmacro.xlsx")
+
+
+
+def normalize_reference_keys(references):
+    """
+    Normalize shipment numbers to comparable string keys.
+
+    Excel may load them as integers or floats ("607252040.0") while the scraped ones are strings.
+
+    Args:
+    - references (pd.Series): Shipment numbers.
+
+    Returns:
+    - pd.Series: Stripped string keys, same index.
+    """
+    import pandas as pd
+
+    if pd.api.types.is_float_dtype(references):
+        references = references.astype("Int64")
+
+    return references.astype(str).str.strip().str.replace(r"\.0$", "", regex=True)
+
+# Example usage:
+# keys = normalize_reference_keys(shipment_to_query['T&T reference'])
+
+
+
+def create_chunked_urls(references, chunk_size=30, base_url=TNT_TRACKING_URL):
+    """
+    Sort shipment numbers and group them in chunks to create the tracking URLs.
+
+    Args:
+    - references (iterable): Shipment numbers to query.
+    - chunk_size (int): Maximum number of shipment numbers per URL (30 is the TNT tracker limit).
+    - base_url (str): Tracking page URL the query is appended to.
+
+    Returns:
+    - list: List of URLs to be scraped.
+    """
+    # Convert all elements to strings and sort the list in ascending order
+    sorted_references = sorted(map(str, references))
+
+    # Create chunks of up to chunk_size unique references
+    chunked_references = [sorted_references[i:i + chunk_size] for i in range(0, len(sorted_references), chunk_size)]
+
+    # Construct one URL per chunk
+    return [f"{base_url}?searchType=con&cons={','.join(chunk)}" for chunk in chunked_references]
+
+# Example usage:
+# url_list = create_chunked_urls(["607252040", "607247685"])
+
+
+
+
+def extract_and_create_urls(excel_tests_file_path, cache_dir=None):
     """
     Read and extract shipment data from the Tests Excel file, create a list of unique shipment numbers,
     and group them in chunks of 30 to create the URL.
 
     Args:
     - excel_tests_file_path (str): Path to the Tests Excel file.
+    - cache_dir (str, optional): Folder of the cache shared with check_inconsistencies (see load_shipments_to_query).
 
     Returns:
     - list: List of URLs to be scraped.
     """
-    import pandas as pd
-    from IPython.display import display, Markdown
+    from functions_reporting import report
     
-    # Read and extract shipment data from the Excel file
-    shipment_data = pd.read_excel(excel_tests_file_path)
-
-    # Filter data: subset where Carrier = "TNT" & Status != DELIVERED
-    shipment_to_query = shipment_data[(shipment_data["Carrier"] == "TNT") & (shipment_data["Status"] != "DELIVERED")][["LOGIS ID", "Carrier", "T&T reference", "Status"]]
+    # Read the needed columns of the Excel file, filtered to Carrier = "TNT" & Status != DELIVERED (cached)
+    shipment_to_query = load_shipments_to_query(excel_tests_file_path, cache_dir=cache_dir)
 
     # Convert the "Status" column to uppercase
     shipment_to_query["Status"] = shipment_to_query["Status"].str.upper()
@@ -39,30 +192,13 @@ def extract_and_create_urls(excel_tests_file_path):
     unique_references = set(shipment_to_query['T&T reference'])
 
     # Print
-    display(Markdown(f" --> In your Excel file there are **{len(unique_references)} unique shipment numbers** ({shipment_in_transit} 'In Transit' and {shipment_exception} 'Exception'). "))
-
-    # Convert the set to a list
-    unique_references_list = list(unique_references)
-
-    # Convert all elements to strings and sort the list in ascending order
-    sorted_references = sorted(map(str, unique_references_list))
-
-    # Create chunks of up to 30 unique references
-    chunked_references = [sorted_references[i:i + 30] for i in range(0, len(sorted_references), 30)]
-    
-    # Print
-    #display(Markdown(f"Number of **URL** (up-to-30 shipment numbers groups) to be consulted: **{len(chunked_references)}**"))
-
-    # Create an empty list to store the URL
-    url_list = []
+    report(f" --> In your Excel file there are **{len(unique_references)} unique shipment numbers** ({shipment_in_transit} 'In Transit' and {shipment_exception} 'Exception'). ")
 
-    # Iterate through the list and construct the URL
-    for chunk in chunked_references:
-        url = f"https://www.tnt.com/express/es_es/site/herramientas-envio/seguimiento.html?searchType=con&cons={','.join(map(str, chunk))}"
-        url_list.append(url)
+    # Create chunks of up to 30 unique references and construct the URL of each chunk
+    url_list = create_chunked_urls(unique_references)
     
     # Linkable URLs to manually check them if needed
-    display(Markdown(f"--> Chunked URLs to be consulted: **{len(chunked_references)}** "))
+    report(f"--> Chunked URLs to be consulted: **{len(url_list)}** ")
     
     #for i, url in enumerate(url_list, 1):
     #    display(f"{i}. {url}")
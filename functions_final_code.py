@@ -1,12 +1,81 @@
 """
 
+Classes:
+- TrackerRun
+
 Functions:
 - tnt_shipment_tracker
 
 """
 
 
-def tnt_shipment_tracker(excel_tests_file_path, chromedriver_path, folder_save_to_excel_path):
+# Report name of an unrouted run, the one report of every shipment
+TRACK_REPORT = "TNT Track Report"
+
+
+
+class TrackerRun:
+    """
+    Result of one tnt_shipment_tracker run, the same with or without report routes.
+
+    Unpacking it gives processed_df and url_list, as in `processed_df, url_list = tnt_shipment_tracker(...)`.
+
+    Args:
+    - reports (dict): Processed report frame keyed by report name (TRACK_REPORT without report routes).
+    - url_list (list): Chunk URLs queried during the run.
+    - report_paths (dict): Path of the first report file keyed by report name.
+    - report_writes (dict): ReportWriteHandle of the background writes keyed by report name (empty in the foreground).
+    - delta_writes (dict): ReportWriteHandle of the background delta report writes keyed by report name.
+    - client_references (dict): Client reference of every shipment returned by TNT in this run, keyed by shipment
+      number (None if TNT shows none), for check_inconsistencies.
+    """
+
+    def __init__(self, reports, url_list, report_paths, report_writes, delta_writes, client_references):
+        self.reports = reports
+        self.url_list = url_list
+        self.report_paths = report_paths
+        self.report_writes = report_writes
+        self.delta_writes = delta_writes
+        self.client_references = client_references
+
+    @property
+    def processed_df(self):
+        """
+        Every processed shipment of the run: the one report, or the routed reports one after the other.
+
+        Returns:
+        - pd.DataFrame: Processed shipment data.
+        """
+        import pandas as pd
+
+        if len(self.reports) == 1:
+            return next(iter(self.reports.values()))
+        return pd.concat(self.reports.values(), ignore_index=True)
+
+    def wait(self, timeout=None):
+        """
+        Wait until every background report write (delta reports included) is over, raising the write failures.
+
+        Args:
+        - timeout (float, optional): Maximum seconds to wait for each report. Defaults to no limit.
+
+        Returns:
+        - dict: Output paths keyed by format, keyed by report name.
+        """
+        for delta_write in self.delta_writes.values():
+            delta_write.wait(timeout)
+        return {report_name: report_write.wait(timeout) for report_name, report_write in self.report_writes.items()}
+
+    def __iter__(self):
+        return iter((self.processed_df, self.url_list))
+
+# Example usage:
+# run = tnt_shipment_tracker('your_excel_file.xlsx', 'your_chromedriver_path', 'your_folder_path', background_write=True)
+# report_paths = run.wait()
+
+
+
+def tnt_shipment_tracker(excel_tests_file_path, chromedriver_path, folder_save_to_excel_path, max_workers=1, min_request_interval=0.0, fetch_backend="selenium", html_parser="html.parser", state_store_path=None, metrics_dir=None, reporter=None, lean_browser=False, page_cache_dir=None, page_cache_ttl=6 * 60 * 60, replay=False, parse_processes=None, report_formats=("xlsx",), background_write=False, delta_report=False, event_store_dir=None, report_routes=None):
     """
     Description: This function performs a series of operations, including data extraction, web scraping, DataFrame
     transformation, visualization, and consistency checks.
@@ -15,85 +84,290 @@ def tnt_shipment_tracker(excel_tests_file_path, chromedriver_path, folder_save_t
     - excel_tests_file_path (str): Path to the Excel file containing tests data.
     - chromedriver_path (str): Path to the ChromeDriver executable.
     - folder_save_to_excel_path (str): Folder path to save the processed Excel file.
+    - max_workers (int): Number of browser workers scraping chunk URLs in parallel (1 = one at a time).
+    - min_request_interval (float): Minimum seconds between two page loads of the same worker.
+    - fetch_backend (str): "selenium" to render the tracking pages in Chrome. "http" (request the tracking data directly)
+      is refused until its API endpoint and payload schema are verified, see functions_http_backend.
+    - html_parser (str): BeautifulSoup parser backend for the tracking pages ("html.parser" or "lxml").
+    - state_store_path (str, optional): SQLite file keeping the last state of each shipment. When set, delivered
+      shipments and shipments with a foreign client reference are taken from the store instead of being scraped again.
+    - metrics_dir (str, optional): Folder where the run metrics are exported: one JSON line per run appended to
+      tnt_tracker_runs.jsonl, and tnt_tracker.prom for the Prometheus node exporter textfile collector.
+    - reporter (str or object, optional): Where the progress messages go: "notebook", "terminal", "logging" or an
+      object with a report(message) method. Defaults to the notebook inside Jupyter and the terminal elsewhere.
+    - lean_browser (bool): Scrape with the lean Chrome profile (no images, fonts, stylesheets or trackers, eager page load).
+      Opt-in. With metrics_dir, compare_browser_profiles reports its savings once the run log holds a lean and a full run
+      (with page weights, i.e. one run of each profile with metrics_dir set).
+    - page_cache_dir (str, optional): Folder of the raw page cache. When set, every loaded page is kept (gzip) and
+      pages younger than page_cache_ttl are parsed again instead of being loaded.
+    - page_cache_ttl (float): Seconds a cached page is reused by live runs.
+    - replay (bool): Rebuild the report from the cached pages only, without opening a browser (page_cache_dir
+      defaults to .tnt_cache/pages). The state store is read but not updated.
+    - parse_processes (int, optional): Number of processes parsing the raw pages (defaults to the number of CPUs,
+      1 parses in this process). Runs with few pages are always parsed in this process.
+    - report_formats (tuple): Formats of the report files written from the final frame: "xlsx" (streamed by
+      xlsxwriter when installed), "parquet" and/or "csv".
+    - background_write (bool): Write the report files on a background thread, so the function returns while
+      they are written, delta report included (its comparison with the previous report still runs in the foreground).
+      The run's wait() (or its ReportWriteHandles in report_writes and delta_writes) raises the write failures.
+    - delta_report (bool): Also write "TNT Track Changes <date time>" with the shipments new, changed, resolved or
+      stale since the previous report of the folder. A Parquet sidecar of the report is written for the next
+      comparison when pyarrow is installed.
+    - event_store_dir (str, optional): Folder of the shipment event store. When set, the full tracking history of
+      the report shipments is parsed in the same pass as the records and merged, deduplicated, into date-partitioned
+      Parquet files (requires pyarrow), for dwell time and hub transit analysis.
+    - report_routes (dict, optional): Report name keyed by client reference prefix, e.g. {"DSD/": "dsd", "ACM/": "acme"}.
+      When set, every shipment of the single scrape is routed to the report of its longest matching prefix, or to
+      "unrouted", and each report is saved (with its own delta report) in a subfolder of folder_save_to_excel_path.
 
     Returns:
-    - processed_df (DataFrame): DataFrame containing processed shipment data.
+    - TrackerRun: Processed report frames keyed by report name, url_list, report paths, background writes and the
+      client references returned by TNT.
+      Unpacks as processed_df, url_list.
     """
-    import pandas as pd
-    import numpy as np
-    from selenium import webdriver
-    from selenium.webdriver.chrome.service import Service as ChromeService
-    from selenium.webdriver.chrome.options import Options
-    from bs4 import BeautifulSoup
-    from datetime import datetime, timedelta
+    import importlib.util
     import os
-    from IPython.display import display, Markdown, HTML
-    import matplotlib.pyplot as plt
-    import seaborn as sns
     import time
 
     # Import customized functions from external files
-    from functions_extract import extract_and_create_urls
-    from functions_web_scraping import (
-        scrape_structure_from_urls, scrape_shipment_data, review_structure_scraped
-        )
-    from functions_process_df import (
-        convert_shipment_origin_date, process_last_update_column,
-        calculate_processing_days, format_dates_and_processing_days,
-        rearrange_columns_and_save_to_excel, global_df_transformation
+    from functions_extract import extract_and_create_urls, create_chunked_urls
+    from functions_web_scraping import review_structure_scraped, CLIENT_REFERENCE_PREFIX
+    from functions_pipeline import ShipmentRecordCollector, stream_shipment_records
+    from functions_driver_pool import ChromeDriverPool
+    from functions_page_cache import RawPageCache, PAGE_CACHE_DIR
+    from functions_metrics import RunMetrics, compare_browser_profiles
+    from functions_reporting import report, set_reporter
+    from functions_delta_report import write_delta_report
+    from functions_event_store import append_events
+    from functions_routing import ClientReferenceRouter
+    from functions_http_backend import fetch_shipment_records_http, records_to_dataframe, HTTP_BACKEND_VERIFIED
+    from functions_state_store import (
+        open_state_store, select_references_to_query, save_shipment_states, build_report_from_states
         )
+    from functions_process_df import global_df_transformation
     
-    # Start the timer
-    start_time = time.time()
-    
-    display(Markdown(f"**Stage 1/4: Retrieving Data from Your Excel File...**"))
-    
-    # Call function extract_and_create_urls
-    url_list, unique_references = extract_and_create_urls(excel_tests_file_path)
+    if fetch_backend not in ("selenium", "http"):
+        raise ValueError(f"Unknown fetch_backend '{fetch_backend}', expected 'selenium' or 'http'.")
+    if fetch_backend == "http" and not HTTP_BACKEND_VERIFIED:
+        raise ValueError("fetch_backend='http' is disabled until its API mappers are checked against a captured TNT response "
+                         "(see functions_http_backend), use fetch_backend='selenium'.")
+    if replay and fetch_backend != "selenium":
+        raise ValueError("replay rebuilds the report from cached tracking pages, use fetch_backend='selenium'.")
     
-    display(Markdown(f"**Stage 1/4: Completed**"))
-    display(Markdown(f"**Stage 2/4: Initiating Data Scraping Process...**"))
+    # Raw pages of the selenium backend, reused within the TTL or replayed
+    page_cache = None
+    if replay or page_cache_dir is not None:
+        page_cache = RawPageCache(page_cache_dir or PAGE_CACHE_DIR, ttl=page_cache_ttl, replay=replay)
     
-    # Call function scrape_structure_from_urls
-    all_shipment_divs = scrape_structure_from_urls(url_list, chromedriver_path)
+    # Routed reports keep every shipment of the scrape, each report takes its own prefixes
+    router = ClientReferenceRouter(report_routes) if report_routes else None
+    client_reference_prefix = "" if router is not None else CLIENT_REFERENCE_PREFIX
     
-    display(Markdown(f"**Stage 2/4: Completed**"))
-    display(Markdown(f"**Stage 3/4: Ensuring Data Retrieval for All Shipment Numbers....**"))
+    # Spans of the 4 stages and of every chunk fetch, plus the run counters
+    metrics = RunMetrics()
     
-    # Apply function to scrap again if not all shipment numbers are found in all_shipment_divs
-    all_shipment_divs = review_structure_scraped(unique_references, all_shipment_divs, url_list, chromedriver_path)
+    # Send the progress messages of this run to the chosen reporter
+    if reporter is not None:
+        previous_reporter = set_reporter(reporter)
     
-    display(Markdown(f"**Stage 3/4: Completed**"))
-    display(Markdown(f"**Stage 4/4: Creating TNT Track Report...**"))
+    # Start the timer
+    start_time = time.time()
     
-    # Call function scrape_shipment_data
-    df = scrape_shipment_data(all_shipment_divs)
+    try:
+        report(f"**Stage 1/4: Retrieving Data from Your Excel File...**")
+        
+        with metrics.span("stage_1_extract"):
+            # Call function extract_and_create_urls
+            url_list, unique_references = extract_and_create_urls(excel_tests_file_path)
+            
+            # Only query the shipments still open and relevant, the final ones come from the store
+            stored_records = []
+            if state_store_path is not None:
+                state_store = open_state_store(state_store_path)
+                unique_references, stored_records, foreign_count = select_references_to_query(state_store, unique_references,
+                                                                                              client_reference_prefix=client_reference_prefix)
+                url_list = create_chunked_urls(unique_references)
+                metrics.set_gauge("references_from_store", len(stored_records) + foreign_count)
+                report(f"--> From the state store: **{len(stored_records)} delivered** and **{foreign_count} foreign** shipments skipped. "
+                       f"Shipments to query: **{len(unique_references)}** in **{len(url_list)}** chunked URLs")
+        
+        metrics.set_gauge("references_to_query", len(unique_references))
+        
+        report(f"**Stage 1/4: Completed**")
+        report(f"**Stage 2/4: Initiating Data Scraping Process...**")
+        
+        if fetch_backend == "http":
+            # Request the tracking data directly, missing references included (stages 2 and 3)
+            with metrics.span("stage_2_scraping", backend="http"):
+                shipment_events = [] if event_store_dir is not None else None
+                records_by_number = fetch_shipment_records_http(unique_references, metrics=metrics, events=shipment_events,
+                                                                client_reference_prefix=client_reference_prefix)
+            
+            report(f"**Stage 2/4: Completed**")
+            report(f"**Stage 3/4: Completed**")
+        else:
+            # One pool of warm browser sessions shared by the scraping and review stages
+            metrics.set_gauge("lean_browser_profile", int(lean_browser))
+            with ChromeDriverPool(chromedriver_path, lean_profile=lean_browser, page_cache=page_cache) as driver_pool:
+                with metrics.span("stage_2_scraping", backend="selenium"):
+                    # Load, parse and drop each page in turn, only the compact records are carried forward
+                    shipment_records = stream_shipment_records(url_list, chromedriver_path, driver_pool=driver_pool,
+                                                               collector=ShipmentRecordCollector(keep_events=event_store_dir is not None,
+                                                                                                         client_reference_prefix=client_reference_prefix),
+                                                               max_workers=max_workers, min_request_interval=min_request_interval,
+                                                               html_parser=html_parser, metrics=metrics, parse_processes=parse_processes)
+                
+                report(f"**Stage 2/4: Completed**")
+                report(f"**Stage 3/4: Ensuring Data Retrieval for All Shipment Numbers....**")
+                
+                with metrics.span("stage_3_review"):
+                    # Apply function to scrap again if not all shipment numbers are found in shipment_records
+                    shipment_records = review_structure_scraped(unique_references, shipment_records, url_list, chromedriver_path, driver_pool=driver_pool,
+                                                                max_workers=max_workers, min_request_interval=min_request_interval,
+                                                                html_parser=html_parser, metrics=metrics, records=True)
+            
+            pool_stats = driver_pool.stats()
+            if metrics.counters.get("pages_measured"):
+                page_kilobytes = metrics.counters["page_transfer_bytes"] / metrics.counters["pages_measured"] / 1024
+                report(f"--> Page weight ({'lean' if lean_browser else 'full'} browser profile): **{page_kilobytes:.0f} KB per page**")
+            for stat_name, stat_value in pool_stats.items():
+                metrics.increment(f"browser_sessions_{stat_name}", stat_value)
+            report(f"--> Browser sessions launched: **{pool_stats['launched']}**, reused: **{pool_stats['reused']}**, recycled: **{pool_stats['recycled']}**")
+            if page_cache is not None:
+                metrics.set_gauge("page_cache_bytes", page_cache.size())
+                report(f"--> Pages from the cache: **{metrics.counters.get('pages_from_cache', 0)}**"
+                       f" ({page_cache.size() / 1024 / 1024:.1f} MB cached)")
+            
+            report(f"**Stage 3/4: Completed**")
+        
+        report(f"**Stage 4/4: Creating TNT Track Report...**")
+        
+        with metrics.span("stage_4_report"):
+            if fetch_backend == "http":
+                df = records_to_dataframe(records_by_number, client_reference_prefix=client_reference_prefix)
+                client_references = {number: record["Client Reference"] for number, record in records_by_number.items()}
+            else:
+                # Build the DataFrame once, from the records collected page by page
+                df = shipment_records.to_dataframe(metrics=metrics)
+                client_references = shipment_records.client_references
+                shipment_events = shipment_records.events
+            
+            if event_store_dir is not None:
+                # Events already stored are dropped, so a rerun or a replay adds nothing twice
+                new_event_count = append_events(shipment_events, event_store_dir)
+                metrics.increment("events_extracted", len(shipment_events))
+                metrics.increment("events_new", new_event_count)
+                report(f"--> Event store: **{new_event_count} new events** of {len(shipment_events)} extracted ({event_store_dir})")
+            
+            if state_store_path is not None:
+                # Record the fresh states and rebuild the full list from stored and fresh rows
+                if not replay:
+                    save_shipment_states(state_store, df, client_references)
+                state_store.close()
+                df = build_report_from_states(stored_records, df)
 
-    # Print first output
-    #display(df.head(), df.tail())
-    #display(df.info())
+            # Print first output
+            #display(df.head(), df.tail())
+            #display(df.info())
 
-    # Create a copy of the DataFrame to perform changes
-    processed_df = df.copy()
+            # The Parquet sidecar is what the next delta report reads (much faster than the Excel file)
+            written_formats = tuple(report_formats)
+            if delta_report and "parquet" not in written_formats and importlib.util.find_spec("pyarrow") is not None:
+                written_formats += ("parquet",)
+            
+            # One report per route from this single scrape, each in its own subfolder, or the one report
+            if router is not None:
+                report_targets = {report_name: (report_df, os.path.join(folder_save_to_excel_path, report_name))
+                                  for report_name, report_df in router.split(df).items()}
+            else:
+                report_targets = {TRACK_REPORT: (df, folder_save_to_excel_path)}
+            
+            processed_dfs = {}
+            report_paths = {}
+            report_writes = {}
+            delta_writes = {}
+            delta_counts = {}
+            for report_name, (report_df, report_folder) in report_targets.items():
+                if router is not None:
+                    os.makedirs(report_folder, exist_ok=True)
+                    report(f"--> Report **{report_name}**: {len(report_df)} shipments")
+                
+                # Create a copy of the DataFrame to perform changes
+                processed_df = report_df.copy()
+                
+                # Apply the function global_df_transformations, writing every report format from the same frame
+                if background_write:
+                    processed_df, excel_file_path, report_writes[report_name] = global_df_transformation(processed_df, report_folder,
+                                                                                                         written_formats, background_write=True)
+                else:
+                    processed_df, excel_file_path = global_df_transformation(processed_df, report_folder, written_formats)
+                
+                if delta_report:
+                    # Changes since the previous report of the folder, compared here and written with the report
+                    delta_df, _, delta_write = write_delta_report(processed_df, report_folder, excel_file_path,
+                                                                  formats=tuple(report_formats), background=background_write)
+                    if delta_df is not None:
+                        if background_write:
+                            delta_writes[report_name] = delta_write
+                        for change, count in delta_df["Change"].value_counts().items():
+                            delta_counts[change] = delta_counts.get(change, 0) + count
+                
+                processed_dfs[report_name] = processed_df
+                report_paths[report_name] = excel_file_path
+            
+            for change, count in delta_counts.items():
+                metrics.set_gauge(f"delta_{change.lower()}", count)
+        
+        metrics.set_gauge("rows_written", sum(len(processed_df) for processed_df in processed_dfs.values()))
+        metrics.set_gauge("report_frame_bytes", sum(int(processed_df.memory_usage(deep=True).sum()) for processed_df in processed_dfs.values()))
+        if router is not None:
+            metrics.set_gauge("reports_written", len(processed_dfs))
 
-    # Apply the function global_df_transformations
-    processed_df, excel_file_path = global_df_transformation(processed_df, folder_save_to_excel_path)
+        report(f"**Stage 4/4: Completed**")
+        
+        #display(processed_df.head(), processed_df.tail())
+        
+        run = TrackerRun(processed_dfs, url_list, report_paths, report_writes, delta_writes, client_references)
+        
+        # Stop the timer
+        end_time = time.time()
 
-    display(Markdown(f"**Stage 4/4: Completed**"))
-    
-    #display(processed_df.head(), processed_df.tail())
-    
-    # Stop the timer
-    end_time = time.time()
-
-    # Calculate and print the elapsed time
-    elapsed_time = end_time - start_time
-    display(Markdown(f"**Total elapsed time: {elapsed_time:.2f} seconds**"))
-    
-    #display(Markdown(f"TNT Track Report available in your local folder: {excel_file_path}"))
+        # Calculate and print the elapsed time
+        elapsed_time = end_time - start_time
+        report(f"**Total elapsed time: {elapsed_time:.2f} seconds**")
+        
+        #report(f"TNT Track Report available in your local folder: {excel_file_path}")
+    finally:
+        if page_cache is not None:
+            page_cache.close()
+        
+        # Export the metrics of the run, failed runs included
+        if metrics_dir is not None:
+            os.makedirs(metrics_dir, exist_ok=True)
+            run_log_path = os.path.join(metrics_dir, "tnt_tracker_runs.jsonl")
+            metrics.append_json_run_log(run_log_path)
+            metrics.write_prometheus_textfile(os.path.join(metrics_dir, "tnt_tracker.prom"))
+            report(f"--> Run metrics saved in: **{metrics_dir}**")
+            
+            # Savings of the lean browser profile, once the log has a lean and a full run
+            profile_comparison = compare_browser_profiles(run_log_path)
+            if profile_comparison["bytes_saved_per_page"] is not None:
+                seconds_saved = profile_comparison["seconds_saved_per_page"] or 0.0
+                report(f"--> Lean browser profile saves **{profile_comparison['bytes_saved_per_page'] / 1024:.0f} KB** "
+                       f"and **{seconds_saved:.2f} seconds** per page (last full run vs last lean run)")
+        
+        if reporter is not None:
+            set_reporter(previous_reporter)
 
     
-    return processed_df, url_list
+    return run
 
 # Example usage:
-# result_processed_df = tnt_shipment_tracker('your_excel_file.xlsx', 'your_chromedriver_path', 'your_folder_path')
+# processed_df, url_list = tnt_shipment_tracker('your_excel_file.xlsx', 'your_chromedriver_path', 'your_folder_path')
+# processed_df, url_list = tnt_shipment_tracker('your_excel_file.xlsx', 'your_chromedriver_path', 'your_folder_path', max_workers=4)
+# processed_df, url_list = tnt_shipment_tracker('your_excel_file.xlsx', 'your_chromedriver_path', 'your_folder_path', state_store_path='./Shipment_Data/tnt_state.sqlite')
+# processed_df, url_list = tnt_shipment_tracker('your_excel_file.xlsx', 'your_chromedriver_path', 'your_folder_path', metrics_dir='./TNT Track Reports/metrics')
+# run = tnt_shipment_tracker('your_excel_file.xlsx', 'your_chromedriver_path', 'your_folder_path', report_formats=("xlsx", "parquet"), background_write=True)
+# report_paths = run.wait()
+# run = tnt_shipment_tracker('your_excel_file.xlsx', 'your_chromedriver_path', 'your_folder_path', report_routes={"DSD/": "dsd", "ACM/": "acme"})
+# dsd_df = run.reports["dsd"]
@@ -0,0 +1,389 @@
+"""
+
+Browserless fetch backend: requests the tracking data behind the pb-track-trace /
+pb-search-results components directly, instead of rendering the page in Chrome.
+
+EXPERIMENTAL: the endpoint and the payload schema ("tracker.output", "consignment",
+"customerReference", "status.isException", "statusData[].localEventDate", ...) have not
+been checked against a captured response of the real TNT API. The only payloads it has
+run on come from functions_benchmark.build_tracking_api_payload, which is written from
+the same assumptions as the mappers below, so matching the selenium backend there proves
+nothing about the real API. Until the mappers are checked against a captured response,
+HTTP_BACKEND_VERIFIED stays False and tnt_shipment_tracker, the command line and the polling
+daemon refuse fetch_backend="http"; the functions below can still be called directly.
+
+Functions:
+- build_api_urls
+- run_coroutine
+- open_api_session
+- fetch_chunk_payloads
+- map_consignment_to_record
+- map_consignment_to_events
+- fetch_shipment_records_http
+- records_to_dataframe
+- fetch_shipment_data_http
+
+"""
+
+
+# Assumed tracking API endpoint (unverified, see the module docstring)
+TNT_SHIPMENT_API_URL = "https://www.tnt.com/api/v3/shipment"
+
+# Set to True once the mappers are checked against a captured response of the real API
+HTTP_BACKEND_VERIFIED = False
+
+
+
+def build_api_urls(references, chunk_size=30, api_url=TNT_SHIPMENT_API_URL, locale="es_ES"):
+    """
+    Sort shipment numbers and group them in chunks to create the tracking API URLs.
+
+    Args:
+    - references (iterable): Shipment numbers to query.
+    - chunk_size (int): Maximum number of shipment numbers per request.
+    - api_url (str): Tracking API endpoint.
+    - locale (str): Locale of the labels returned (es_ES gives the same texts as the Spanish page).
+
+    Returns:
+    - list: List of API URLs.
+    """
+    sorted_references = sorted(map(str, references))
+    chunked_references = [sorted_references[i:i + chunk_size] for i in range(0, len(sorted_references), chunk_size)]
+
+    return [f"{api_url}?con={','.join(chunk)}&searchType=CON&locale={locale}&channel=OPENTRACK" for chunk in chunked_references]
+
+# Example usage:
+# api_url_list = build_api_urls(unique_references)
+
+
+
+def run_coroutine(coroutine):
+    """
+    Run a coroutine to completion on one new event loop, also from a notebook.
+
+    Jupyter already runs an event loop in the calling thread, where asyncio.run is not
+    allowed; the coroutine then runs on a worker thread with its own loop.
+
+    Args:
+    - coroutine (coroutine): Coroutine to run.
+
+    Returns:
+    - object: Result of the coroutine.
+    """
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="http-backend") as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+# Example usage:
+# payloads = run_coroutine(fetch_chunk_payloads(api_url_list))
+
+
+
+def open_api_session(max_connections=4, timeout=30):
+    """
+    Open the pooled keep-alive HTTP session of the tracking API (call it inside the event loop that uses it).
+
+    Args:
+    - max_connections (int): Maximum number of open connections (and requests in flight).
+    - timeout (float): Total seconds allowed per request.
+
+    Returns:
+    - aiohttp.ClientSession: Session to use as an async context manager.
+    """
+    import aiohttp
+
+    connector = aiohttp.TCPConnector(limit=max_connections, keepalive_timeout=60)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+
+    return aiohttp.ClientSession(connector=connector, timeout=client_timeout, headers={"Accept": "application/json"})
+
+# Example usage:
+# async with open_api_session() as session:
+#     payloads = await fetch_chunk_payloads(api_url_list, session=session)
+
+
+
+async def fetch_chunk_payloads(api_url_list, max_connections=4, timeout=30, metrics=None, session=None):
+    """
+    Request every API URL over one pooled keep-alive HTTP session.
+
+    Args:
+    - api_url_list (list): API URLs to request.
+    - max_connections (int): Maximum number of open connections (and requests in flight), if the session is opened here.
+    - timeout (float): Total seconds allowed per request, if the session is opened here.
+    - metrics (RunMetrics, optional): Records a "chunk_fetch" span, the chunk latency and the page counters.
+    - session (aiohttp.ClientSession, optional): Open session to reuse (open_api_session). Defaults to a session
+      opened and closed for this call.
+
+    Returns:
+    - list: One entry per URL, in api_url_list order: the decoded JSON payload, or the exception raised for that URL.
+    """
+    import asyncio
+    import time
+    from functions_metrics import NullMetrics
+
+    if metrics is None:
+        metrics = NullMetrics()
+
+    if session is None:
+        async with open_api_session(max_connections=max_connections, timeout=timeout) as session:
+            return await fetch_chunk_payloads(api_url_list, metrics=metrics, session=session)
+
+    async def fetch_one(api_url):
+        start_time = time.time()
+        try:
+            with metrics.span("chunk_fetch", url=api_url):
+                async with session.get(api_url) as response:
+                    response.raise_for_status()
+                    payload = await response.json(content_type=None)
+        except Exception:
+            metrics.increment("page_failures")
+            raise
+        metrics.observe("chunk_fetch_seconds", time.time() - start_time)
+        metrics.increment("pages_fetched")
+        return payload
+
+    # gather keeps the order of api_url_list
+    return await asyncio.gather(*(fetch_one(api_url) for api_url in api_url_list), return_exceptions=True)
+
+# Example usage:
+# payloads = run_coroutine(fetch_chunk_payloads(api_url_list))
+
+
+
+def map_consignment_to_record(consignment):
+    """
+    Map one consignment of the API payload to the record produced by scrape_shipment_data.
+
+    Texts are formatted as the tracking page renders them. The field names are the assumed
+    payload schema, not checked against a real API response (see the module docstring).
+
+    Args:
+    - consignment (dict): One entry of payload["tracker.output"]["consignment"].
+
+    Returns:
+    - dict: Shipment record with the scrape_shipment_data columns.
+    """
+    from datetime import datetime
+    from functions_process_df import SPANISH_MONTHS
+
+    status = consignment.get("status") or {}
+    destination = consignment.get("destinationAddress") or {}
+    status_data = consignment.get("statusData") or []
+    last_event = status_data[0] if status_data else {}
+
+    # "18 de octubre de 2023"
+    shipment_origin_date = None
+    if consignment.get("originDate"):
+        origin_date = datetime.fromisoformat(consignment["originDate"])
+        shipment_origin_date = f"{origin_date.day} de {SPANISH_MONTHS[origin_date.month - 1]} de {origin_date.year}"
+
+    # "Laval,  France" (the page joins city and country with a line break rendered as two spaces)
+    shipment_destination = None
+    if destination:
+        shipment_destination = f"{destination.get('city', '')},  {destination.get('country', '')}"
+
+    # "20/10/23 8:55" (hour without leading zero, as on the page)
+    last_update = None
+    if last_event.get("localEventDate"):
+        event_date = datetime.fromisoformat(last_event["localEventDate"])
+        last_update = f"{event_date:%d/%m/%y} {event_date.hour}:{event_date:%M}"
+
+    # Extract Action Message
+    last_action_text = (last_event.get("statusDescription") or "").strip()
+    if "-" in last_action_text:
+        _, last_action = last_action_text.split("-", 1)
+    else:
+        last_action = last_action_text
+
+    return {
+        # None when TNT shows no client reference, as extract_shipment_record
+        "Client Reference": (consignment.get("customerReference") or "").strip() or None,
+        "Shipment Number": str(consignment.get("consignmentNumber", "")).strip(),
+        "TNT Status": status.get("statusDescription"),
+        "Shipment Origin Date": shipment_origin_date,
+        "Shipment Destination": shipment_destination,
+        "Last Update": last_update,
+        "Last Location": (last_event.get("depotName") or "").strip(),
+        "Last Action": last_action,
+        "TNT Exception Notification": "EXCEPTION ALERT" if status.get("isException") else " "
+    }
+
+# Example usage:
+# record = map_consignment_to_record(payload["tracker.output"]["consignment"][0])
+
+
+
+def map_consignment_to_events(consignment):
+    """
+    Map the full status history of one consignment to the event tuples of extract_shipment_events.
+
+    Same unverified payload schema as map_consignment_to_record.
+
+    Args:
+    - consignment (dict): One entry of payload["tracker.output"]["consignment"].
+
+    Returns:
+    - list: One (Shipment Number, Client Reference, Event Time, Location, Action) tuple per status, latest first.
+    """
+    from datetime import datetime
+
+    shipment_number = str(consignment.get("consignmentNumber", "")).strip()
+    client_reference = (consignment.get("customerReference") or "").strip() or None
+
+    events = []
+    for status_event in consignment.get("statusData") or []:
+        # Event time as the page shows it ("20/10/23 8:55")
+        event_time = None
+        if status_event.get("localEventDate"):
+            event_date = datetime.fromisoformat(status_event["localEventDate"])
+            event_time = f"{event_date:%d/%m/%y} {event_date.hour}:{event_date:%M}"
+
+        action = (status_event.get("statusDescription") or "").strip()
+        if "-" in action:
+            action = action.split("-", 1)[1].strip()
+
+        events.append((shipment_number, client_reference, event_time, (status_event.get("depotName") or "").strip(), action))
+
+    return events
+
+# Example usage:
+# events = map_consignment_to_events(payload["tracker.output"]["consignment"][0])
+
+
+
+def fetch_shipment_records_http(unique_references, api_url=TNT_SHIPMENT_API_URL, max_connections=4, max_attempts=5, metrics=None, events=None, client_reference_prefix=None):
+    """
+    Fetch the records of every shipment returned by the tracking API, whatever its client reference.
+
+    References missing from the answers are requested again, up to max_attempts rounds. All
+    rounds share one event loop and one keep-alive session; from a notebook (running event
+    loop) they run on a worker thread.
+
+    Args:
+    - unique_references (set): Shipment numbers to query.
+    - api_url (str): Tracking API endpoint.
+    - max_connections (int): Maximum number of pooled connections.
+    - max_attempts (int): Maximum number of request rounds.
+    - metrics (RunMetrics, optional): Records the chunk fetches, the shipments parsed, the retry rounds and the references still missing.
+    - events (list, optional): Filled with the history event tuples of the shipments whose client reference matches.
+    - client_reference_prefix (str, optional): Prefix of the shipments whose events are kept. Defaults to CLIENT_REFERENCE_PREFIX.
+
+    Returns:
+    - dict: Shipment records keyed by shipment number, in answer order (the shipments found by a retry round
+      come after those of the earlier rounds, as the retry pages of the selenium backend).
+    """
+    import time
+    from functions_reporting import report
+    from functions_metrics import NullMetrics
+    from functions_web_scraping import CLIENT_REFERENCE_PREFIX
+
+    if metrics is None:
+        metrics = NullMetrics()
+    if client_reference_prefix is None:
+        client_reference_prefix = CLIENT_REFERENCE_PREFIX
+
+    # Start the timer
+    start_time = time.time()
+
+    records_by_number = {}
+    missing_numbers = {str(ship_num) for ship_num in unique_references}
+
+    async def fetch_rounds():
+        nonlocal missing_numbers
+
+        async with open_api_session(max_connections=max_connections) as session:
+            for current_attempt in range(1, max_attempts + 1):
+                if not missing_numbers:
+                    break
+
+                if current_attempt > 1:
+                    metrics.increment("review_retries")
+
+                api_url_list = build_api_urls(missing_numbers, api_url=api_url)
+                payloads = await fetch_chunk_payloads(api_url_list, metrics=metrics, session=session)
+
+                for payload in payloads:
+                    if isinstance(payload, Exception):
+                        continue
+                    for consignment in payload.get("tracker.output", {}).get("consignment", []):
+                        record = map_consignment_to_record(consignment)
+                        records_by_number[record["Shipment Number"]] = record
+                        metrics.increment("shipments_parsed")
+                        client_reference = record["Client Reference"]
+                        if events is not None and client_reference is not None and client_reference.startswith(client_reference_prefix):
+                            events.extend(map_consignment_to_events(consignment))
+
+                missing_numbers -= records_by_number.keys()
+                report(f"--> Attempt {current_attempt}: Found {len(records_by_number)} out of {len(unique_references)} shipments.")
+
+    run_coroutine(fetch_rounds())
+
+    metrics.set_gauge("missing_references", len(missing_numbers))
+
+    # Stop the timer
+    elapsed_time = time.time() - start_time
+    report(f"--> Elapsed time fetching data: **{elapsed_time:.2f} seconds**")
+
+    return records_by_number
+
+# Example usage:
+# records_by_number = fetch_shipment_records_http(unique_references)
+
+
+
+def records_to_dataframe(records_by_number, client_reference_prefix=None):
+    """
+    Keep the records whose client reference matches and build the scrape_shipment_data DataFrame.
+
+    Args:
+    - records_by_number (dict): Shipment records keyed by shipment number.
+    - client_reference_prefix (str, optional): Prefix of the records kept. Defaults to CLIENT_REFERENCE_PREFIX;
+      "" keeps every record (routed reports).
+
+    Returns:
+    - pd.DataFrame: DataFrame with scraped shipment data.
+    """
+    import pandas as pd
+    from functions_web_scraping import CLIENT_REFERENCE_PREFIX, SHIPMENT_COLUMNS
+
+    if client_reference_prefix is None:
+        client_reference_prefix = CLIENT_REFERENCE_PREFIX
+
+    # Keep the page order (chunks of sorted references) and the client reference filter
+    all_results = [record for record in records_by_number.values()
+                   if record["Client Reference"] is not None and record["Client Reference"].startswith(client_reference_prefix)]
+
+    return pd.DataFrame(all_results, columns=SHIPMENT_COLUMNS)
+
+# Example usage:
+# df = records_to_dataframe(records_by_number)
+
+
+
+def fetch_shipment_data_http(unique_references, api_url=TNT_SHIPMENT_API_URL, max_connections=4, max_attempts=5):
+    """
+    Fetch shipment data through the tracking API and return the same DataFrame as scrape_shipment_data.
+
+    Args:
+    - unique_references (set): Shipment numbers to query.
+    - api_url (str): Tracking API endpoint.
+    - max_connections (int): Maximum number of pooled connections.
+    - max_attempts (int): Maximum number of request rounds.
+
+    Returns:
+    - pd.DataFrame: DataFrame with scraped shipment data.
+    """
+    records_by_number = fetch_shipment_records_http(unique_references, api_url=api_url, max_connections=max_connections,
+                                                    max_attempts=max_attempts)
+    return records_to_dataframe(records_by_number)
+
+# Example usage:
+# df = fetch_shipment_data_http(unique_references)
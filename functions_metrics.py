@@ -0,0 +1,282 @@
+"""
+
+Classes:
+- RunMetrics
+- NullMetrics
+
+Functions:
+- compare_browser_profiles
+
+"""
+
+
+# Upper bounds (seconds) of the chunk latency histogram buckets
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+
+
+
+class RunMetrics:
+    """
+    Spans, counters, gauges and latency histograms of one tracker run.
+
+    Every method is thread-safe, so the concurrent scraping workers can share one instance.
+    At the end of the run the metrics are exported as one JSON line appended to a run log
+    and as a Prometheus textfile for the node exporter textfile collector.
+
+    Args:
+    - run_name (str): Name stored with the run (also the "job" label in Prometheus).
+    """
+
+    def __init__(self, run_name="tnt_shipment_tracker"):
+        import threading
+        import time
+
+        self.run_name = run_name
+        self.started_at = time.time()
+        self.spans = []
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def span(self, name, **labels):
+        """
+        Time a block of code.
+
+        Args:
+        - name (str): Span name, e.g. "stage_2_scraping" or "chunk_fetch".
+        - **labels: Extra values stored with the span.
+
+        Returns:
+        - context manager: Records the span when the block exits (with the error type if it raised).
+        """
+        import time
+        from contextlib import contextmanager
+
+        @contextmanager
+        def timed_block():
+            start_time = time.time()
+            error = None
+            try:
+                yield
+            except BaseException as raised:
+                error = type(raised).__name__
+                raise
+            finally:
+                duration = time.time() - start_time
+                with self._lock:
+                    self.spans.append({"name": name, "start": round(start_time - self.started_at, 4),
+                                       "seconds": round(duration, 4), "error": error, **labels})
+
+        return timed_block()
+
+    def increment(self, name, value=1):
+        """
+        Add to a counter (pages_fetched, shipments_parsed, retries...).
+
+        Args:
+        - name (str): Counter name.
+        - value (int): Amount to add.
+
+        Returns:
+        - None
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        """
+        Set a value that is only meaningful at the end of the run (missing references, rows written...).
+
+        Args:
+        - name (str): Gauge name.
+        - value (float): Value.
+
+        Returns:
+        - None
+        """
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name, value):
+        """
+        Add one observation to a latency histogram.
+
+        Args:
+        - name (str): Histogram name, e.g. "chunk_fetch_seconds".
+        - value (float): Observed seconds.
+
+        Returns:
+        - None
+        """
+        with self._lock:
+            histogram = self.histograms.setdefault(name, {"buckets": [0] * len(LATENCY_BUCKETS), "sum": 0.0, "count": 0})
+            for position, upper_bound in enumerate(LATENCY_BUCKETS):
+                if value <= upper_bound:
+                    histogram["buckets"][position] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def summary(self):
+        """
+        Collect the metrics of the run.
+
+        Returns:
+        - dict: Run name, timestamps, duration per stage, counters, gauges, histograms and spans.
+        """
+        import time
+        from datetime import datetime
+
+        with self._lock:
+            stage_seconds = {}
+            for span in self.spans:
+                if span["name"].startswith("stage_"):
+                    stage_seconds[span["name"]] = stage_seconds.get(span["name"], 0) + span["seconds"]
+
+            return {
+                "run_name": self.run_name,
+                "started_at": datetime.fromtimestamp(self.started_at).isoformat(timespec="seconds"),
+                "duration_seconds": round(time.time() - self.started_at, 4),
+                "stage_seconds": stage_seconds,
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "histograms": {name: {"le": list(LATENCY_BUCKETS), "buckets": list(histogram["buckets"]),
+                                      "sum": round(histogram["sum"], 4), "count": histogram["count"]}
+                               for name, histogram in self.histograms.items()},
+                "spans": list(self.spans),
+            }
+
+    def append_json_run_log(self, run_log_path):
+        """
+        Append the run summary as one JSON line to a run log.
+
+        Args:
+        - run_log_path (str): Path of the JSON lines run log.
+
+        Returns:
+        - dict: Summary written.
+        """
+        import json
+
+        summary = self.summary()
+        with open(run_log_path, "a", encoding="utf-8") as run_log:
+            run_log.write(json.dumps(summary, ensure_ascii=False) + "\n")
+        return summary
+
+    def write_prometheus_textfile(self, textfile_path, prefix="tnt_tracker"):
+        """
+        Write the run metrics in the Prometheus text format, atomically (for the textfile collector).
+
+        Args:
+        - textfile_path (str): Path of the .prom file.
+        - prefix (str): Prefix of every metric name.
+
+        Returns:
+        - None
+        """
+        import os
+
+        summary = self.summary()
+        job = summary["run_name"]
+        lines = [
+            f"# TYPE {prefix}_last_run_timestamp_seconds gauge",
+            f'{prefix}_last_run_timestamp_seconds{{job="{job}"}} {self.started_at:.0f}',
+            f"# TYPE {prefix}_run_duration_seconds gauge",
+            f'{prefix}_run_duration_seconds{{job="{job}"}} {summary["duration_seconds"]}',
+            f"# TYPE {prefix}_stage_duration_seconds gauge",
+        ]
+        lines += [f'{prefix}_stage_duration_seconds{{job="{job}",stage="{stage}"}} {seconds}'
+                  for stage, seconds in summary["stage_seconds"].items()]
+
+        for name, value in summary["counters"].items():
+            lines += [f"# TYPE {prefix}_{name}_total counter", f'{prefix}_{name}_total{{job="{job}"}} {value}']
+        for name, value in summary["gauges"].items():
+            lines += [f"# TYPE {prefix}_{name} gauge", f'{prefix}_{name}{{job="{job}"}} {value}']
+
+        for name, histogram in summary["histograms"].items():
+            lines.append(f"# TYPE {prefix}_{name} histogram")
+            # Buckets are already cumulative: an observation counts in every bucket above it
+            for upper_bound, count in zip(histogram["le"], histogram["buckets"]):
+                lines.append(f'{prefix}_{name}_bucket{{job="{job}",le="{upper_bound}"}} {count}')
+            lines += [
+                f'{prefix}_{name}_bucket{{job="{job}",le="+Inf"}} {histogram["count"]}',
+                f'{prefix}_{name}_sum{{job="{job}"}} {histogram["sum"]}',
+                f'{prefix}_{name}_count{{job="{job}"}} {histogram["count"]}',
+            ]
+
+        # Write next to the target and rename, so the collector never reads a partial file
+        temporary_path = f"{textfile_path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as textfile:
+            textfile.write("\n".join(lines) + "\n")
+        os.replace(temporary_path, textfile_path)
+
+# Example usage:
+# metrics = RunMetrics()
+# with metrics.span("stage_1_extract"):
+#     url_list, unique_references = extract_and_create_urls(excel_tests_file_path)
+# metrics.append_json_run_log("./TNT Track Reports/tnt_tracker_runs.jsonl")
+# metrics.write_prometheus_textfile("./TNT Track Reports/tnt_tracker.prom")
+
+
+
+class NullMetrics:
+    """
+    Metrics sink that records nothing, used when a function is called without metrics.
+    """
+
+    def span(self, name, **labels):
+        from contextlib import nullcontext
+        return nullcontext()
+
+    def increment(self, name, value=1):
+        pass
+
+    def set_gauge(self, name, value):
+        pass
+
+    def observe(self, name, value):
+        pass
+
+
+
+def compare_browser_profiles(run_log_path):
+    """
+    Compare the page weight and load time of the last lean and full browser runs of a run log.
+
+    Only runs that measured their page weight count (tnt_shipment_tracker with metrics_dir), so
+    the comparison needs at least one such run with lean_browser=True and one with the default
+    full profile in the same log; until then the savings are None.
+
+    Args:
+    - run_log_path (str): JSON lines run log written by RunMetrics.append_json_run_log.
+
+    Returns:
+    - dict: Bytes and seconds per page of each profile ("lean", "full"), and the bytes and seconds saved per page
+      by the lean profile (None until the log has a run of each profile).
+    """
+    import json
+
+    profiles = {}
+    with open(run_log_path, encoding="utf-8") as run_log:
+        for line in run_log:
+            run = json.loads(line)
+            if "lean_browser_profile" not in run["gauges"] or not run["counters"].get("pages_measured"):
+                continue
+
+            chunk_fetch = run["histograms"].get("chunk_fetch_seconds", {"sum": 0.0, "count": 0})
+            # Later runs replace earlier ones of the same profile
+            profiles["lean" if run["gauges"]["lean_browser_profile"] else "full"] = {
+                "started_at": run["started_at"],
+                "bytes_per_page": run["counters"].get("page_transfer_bytes", 0) / run["counters"]["pages_measured"],
+                "seconds_per_page": chunk_fetch["sum"] / chunk_fetch["count"] if chunk_fetch["count"] else None,
+            }
+
+    comparison = {**profiles, "bytes_saved_per_page": None, "seconds_saved_per_page": None}
+    if "lean" in profiles and "full" in profiles:
+        comparison["bytes_saved_per_page"] = profiles["full"]["bytes_per_page"] - profiles["lean"]["bytes_per_page"]
+        if profiles["full"]["seconds_per_page"] is not None and profiles["lean"]["seconds_per_page"] is not None:
+            comparison["seconds_saved_per_page"] = profiles["full"]["seconds_per_page"] - profiles["lean"]["seconds_per_page"]
+    return comparison
+
+# Example usage:
+# compare_browser_profiles("./TNT Track Reports/metrics/tnt_tracker_runs.jsonl")
@@ -0,0 +1,214 @@
+"""
+
+On-disk cache of the raw tracking pages, so parsing and processing can be repeated
+without scraping TNT again.
+
+Classes:
+- RawPageCache
+
+"""
+
+
+# Default folder of the page cache, next to the source workbook cache
+PAGE_CACHE_DIR = ".tnt_cache/pages"
+
+
+
+class RawPageCache:
+    """
+    Gzip-compressed, content-addressed cache of the raw HTML of the chunk URLs.
+
+    Pages are stored once per distinct content (blobs/<sha256>.html.gz) and indexed by
+    chunk URL and fetch time in index.sqlite. Every loaded page is stored, including the
+    ones read before all their shipments had rendered (marked incomplete): live runs only
+    reuse complete pages younger than `ttl`; in replay mode the latest page of each URL is
+    served whatever its age or completeness, so the review asks for the same retry chunk
+    URLs as the live run did (create_chunked_urls sorts the references of each chunk, the
+    URL of a chunk is always the same) and finds them in the cache. A URL never fetched
+    raises LookupError instead of opening a browser. When the blobs exceed `max_bytes`,
+    the oldest fetches are evicted first. Thread-safe.
+
+    Args:
+    - cache_dir (str): Folder of the cache.
+    - ttl (float): Seconds a cached page is reused by live runs (0 never reuses, pages are still stored).
+    - max_bytes (int): Maximum size of the compressed pages on disk.
+    - replay (bool): Serve every page from the cache, without TTL and without fetching.
+    """
+
+    def __init__(self, cache_dir=PAGE_CACHE_DIR, ttl=6 * 60 * 60, max_bytes=200 * 1024 * 1024, replay=False):
+        import os
+        import sqlite3
+        import threading
+
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.replay = replay
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.join(cache_dir, "blobs"), exist_ok=True)
+        # Shared by the scraping workers, access is serialized by the lock
+        self._index = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), check_same_thread=False)
+        self._index.execute("""
+            CREATE TABLE IF NOT EXISTS page_fetch (
+                url TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                content_hash TEXT NOT NULL,
+                compressed_size INTEGER NOT NULL
+            )
+        """)
+        # Caches created when only complete pages were stored
+        fetch_columns = {row[1] for row in self._index.execute("PRAGMA table_info(page_fetch)")}
+        if "complete" not in fetch_columns:
+            self._index.execute("ALTER TABLE page_fetch ADD COLUMN complete INTEGER NOT NULL DEFAULT 1")
+        self._index.execute("CREATE INDEX IF NOT EXISTS page_fetch_url ON page_fetch (url, fetched_at)")
+        self._index.commit()
+
+    def _blob_path(self, content_hash):
+        import os
+        return os.path.join(self.cache_dir, "blobs", f"{content_hash}.html.gz")
+
+    def get(self, url, now=None):
+        """
+        Return the cached HTML of a chunk URL.
+
+        Args:
+        - url (str): Chunk URL.
+        - now (float, optional): Current time (Unix seconds). Defaults to time.time().
+
+        Returns:
+        - str: Page HTML, or None if there is no complete page younger than the TTL (live mode).
+        """
+        import gzip
+        import time
+
+        now = time.time() if now is None else now
+        # Replay serves the page the run actually parsed; a live run loads an incomplete page again
+        completeness_filter = "" if self.replay else " AND complete = 1"
+        with self._lock:
+            row = self._index.execute(
+                f"SELECT content_hash, fetched_at FROM page_fetch WHERE url = ?{completeness_filter} ORDER BY fetched_at DESC LIMIT 1", (url,)
+            ).fetchone()
+
+        if row is None or (not self.replay and now - row[1] > self.ttl):
+            if self.replay:
+                raise LookupError(f"No cached page for {url}")
+            return None
+
+        try:
+            with gzip.open(self._blob_path(row[0]), "rt", encoding="utf-8") as blob:
+                return blob.read()
+        except FileNotFoundError:
+            if self.replay:
+                raise LookupError(f"Cached page of {url} was evicted")
+            return None
+
+    def put(self, url, page_source, fetched_at=None, complete=True):
+        """
+        Store the HTML of a chunk URL fetched now.
+
+        Args:
+        - url (str): Chunk URL.
+        - page_source (str): Page HTML.
+        - fetched_at (float, optional): Fetch time (Unix seconds). Defaults to time.time().
+        - complete (bool): The page was read once its results were ready. Incomplete pages are only served in replay mode.
+
+        Returns:
+        - str: Content hash of the page.
+        """
+        import gzip
+        import hashlib
+        import os
+        import time
+
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        page_bytes = page_source.encode("utf-8")
+        content_hash = hashlib.sha256(page_bytes).hexdigest()
+        blob_path = self._blob_path(content_hash)
+
+        # Identical pages share one blob; write next to it and rename so readers never see a partial file
+        if not os.path.exists(blob_path):
+            temporary_path = f"{blob_path}.{os.getpid()}.{id(page_source)}.tmp"
+            with open(temporary_path, "wb") as blob:
+                blob.write(gzip.compress(page_bytes, compresslevel=6))
+            os.replace(temporary_path, blob_path)
+
+        with self._lock:
+            self._index.execute("INSERT INTO page_fetch (url, fetched_at, content_hash, compressed_size, complete) VALUES (?, ?, ?, ?, ?)",
+                                (url, fetched_at, content_hash, os.path.getsize(blob_path), int(complete)))
+            self._index.commit()
+
+        self.evict()
+        return content_hash
+
+    def size(self):
+        """
+        Size of the compressed pages on disk.
+
+        Returns:
+        - int: Bytes of the distinct blobs.
+        """
+        with self._lock:
+            return self._index.execute(
+                "SELECT COALESCE(SUM(compressed_size), 0) FROM (SELECT DISTINCT content_hash, compressed_size FROM page_fetch)"
+            ).fetchone()[0]
+
+    def evict(self):
+        """
+        Drop the oldest fetches until the blobs fit in max_bytes, and delete the blobs no fetch refers to.
+
+        Returns:
+        - int: Number of fetches evicted.
+        """
+        import os
+
+        evicted_count = 0
+        with self._lock:
+            blob_sizes = dict(self._index.execute("SELECT DISTINCT content_hash, compressed_size FROM page_fetch"))
+            total_bytes = sum(blob_sizes.values())
+            if total_bytes <= self.max_bytes:
+                return 0
+
+            fetches = self._index.execute("SELECT rowid, content_hash FROM page_fetch ORDER BY fetched_at").fetchall()
+            references = {}
+            for _, content_hash in fetches:
+                references[content_hash] = references.get(content_hash, 0) + 1
+
+            evicted_rowids = []
+            orphan_hashes = []
+            for rowid, content_hash in fetches:
+                if total_bytes <= self.max_bytes:
+                    break
+                evicted_rowids.append((rowid,))
+                references[content_hash] -= 1
+                if references[content_hash] == 0:
+                    orphan_hashes.append(content_hash)
+                    total_bytes -= blob_sizes[content_hash]
+
+            self._index.executemany("DELETE FROM page_fetch WHERE rowid = ?", evicted_rowids)
+            self._index.commit()
+            evicted_count = len(evicted_rowids)
+
+        for content_hash in orphan_hashes:
+            try:
+                os.remove(self._blob_path(content_hash))
+            except FileNotFoundError:
+                pass
+
+        return evicted_count
+
+    def close(self):
+        """
+        Close the index.
+
+        Returns:
+        - None
+        """
+        with self._lock:
+            self._index.close()
+
+# Example usage:
+# page_cache = RawPageCache(ttl=3600)
+# page_cache.put(url, driver.page_source, complete=ready)
+# page_source = page_cache.get(url)
+# replay_cache = RawPageCache(replay=True)
@@ -0,0 +1,194 @@
+"""
+
+Readiness waits for the tracking page: instead of a fixed implicit wait, poll until every
+reference of the chunk has been answered (a pb-shipment container or a not-found marker), or
+until the results rendered so far have settled, with a deadline that follows the latencies
+observed during the run.
+
+Classes:
+- AdaptiveDeadline
+
+Functions:
+- requested_references
+- expected_result_count
+- count_rendered_results
+- wait_for_results
+
+"""
+
+
+# Elements counted as one answered reference: the pb-shipment container of the field selectors (SHIPMENT_FIELD_SELECTORS),
+# or the marker shown for an unknown number. The marker name is not confirmed on a captured page; without it, a chunk
+# with unknown numbers still stops waiting once its other results have settled (PAGE_SETTLE_SECONDS)
+READINESS_SELECTOR = "pb-search-results pb-shipment, pb-search-results pb-shipment-not-found"
+
+# Seconds the count of rendered results must stay unchanged (and above zero) for the page to be read without them all
+PAGE_SETTLE_SECONDS = 1.0
+
+
+
+class AdaptiveDeadline:
+    """
+    Page readiness deadline that adapts to the latencies observed during the run.
+
+    Until `min_samples` pages have been timed the deadline is `initial_timeout`. Then it is
+    the `percentile` of the last `window` latencies times `margin`, kept between
+    `min_timeout` and `max_timeout`. Waits that ran into the deadline are recorded too, capped
+    at that deadline, so a run of slow pages keeps the deadline from shrinking below them.
+    Thread-safe, shared by all the workers of a pool.
+
+    Args:
+    - initial_timeout (float): Deadline in seconds before enough latencies are known.
+    - percentile (float): Percentile of the observed latencies the deadline follows (0-1).
+    - margin (float): Factor applied to that percentile.
+    - min_timeout (float): Lowest deadline in seconds.
+    - max_timeout (float): Highest deadline in seconds.
+    - window (int): Number of recent latencies kept.
+    - min_samples (int): Number of latencies needed before adapting.
+    """
+
+    def __init__(self, initial_timeout=8.0, percentile=0.95, margin=1.5, min_timeout=2.0, max_timeout=30.0, window=200, min_samples=5):
+        import threading
+        from collections import deque
+
+        self.initial_timeout = initial_timeout
+        self.percentile = percentile
+        self.margin = margin
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        """
+        Record how long a page took to be ready (the deadline, for a wait that timed out).
+
+        Args:
+        - seconds (float): Observed latency.
+
+        Returns:
+        - None
+        """
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def timeout(self):
+        """
+        Current deadline for the next page.
+
+        Returns:
+        - float: Seconds to wait at most for the page to be ready.
+        """
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return self.initial_timeout
+            latencies = sorted(self._latencies)
+
+        position = min(len(latencies) - 1, int(self.percentile * len(latencies)))
+        return min(self.max_timeout, max(self.min_timeout, latencies[position] * self.margin))
+
+# Example usage:
+# page_deadline = AdaptiveDeadline()
+# timeout = page_deadline.timeout()
+# ready, waited = wait_for_results(driver, 30, timeout)
+# page_deadline.record(min(waited, timeout))
+
+
+
+def requested_references(url):
+    """
+    List the shipment numbers requested by a tracking URL.
+
+    Args:
+    - url (str): Tracking URL built by create_chunked_urls.
+
+    Returns:
+    - list: Shipment numbers of the `cons` parameter.
+    """
+    from urllib.parse import urlparse, parse_qs
+
+    references = parse_qs(urlparse(url).query).get("cons", [""])[0]
+    return [ref for ref in references.split(",") if ref]
+
+# Example usage:
+# references = requested_references(url_list[0])
+
+
+
+def expected_result_count(url):
+    """
+    Count the shipment numbers requested by a tracking URL.
+
+    Args:
+    - url (str): Tracking URL built by create_chunked_urls.
+
+    Returns:
+    - int: Number of references in the `cons` parameter (1 if the URL has none).
+    """
+    return max(1, len(requested_references(url)))
+
+# Example usage:
+# expected_count = expected_result_count(url_list[0])
+
+
+
+def count_rendered_results(driver):
+    """
+    Count the references of the page already answered (rendered shipments and not-found markers).
+
+    Args:
+    - driver (WebDriver): Session with the tracking page loaded.
+
+    Returns:
+    - int: Number of answered references.
+    """
+    # "css selector" is selenium's By.CSS_SELECTOR, written out to avoid importing selenium here
+    return len(driver.find_elements("css selector", READINESS_SELECTOR))
+
+# Example usage:
+# rendered = count_rendered_results(driver)
+
+
+
+def wait_for_results(driver, expected_count, timeout, poll_interval=0.1, settle_time=PAGE_SETTLE_SECONDS):
+    """
+    Wait until the page shows an answer for every requested reference, or the deadline passes.
+
+    A page that shows some results but not all of them stops the wait once their count has
+    not changed for settle_time seconds: the references still missing are unknown to TNT (or
+    picked up again by review_structure_scraped), and waiting for the deadline would not
+    bring them.
+
+    Args:
+    - driver (WebDriver): Session that just loaded the tracking URL.
+    - expected_count (int): Number of references requested by the URL.
+    - timeout (float): Maximum seconds to wait.
+    - poll_interval (float): Seconds between two checks.
+    - settle_time (float): Seconds the count of rendered results must stay unchanged to stop waiting early.
+
+    Returns:
+    - bool: True if every reference was answered, or the results settled, before the deadline.
+    - float: Seconds waited.
+    """
+    import time
+
+    start_time = time.monotonic()
+    rendered_count, changed_at = 0, start_time
+    while True:
+        now = time.monotonic()
+        count = count_rendered_results(driver)
+        if count >= expected_count:
+            return True, now - start_time
+        if count != rendered_count:
+            rendered_count, changed_at = count, now
+        elif count > 0 and now - changed_at >= settle_time:
+            return True, now - start_time
+
+        waited = now - start_time
+        if waited >= timeout:
+            return False, waited
+        time.sleep(min(poll_interval, timeout - waited))
+
+# Example usage:
+# ready, waited = wait_for_results(driver, expected_result_count(url), timeout=8)
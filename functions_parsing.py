@@ -0,0 +1,320 @@
+"""
+
+Functions:
+- compile_selector
+- parse_search_results
+- extract_shipment_record
+- extract_shipment_events
+- parse_page_records
+- parse_pages
+- iter_parsed_pages
+
+"""
+
+
+# Parser backends accepted by BeautifulSoup for the scoped parse
+HTML_PARSERS = ("html.parser", "lxml")
+
+# Selector of the shipment divs on the full page
+PAGE_SHIPMENT_DIVS_SELECTOR = 'body > div.contentPageFullWidth.newBase.page.basicpage > div:nth-child(1) > div > pb-root > div > div > div > pb-track-trace > pb-search-results > div.__u-mb--xl'
+
+# Selector of the same divs once only the pb-search-results subtree is parsed
+SCOPED_SHIPMENT_DIVS_SELECTOR = 'pb-search-results > div.__u-mb--xl'
+
+# Field selectors, relative to each shipment container
+SHIPMENT_FIELD_SELECTORS = {
+    "Client Reference": 'pb-shipment-reference div dl dd:nth-child(4)',
+    "Shipment Number": 'pb-shipment-reference div dl dd:nth-child(2)',
+    "TNT Status": 'pb-shipment div div.__c-shipment__details sham-shipment-status-tnt > div > div.__c-shipment-status-tnt__summary > sham-step-label',
+    "Shipment Origin Date": 'pb-shipment div div.__c-shipment__details sham-shipment-addresses > div > div.__c-shipment-address.__c-shipment-address--from > div.__c-shipment-address__text > div:nth-child(3) > sham-shipment-origin-date',
+    "Shipment Destination": 'pb-shipment div div.__c-shipment__details sham-shipment-addresses > div > div.__c-shipment-address.__c-shipment-address--to > div:nth-child(2) > div.__c-heading.__c-heading--h4.__c-heading--bold.__u-mb--none',
+    "Last Update": 'pb-shipment div div.__c-shipment__history.__u-print-only sham-shipment-history > table > tbody > tr:nth-child(1) > td.__c-shipment-history__date',
+    "Last Location": 'pb-shipment div div.__c-shipment__history.__u-print-only sham-shipment-history > table > tbody > tr:nth-child(1) > td.__u-hide--small-medium',
+    "Last Action": 'pb-shipment div div.__c-shipment__history sham-shipment-history > table > tbody > tr:nth-child(1) > td:nth-child(3)',
+    "Warning Badge": '.__c-badge.__c-badge--warning',
+}
+
+# Rows of the shipment history table (one per event, latest first), and the cells of each row
+SHIPMENT_HISTORY_ROWS_SELECTOR = 'pb-shipment div div.__c-shipment__history.__u-print-only sham-shipment-history > table > tbody > tr'
+HISTORY_CELL_SELECTORS = {
+    "Event Time": 'td.__c-shipment-history__date',
+    "Location": 'td.__u-hide--small-medium',
+    "Action": 'td:nth-child(3)',
+}
+
+# Below this number of pages, parse_pages parses in the current process (starting workers costs more)
+MIN_PAGES_FOR_PROCESS_POOL = 16
+
+# Compiled selectors, filled on first use by compile_selector
+_COMPILED_SELECTORS = {}
+
+
+
+def compile_selector(css_selector):
+    """
+    Compile a CSS selector once and reuse it for every page and shipment.
+
+    Args:
+    - css_selector (str): CSS selector.
+
+    Returns:
+    - soupsieve.SoupSieve: Compiled selector (use .select / .select_one on a BeautifulSoup element).
+    """
+    import soupsieve
+
+    compiled = _COMPILED_SELECTORS.get(css_selector)
+    if compiled is None:
+        compiled = _COMPILED_SELECTORS[css_selector] = soupsieve.compile(css_selector)
+    return compiled
+
+# Example usage:
+# shipment_number = compile_selector(SHIPMENT_FIELD_SELECTORS["Shipment Number"]).select_one(div)
+
+
+
+def parse_search_results(page_source, parser="html.parser", scoped=True):
+    """
+    Parse a tracking page and select its shipment divs.
+
+    With scoped=True only the pb-search-results subtree is built, which skips the
+    header, scripts and footer of the page.
+
+    Args:
+    - page_source (str): HTML of the tracking page.
+    - parser (str): BeautifulSoup parser backend ("html.parser" or "lxml").
+    - scoped (bool): Build only the pb-search-results subtree instead of the whole page.
+
+    Returns:
+    - list: BeautifulSoup elements with the shipment divs of the page.
+    """
+    from bs4 import BeautifulSoup, SoupStrainer
+
+    if parser not in HTML_PARSERS:
+        raise ValueError(f"Unknown parser '{parser}', expected one of {HTML_PARSERS}.")
+
+    if scoped:
+        soup = BeautifulSoup(page_source, parser, parse_only=SoupStrainer("pb-search-results"))
+        return compile_selector(SCOPED_SHIPMENT_DIVS_SELECTOR).select(soup)
+
+    soup = BeautifulSoup(page_source, parser)
+    return compile_selector(PAGE_SHIPMENT_DIVS_SELECTOR).select(soup)
+
+# Example usage:
+# shipment_divs = parse_search_results(driver.page_source, parser="lxml")
+
+
+
+def extract_shipment_record(div, client_reference_prefix="DSD/"):
+    """
+    Extract the report fields of one shipment container with the compiled field selectors.
+
+    Args:
+    - div (bs4.element.Tag): Shipment container.
+    - client_reference_prefix (str): Only shipments whose client reference starts with this prefix are extracted.
+
+    Returns:
+    - dict: Shipment record, or None if the client reference does not match.
+    """
+
+    def field_text(field):
+        element = compile_selector(SHIPMENT_FIELD_SELECTORS[field]).select_one(div)
+        return element.get_text(strip=True) if element else None
+
+    # Extract client reference for each shipment
+    client_reference = field_text("Client Reference")
+    if client_reference is None or not client_reference.startswith(client_reference_prefix):
+        return None
+
+    # Extract Action Message
+    last_action_text = field_text("Last Action")
+    if last_action_text is not None and "-" in last_action_text:
+        _, last_action = last_action_text.split("-", 1)
+    else:
+        last_action = last_action_text
+
+    # Check for warning badge and determine if it's a warning
+    warning_badge = "EXCEPTION ALERT" if compile_selector(SHIPMENT_FIELD_SELECTORS["Warning Badge"]).select_one(div) else " "
+
+    return {
+        "Client Reference": client_reference,
+        "Shipment Number": field_text("Shipment Number"),
+        "TNT Status": field_text("TNT Status"),
+        "Shipment Origin Date": field_text("Shipment Origin Date"),
+        "Shipment Destination": field_text("Shipment Destination"),
+        "Last Update": field_text("Last Update"),
+        "Last Location": field_text("Last Location"),
+        "Last Action": last_action,
+        "TNT Exception Notification": warning_badge
+    }
+
+# Example usage:
+# record = extract_shipment_record(div)
+
+
+
+def extract_shipment_events(div, shipment_number, client_reference=None):
+    """
+    Extract every row of the history table of one shipment container, not only the latest one.
+
+    Args:
+    - div (bs4.element.Tag): Shipment container.
+    - shipment_number (str): Shipment number of the container.
+    - client_reference (str, optional): Client reference of the container.
+
+    Returns:
+    - list: One (Shipment Number, Client Reference, Event Time, Location, Action) tuple per history row, latest
+      first; the event time is the text shown on the page ("20/10/23 8:55").
+    """
+    events = []
+    for row in compile_selector(SHIPMENT_HISTORY_ROWS_SELECTOR).select(div):
+        cells = {field: compile_selector(selector).select_one(row) for field, selector in HISTORY_CELL_SELECTORS.items()}
+        event_time, location, action = (cells[field].get_text(strip=True) if cells[field] else None
+                                        for field in ("Event Time", "Location", "Action"))
+
+        # Action text after the dash, as "Last Action" in the report (which keeps its leading space, as earlier reports)
+        if action is not None and "-" in action:
+            action = action.split("-", 1)[1].strip()
+
+        events.append((shipment_number, client_reference, event_time, location, action))
+
+    return events
+
+# Example usage:
+# events = extract_shipment_events(div, "607252040", "DSD/825180")
+
+
+
+def parse_page_records(page_source, parser="html.parser", client_reference_prefix="DSD/", events=False):
+    """
+    Parse one raw tracking page into record tuples (runs in the parse worker processes).
+
+    Shipments whose client reference does not match only carry their client reference and
+    shipment number, the other fields are None.
+
+    Args:
+    - page_source (str): HTML of the tracking page.
+    - parser (str): BeautifulSoup parser backend ("html.parser" or "lxml").
+    - client_reference_prefix (str): Prefix of the shipments extracted in full.
+    - events (bool): Also extract the full history of the shipments extracted in full (extract_shipment_events).
+
+    Returns:
+    - list: One tuple per shipment of the page, in page order, with the scrape_shipment_data columns.
+    - list: Only if events is True, the history event tuples of the page.
+    """
+    from functions_web_scraping import SHIPMENT_COLUMNS
+
+    shipment_number_selector = compile_selector(SHIPMENT_FIELD_SELECTORS["Shipment Number"])
+    client_reference_selector = compile_selector(SHIPMENT_FIELD_SELECTORS["Client Reference"])
+    foreign_padding = (None,) * (len(SHIPMENT_COLUMNS) - 2)
+
+    page_records = []
+    page_events = []
+    # Each selected div holds the shipment containers, as in scrape_shipment_data
+    for shipment_divs in parse_search_results(page_source, parser=parser):
+        for div in shipment_divs:
+            record = extract_shipment_record(div, client_reference_prefix=client_reference_prefix)
+            if record is not None:
+                page_records.append(tuple(record[column] for column in SHIPMENT_COLUMNS))
+                if events:
+                    page_events.extend(extract_shipment_events(div, record["Shipment Number"], record["Client Reference"]))
+                continue
+
+            shipment_number_element = shipment_number_selector.select_one(div)
+            if shipment_number_element is not None:
+                client_reference_element = client_reference_selector.select_one(div)
+                client_reference = client_reference_element.get_text(strip=True) if client_reference_element else None
+                page_records.append((client_reference, shipment_number_element.get_text(strip=True)) + foreign_padding)
+
+    if events:
+        return page_records, page_events
+    return page_records
+
+# Example usage:
+# page_records = parse_page_records(driver.page_source)
+
+
+
+def parse_pages(page_sources, parser="html.parser", client_reference_prefix="DSD/", max_processes=None, min_pages_for_pool=MIN_PAGES_FOR_PROCESS_POOL):
+    """
+    Parse raw tracking pages into record tuples, in a process pool when there are enough pages.
+
+    Only the HTML strings and the record tuples cross the process boundary, never the soup trees.
+
+    Args:
+    - page_sources (list): HTML of the tracking pages.
+    - parser (str): BeautifulSoup parser backend ("html.parser" or "lxml").
+    - client_reference_prefix (str): Prefix of the shipments extracted in full.
+    - max_processes (int, optional): Number of parse processes. Defaults to the number of CPUs; 1 parses in the current process.
+    - min_pages_for_pool (int): Below this number of pages, parse in the current process.
+
+    Returns:
+    - list: One list of record tuples per page, in page_sources order.
+    """
+    import os
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    processes = min(max_processes or os.cpu_count() or 1, len(page_sources))
+    if processes <= 1 or len(page_sources) < min_pages_for_pool:
+        return [parse_page_records(page_source, parser, client_reference_prefix) for page_source in page_sources]
+
+    # A few batches per process to balance the load; map returns them in page order
+    chunksize = max(1, len(page_sources) // (processes * 4))
+    # Spawned workers, as in iter_parsed_pages: the caller may hold browser or scraping threads that must not be forked
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return list(executor.map(parse_page_records, page_sources, [parser] * len(page_sources),
+                                 [client_reference_prefix] * len(page_sources), chunksize=chunksize))
+
+# Example usage:
+# page_records = parse_pages(page_sources, parser="lxml")
+
+
+
+def iter_parsed_pages(page_sources, parser="html.parser", client_reference_prefix="DSD/", max_processes=None, expected_pages=None, min_pages_for_pool=MIN_PAGES_FOR_PROCESS_POOL, events=False):
+    """
+    Parse raw tracking pages into record tuples as they arrive, one page at a time.
+
+    Each page tree is dropped as soon as its records are extracted. With a process pool, at
+    most two pages per process wait to be parsed, so the raw pages held in memory do not
+    grow with the length of page_sources.
+
+    Args:
+    - page_sources (iterable): HTML of the tracking pages, typically a generator over the pages being scraped.
+    - parser (str): BeautifulSoup parser backend ("html.parser" or "lxml").
+    - client_reference_prefix (str): Prefix of the shipments extracted in full.
+    - max_processes (int, optional): Number of parse processes. Defaults to the number of CPUs; 1 parses in the current process.
+    - expected_pages (int, optional): Number of pages page_sources will give. Below min_pages_for_pool, parse in the current process.
+    - min_pages_for_pool (int): Smallest expected_pages parsed in a process pool.
+    - events (bool): Also extract the history events of each page.
+
+    Returns:
+    - generator: One list of record tuples per page, in page_sources order ((records, events) pairs if events is True).
+    """
+    import os
+    import multiprocessing
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+
+    processes = max_processes or os.cpu_count() or 1
+    if expected_pages is not None:
+        processes = min(processes, expected_pages)
+
+    if processes <= 1 or (expected_pages is not None and expected_pages < min_pages_for_pool):
+        for page_source in page_sources:
+            yield parse_page_records(page_source, parser, client_reference_prefix, events)
+        return
+
+    # Spawned workers: the scraping threads are already running, forking them is not safe
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as executor:
+        for page_source in page_sources:
+            if len(pending) >= 2 * processes:
+                yield pending.popleft().result()
+            pending.append(executor.submit(parse_page_records, page_source, parser, client_reference_prefix, events))
+
+        while pending:
+            yield pending.popleft().result()
+
+# Example usage:
+# for page_records in iter_parsed_pages(page_sources, expected_pages=len(url_list)):
+#     collector.add_page(page_records)
@@ -0,0 +1,167 @@
+"""
+
+Streaming scrape-to-record pipeline: each tracking page is loaded, parsed into record tuples
+and dropped before the next ones, so the memory of a run stays flat as the number of chunk
+URLs grows. The DataFrame is built once, at the end.
+
+Classes:
+- ShipmentRecordCollector
+
+Functions:
+- stream_shipment_records
+
+"""
+
+
+
+class ShipmentRecordCollector:
+    """
+    Compact state carried forward by the pipeline, filled page by page.
+
+    Only the record tuples of the shipments kept in the report (`records`), the client
+    reference of every parsed shipment (`client_references`) and the set of shipment
+    numbers found (`found_numbers`) are kept; no page HTML or parse tree outlives its page.
+    With keep_events, the history event tuples of the report shipments are kept too (`events`).
+
+    Args:
+    - keep_events (bool): Extract and keep the full shipment history of every page.
+    - client_reference_prefix (str, optional): Prefix of the shipments kept in the report. Defaults to
+      CLIENT_REFERENCE_PREFIX; "" keeps every shipment with a client reference (routed reports).
+    """
+
+    __slots__ = ("records", "client_references", "found_numbers", "parsed_count", "events", "client_reference_prefix")
+
+    def __init__(self, keep_events=False, client_reference_prefix=None):
+        from functions_web_scraping import CLIENT_REFERENCE_PREFIX
+
+        self.records = []
+        self.client_references = {}
+        self.found_numbers = set()
+        self.parsed_count = 0
+        self.events = [] if keep_events else None
+        self.client_reference_prefix = CLIENT_REFERENCE_PREFIX if client_reference_prefix is None else client_reference_prefix
+
+    def add_page(self, page_records, page_events=None):
+        """
+        Add the record tuples of one page.
+
+        Args:
+        - page_records (list): Record tuples of the page (parse_page_records output).
+        - page_events (list, optional): History event tuples of the page, kept if the collector keeps events.
+
+        Returns:
+        - None
+        """
+        for record in page_records:
+            client_reference, shipment_number = record[0], record[1]
+            self.found_numbers.add(shipment_number)
+            self.client_references[shipment_number] = client_reference
+            if client_reference is not None and client_reference.startswith(self.client_reference_prefix):
+                self.records.append(record)
+
+        self.parsed_count += len(page_records)
+        if page_events and self.events is not None:
+            self.events.extend(page_events)
+
+    def to_dataframe(self, metrics=None):
+        """
+        Build the scrape_shipment_data DataFrame from the records kept.
+
+        Args:
+        - metrics (RunMetrics, optional): Counts the shipments parsed and the records kept.
+
+        Returns:
+        - pd.DataFrame: DataFrame with scraped shipment data.
+        """
+        import pandas as pd
+        from functions_metrics import NullMetrics
+        from functions_web_scraping import SHIPMENT_COLUMNS
+
+        if metrics is None:
+            metrics = NullMetrics()
+
+        metrics.increment("shipments_parsed", self.parsed_count)
+        metrics.increment("shipments_kept", len(self.records))
+
+        return pd.DataFrame(self.records, columns=SHIPMENT_COLUMNS)
+
+# Example usage:
+# collector = stream_shipment_records(url_list, chromedriver_path)
+# df = collector.to_dataframe()
+
+
+
+def stream_shipment_records(url_list, chromedriver_path, driver_pool=None, collector=None, max_workers=1, max_in_flight=None, min_request_interval=0.0, html_parser="html.parser", metrics=None, parse_processes=None):
+    """
+    Scrape the chunk URLs and parse every page into the collector as soon as it is loaded.
+
+    Args:
+    - url_list (list): List of URLs to scrape.
+    - chromedriver_path (str): Path to the ChromeDriver executable.
+    - driver_pool (ChromeDriverPool, optional): Pool of browser sessions to reuse. If None, a pool is created for this call and closed at the end.
+    - collector (ShipmentRecordCollector, optional): Collector to add the records to (and the history events, if it
+      keeps them). Defaults to a new one.
+    - max_workers (int): Number of browser workers. 1 scrapes the URLs one at a time.
+    - max_in_flight (int, optional): Maximum number of pages loaded ahead of the parsing. Defaults to 2 * max_workers.
+    - min_request_interval (float): Minimum seconds between two page loads of the same worker.
+    - html_parser (str): BeautifulSoup parser backend ("html.parser" or "lxml").
+    - metrics (RunMetrics, optional): Records the chunk fetches (spans, latency histogram, page counters).
+    - parse_processes (int, optional): Number of processes parsing the pages (defaults to the number of CPUs,
+      1 parses in this process). Runs with few pages are always parsed in this process.
+
+    Returns:
+    - ShipmentRecordCollector: Collector with the records of the loaded pages.
+    """
+
+    from functions_reporting import report
+    import time
+    from functions_driver_pool import ChromeDriverPool
+    from functions_parsing import iter_parsed_pages
+    from functions_web_scraping import iter_scraped_pages
+
+    if collector is None:
+        collector = ShipmentRecordCollector()
+
+    # Reuse the caller's browser sessions, or open a pool for this call only
+    owns_pool = driver_pool is None
+    if owns_pool:
+        driver_pool = ChromeDriverPool(chromedriver_path)
+
+    def loaded_pages():
+        for page_source in iter_scraped_pages(url_list, driver_pool, max_workers=max_workers, max_in_flight=max_in_flight,
+                                              min_request_interval=min_request_interval, html_parser=html_parser,
+                                              metrics=metrics, parse=False):
+            if isinstance(page_source, Exception):
+                # Missing references are picked up again by review_structure_scraped
+                report(f"--> Could not load chunk URL ({type(page_source).__name__}), skipping it.")
+                continue
+            yield page_source
+
+    # Start the timer
+    start_time = time.time()
+
+    # The history events are extracted in the same parse as the records
+    keep_events = collector.events is not None
+
+    try:
+        for parsed_page in iter_parsed_pages(loaded_pages(), parser=html_parser, client_reference_prefix=collector.client_reference_prefix,
+                                             max_processes=parse_processes, expected_pages=len(url_list), events=keep_events):
+            if keep_events:
+                collector.add_page(*parsed_page)
+            else:
+                collector.add_page(parsed_page)
+    finally:
+        if owns_pool:
+            driver_pool.close()
+
+    # Calculate and display the elapsed time
+    elapsed_time = time.time() - start_time
+    report(f"--> Elapsed time scraping data: **{elapsed_time:.2f} seconds**")
+
+    return collector
+
+# Example usage:
+# with ChromeDriverPool(chromedriver_path) as driver_pool:
+#     collector = stream_shipment_records(url_list, chromedriver_path, driver_pool=driver_pool, max_workers=4)
+#     collector = review_structure_scraped(unique_references, collector, url_list, chromedriver_path, driver_pool=driver_pool, records=True)
+# df = collector.to_dataframe()
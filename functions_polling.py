@@ -0,0 +1,511 @@
+"""
+
+Long-running tracker: every open shipment is refreshed on its own schedule, by risk,
+instead of scraping the whole Excel list in one batch.
+
+Classes:
+- RequestBudget
+- ShipmentPollScheduler
+
+Functions:
+- poll_interval_for
+- fetch_chunk_states
+- run_polling_daemon
+
+"""
+
+
+# Seconds between two polls of a shipment, by priority (delivered shipments are never polled again)
+POLL_INTERVALS = {
+    0: 30 * 60,       # EXCEPTION ALERT badge, or not returned by the last poll
+    1: 2 * 60 * 60,   # In transit for HIGH_PROCESSING_DAYS or more
+    2: 8 * 60 * 60,   # Quiet, in transit
+}
+
+# Processing days from which an in-transit shipment is polled more often
+HIGH_PROCESSING_DAYS = 7
+
+# A shipment TNT does not return is polled again after POLL_INTERVALS[0], doubled after every empty poll up to this
+NOT_RETURNED_MAX_INTERVAL = 24 * 60 * 60
+
+
+
+def poll_interval_for(record, now):
+    """
+    Choose the priority of a shipment from its last scraped state.
+
+    Args:
+    - record (dict): Shipment record (scrape_shipment_data columns), or None if the shipment was not returned.
+    - now (float): Current time (Unix seconds).
+
+    Returns:
+    - int: Priority (key of POLL_INTERVALS), or None if the shipment must not be polled again.
+    """
+    import pandas as pd
+    from functions_process_df import parse_spanish_date
+    from functions_state_store import DELIVERED_TNT_STATUS
+
+    if record is None or record["TNT Exception Notification"] == "EXCEPTION ALERT":
+        return 0
+
+    if record["TNT Status"] == DELIVERED_TNT_STATUS:
+        return None
+
+    origin_date = parse_spanish_date(record["Shipment Origin Date"])
+    if pd.notna(origin_date):
+        processing_days = (pd.Timestamp.fromtimestamp(now) - origin_date).days
+        if processing_days >= HIGH_PROCESSING_DAYS:
+            return 1
+
+    return 2
+
+# Example usage:
+# priority = poll_interval_for(record, time.time())
+
+
+
+class RequestBudget:
+    """
+    Global budget of chunk requests over a sliding window, shared by every poll cycle.
+
+    Args:
+    - max_requests (int): Maximum number of chunk requests in the window.
+    - window (float): Window length in seconds.
+    """
+
+    def __init__(self, max_requests=120, window=3600):
+        from collections import deque
+
+        self.max_requests = max_requests
+        self.window = window
+        self._request_times = deque()
+
+    def _forget_old(self, now):
+        while self._request_times and self._request_times[0] <= now - self.window:
+            self._request_times.popleft()
+
+    def remaining(self, now):
+        """
+        Number of chunk requests still allowed now.
+
+        Args:
+        - now (float): Current time (Unix seconds).
+
+        Returns:
+        - int: Requests left in the current window.
+        """
+        self._forget_old(now)
+        return self.max_requests - len(self._request_times)
+
+    def spend(self, now):
+        """
+        Record one chunk request.
+
+        Args:
+        - now (float): Time of the request (Unix seconds).
+
+        Returns:
+        - None
+        """
+        self._request_times.append(now)
+
+    def next_slot_at(self, now):
+        """
+        Time at which the next request will be allowed.
+
+        Args:
+        - now (float): Current time (Unix seconds).
+
+        Returns:
+        - float: Unix seconds (now if the budget is not exhausted).
+        """
+        if self.remaining(now) > 0:
+            return now
+        return self._request_times[0] + self.window
+
+# Example usage:
+# budget = RequestBudget(max_requests=120)
+# if budget.remaining(time.time()) > 0: budget.spend(time.time())
+
+
+
+class ShipmentPollScheduler:
+    """
+    Priority queue of the shipments to poll, persisted in the poll_schedule table of the state store.
+
+    Each shipment has a next poll time and a priority (see POLL_INTERVALS). Due shipments
+    are taken by priority, then by how long they are overdue, and grouped into chunks of
+    `chunk_size` references; a chunk that is not full is completed with the shipments due
+    within `fill_ahead` seconds, so requests are not wasted. Shipments TNT does not return
+    are backed off (see NOT_RETURNED_MAX_INTERVAL) instead of being polled as urgent forever.
+
+    Args:
+    - connection (sqlite3.Connection): Open state store (open_state_store).
+    - chunk_size (int): Maximum number of references per chunk (30 is the TNT tracker limit).
+    - fill_ahead (float): Seconds ahead to look for shipments to complete a partial chunk.
+    """
+
+    def __init__(self, connection, chunk_size=30, fill_ahead=15 * 60):
+        import heapq
+
+        self.connection = connection
+        self.chunk_size = chunk_size
+        self.fill_ahead = fill_ahead
+
+        # (next_poll_at, priority) of every scheduled shipment; heap entries not matching it are stale
+        self._schedule = {}
+        # Consecutive polls that did not return the shipment (only the ones above 0)
+        self._empty_polls = {}
+        for shipment_number, next_poll_at, priority, empty_polls in connection.execute(
+                "SELECT shipment_number, next_poll_at, priority, empty_polls FROM poll_schedule"):
+            self._schedule[shipment_number] = (next_poll_at, priority)
+            if empty_polls:
+                self._empty_polls[shipment_number] = empty_polls
+        self._heap = [(next_poll_at, priority, number) for number, (next_poll_at, priority) in self._schedule.items()]
+        heapq.heapify(self._heap)
+
+    def __len__(self):
+        return len(self._schedule)
+
+    def _save(self, rows, removed_numbers=()):
+        self.connection.executemany("""
+            INSERT INTO poll_schedule (shipment_number, next_poll_at, priority, empty_polls) VALUES (?, ?, ?, ?)
+            ON CONFLICT(shipment_number) DO UPDATE SET
+                next_poll_at = excluded.next_poll_at,
+                priority = excluded.priority,
+                empty_polls = excluded.empty_polls
+        """, rows)
+        self.connection.executemany("DELETE FROM poll_schedule WHERE shipment_number = ?",
+                                    [(number,) for number in removed_numbers])
+        self.connection.commit()
+
+    def _push(self, shipment_number, next_poll_at, priority):
+        import heapq
+
+        self._schedule[shipment_number] = (next_poll_at, priority)
+        heapq.heappush(self._heap, (next_poll_at, priority, shipment_number))
+
+    def add_references(self, references, now):
+        """
+        Schedule the shipments not in the queue yet, due immediately.
+
+        Args:
+        - references (iterable): Shipment numbers to track.
+        - now (float): Current time (Unix seconds).
+
+        Returns:
+        - int: Number of shipments added.
+        """
+        rows = []
+        for shipment_number in map(str, references):
+            if shipment_number not in self._schedule:
+                self._push(shipment_number, now, 0)
+                rows.append((shipment_number, now, 0, 0))
+        self._save(rows)
+        return len(rows)
+
+    def retain_references(self, references):
+        """
+        Stop polling the shipments that are not in `references` (e.g. removed from the Excel file).
+
+        Args:
+        - references (iterable): Shipment numbers still tracked.
+
+        Returns:
+        - int: Number of shipments dropped.
+        """
+        listed_numbers = set(map(str, references))
+        removed_numbers = [number for number in self._schedule if number not in listed_numbers]
+        for number in removed_numbers:
+            del self._schedule[number]
+            self._empty_polls.pop(number, None)
+        self._save([], removed_numbers)
+        return len(removed_numbers)
+
+    def next_due_at(self):
+        """
+        Time of the next scheduled poll.
+
+        Returns:
+        - float: Unix seconds, or None if the queue is empty.
+        """
+        import heapq
+
+        # Drop stale heap entries left by reschedules
+        while self._heap and self._schedule.get(self._heap[0][2]) != self._heap[0][:2]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due_chunks(self, now, max_chunks):
+        """
+        Take the due shipments, highest priority first (then the longest overdue), grouped in chunks.
+
+        Args:
+        - now (float): Current time (Unix seconds).
+        - max_chunks (int): Maximum number of chunks (remaining request budget).
+
+        Returns:
+        - list: Chunks (sorted lists of shipment numbers). Their shipments stay scheduled until `reschedule`.
+        """
+        import heapq
+
+        max_references = max_chunks * self.chunk_size
+
+        # Every due shipment, stale heap entries dropped
+        popped = []
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if self._schedule.get(entry[2]) == entry[:2]:
+                popped.append(entry)
+
+        # Under budget pressure, an exception shipment goes before a quiet one that was due earlier
+        due = sorted(popped, key=lambda entry: (entry[1], entry[0]))
+        taken = [shipment_number for _, _, shipment_number in due[:max_references]]
+
+        # Complete a partial chunk with shipments due soon
+        while taken and len(taken) % self.chunk_size != 0 and self._heap and self._heap[0][0] <= now + self.fill_ahead:
+            entry = heapq.heappop(self._heap)
+            if self._schedule.get(entry[2]) == entry[:2]:
+                popped.append(entry)
+                taken.append(entry[2])
+
+        # Keep the popped entries in the heap: the shipments are only moved by reschedule
+        for entry in popped:
+            heapq.heappush(self._heap, entry)
+
+        return [sorted(taken[i:i + self.chunk_size]) for i in range(0, len(taken), self.chunk_size)]
+
+    def reschedule(self, chunk, records_by_number, client_references, now, fetch_failed=False):
+        """
+        Plan the next poll of every shipment of a polled chunk from its fresh state.
+
+        Args:
+        - chunk (list): Shipment numbers that were requested.
+        - records_by_number (dict): Fresh records of the matching shipments, keyed by shipment number.
+        - client_references (dict): Client reference of every returned shipment, keyed by shipment number.
+        - now (float): Time of the poll (Unix seconds).
+        - fetch_failed (bool): The chunk request failed: every shipment is retried with the urgent interval,
+          without counting as not returned.
+
+        Returns:
+        - dict: Number of shipments rescheduled per priority, "not returned" for the backed-off ones, and
+          "stopped" for the ones no longer polled.
+        """
+        rows = []
+        removed_numbers = []
+        counts = {}
+
+        for shipment_number in chunk:
+            empty_polls = 0
+            if fetch_failed:
+                priority, interval = 0, POLL_INTERVALS[0]
+                empty_polls = self._empty_polls.get(shipment_number, 0)
+                count_key = 0
+            elif shipment_number not in client_references:
+                # Not returned by TNT (unknown or not yet registered): poll again less and less often
+                empty_polls = self._empty_polls.get(shipment_number, 0) + 1
+                priority = 0 if empty_polls == 1 else 2
+                interval = min(POLL_INTERVALS[0] * 2 ** (empty_polls - 1), NOT_RETURNED_MAX_INTERVAL)
+                count_key = "not returned"
+            elif shipment_number not in records_by_number:
+                # Foreign client reference: never part of our report
+                priority = None
+            else:
+                priority = poll_interval_for(records_by_number[shipment_number], now)
+                interval = POLL_INTERVALS.get(priority)
+                count_key = priority
+
+            if priority is None:
+                self._schedule.pop(shipment_number, None)
+                self._empty_polls.pop(shipment_number, None)
+                removed_numbers.append(shipment_number)
+                counts["stopped"] = counts.get("stopped", 0) + 1
+                continue
+
+            if empty_polls:
+                self._empty_polls[shipment_number] = empty_polls
+            else:
+                self._empty_polls.pop(shipment_number, None)
+
+            next_poll_at = now + interval
+            self._push(shipment_number, next_poll_at, priority)
+            rows.append((shipment_number, next_poll_at, priority, empty_polls))
+            counts[count_key] = counts.get(count_key, 0) + 1
+
+        self._save(rows, removed_numbers)
+        return counts
+
+# Example usage:
+# scheduler = ShipmentPollScheduler(open_state_store("./Shipment_Data/tnt_state.sqlite"))
+# scheduler.add_references(unique_references, time.time())
+# chunks = scheduler.pop_due_chunks(time.time(), max_chunks=4)
+
+
+
+def fetch_chunk_states(chunk, fetch_backend="selenium", driver_pool=None, html_parser="html.parser", metrics=None):
+    """
+    Fetch the current state of one chunk of shipments.
+
+    Args:
+    - chunk (list): Shipment numbers (at most 30).
+    - fetch_backend (str): "selenium" to render the tracking page, or "http" for the tracking API (unverified schema, see functions_http_backend).
+    - driver_pool (ChromeDriverPool, optional): Browser sessions for the selenium backend.
+    - html_parser (str): BeautifulSoup parser backend for the selenium backend.
+    - metrics (RunMetrics, optional): Records the chunk fetch (spans, latency histogram, page counters).
+
+    Returns:
+    - pd.DataFrame: Matching shipments (scrape_shipment_data columns).
+    - dict: Client reference of every returned shipment, keyed by shipment number.
+    """
+    from functions_extract import create_chunked_urls
+    from functions_http_backend import fetch_shipment_records_http, records_to_dataframe
+    from functions_pipeline import ShipmentRecordCollector, stream_shipment_records
+
+    if fetch_backend == "http":
+        records_by_number = fetch_shipment_records_http(chunk, max_attempts=1, metrics=metrics)
+        client_references = {number: record["Client Reference"] for number, record in records_by_number.items()}
+        return records_to_dataframe(records_by_number), client_references
+
+    # Same page-to-record pipeline as the batch run, for a single chunk URL parsed in this process
+    collector = stream_shipment_records(create_chunked_urls(chunk), None, driver_pool=driver_pool, collector=ShipmentRecordCollector(),
+                                        html_parser=html_parser, metrics=metrics, parse_processes=1)
+    return collector.to_dataframe(), collector.client_references
+
+# Example usage:
+# df, client_references = fetch_chunk_states(chunks[0], driver_pool=driver_pool)
+
+
+
+def run_polling_daemon(excel_tests_file_path, state_store_path, chromedriver_path=None, fetch_backend="selenium", html_parser="html.parser",
+                       max_requests_per_hour=120, excel_reload_interval=15 * 60, max_sleep=60, max_cycles=None,
+                       lean_browser=False, min_request_interval=0.0, metrics_dir=None):
+    """
+    Keep the state store up to date by polling every open shipment on its own schedule.
+
+    The Excel file is read again every `excel_reload_interval` seconds: new open shipments
+    are polled at once, the ones no longer listed are dropped. Each cycle polls the due
+    chunks allowed by the request budget, stores their states and reschedules them.
+    The queue lives in the state store, so a restarted daemon resumes where it stopped.
+    With metrics_dir, every cycle that polls is exported like a tracker run.
+
+    Args:
+    - excel_tests_file_path (str): Path to the Excel file containing tests data.
+    - state_store_path (str): SQLite state store (shipment states and poll queue).
+    - chromedriver_path (str, optional): Path to the ChromeDriver executable (selenium backend).
+    - fetch_backend (str): "selenium". "http" is refused until its API schema is verified (see functions_http_backend).
+    - html_parser (str): BeautifulSoup parser backend for the selenium backend.
+    - max_requests_per_hour (int): Global budget of chunk requests per hour.
+    - excel_reload_interval (float): Seconds between two reads of the Excel file.
+    - max_sleep (float): Longest sleep between two cycles, in seconds.
+    - max_cycles (int, optional): Stop after this many cycles (None runs until interrupted).
+    - lean_browser (bool): Poll with the lean Chrome profile (selenium backend, opt-in).
+    - min_request_interval (float): Minimum seconds between two chunk requests, on top of the hourly budget.
+    - metrics_dir (str, optional): Folder where the metrics of each polling cycle are exported: one JSON line appended
+      to tnt_polling_runs.jsonl, and tnt_polling_daemon.prom for the Prometheus node exporter textfile collector.
+
+    Returns:
+    - int: Number of chunk requests made.
+    """
+    import os
+    import time
+    from contextlib import nullcontext
+    from functions_extract import extract_and_create_urls
+    from functions_driver_pool import ChromeDriverPool
+    from functions_metrics import RunMetrics, NullMetrics
+    from functions_http_backend import HTTP_BACKEND_VERIFIED
+    from functions_reporting import report
+    from functions_state_store import open_state_store, select_references_to_query, save_shipment_states
+
+    if fetch_backend not in ("selenium", "http"):
+        raise ValueError(f"Unknown fetch_backend '{fetch_backend}', expected 'selenium' or 'http'.")
+    if fetch_backend == "http" and not HTTP_BACKEND_VERIFIED:
+        raise ValueError("fetch_backend='http' is disabled until its API mappers are checked against a captured TNT response "
+                         "(see functions_http_backend), use fetch_backend='selenium'.")
+    if fetch_backend == "selenium" and chromedriver_path is None:
+        raise ValueError("chromedriver_path is required with the selenium backend.")
+
+    state_store = open_state_store(state_store_path)
+    scheduler = ShipmentPollScheduler(state_store)
+    budget = RequestBudget(max_requests=max_requests_per_hour, window=3600)
+    report(f"--> Poll queue restored: **{len(scheduler)} shipments**")
+
+    requests_made = 0
+    cycle = 0
+    excel_loaded_at = None
+    last_request_at = None
+
+    if metrics_dir is not None:
+        os.makedirs(metrics_dir, exist_ok=True)
+
+    pool_context = ChromeDriverPool(chromedriver_path, lean_profile=lean_browser) if fetch_backend == "selenium" else nullcontext()
+    try:
+        with pool_context as driver_pool:
+            while max_cycles is None or cycle < max_cycles:
+                cycle += 1
+                now = time.time()
+
+                # Follow the Excel list: add the new open shipments, drop the ones no longer listed
+                if excel_loaded_at is None or now - excel_loaded_at >= excel_reload_interval:
+                    _, unique_references = extract_and_create_urls(excel_tests_file_path)
+                    references_to_query, _, _ = select_references_to_query(state_store, unique_references)
+                    added_count = scheduler.add_references(references_to_query, now)
+                    scheduler.retain_references(unique_references)
+                    excel_loaded_at = now
+                    report(f"--> Excel file read: **{added_count} new shipments** scheduled, **{len(scheduler)}** in the queue")
+
+                chunks = scheduler.pop_due_chunks(now, max_chunks=budget.remaining(now))
+                # One metrics run per polling cycle, exported once its chunks are polled
+                metrics = RunMetrics(run_name="tnt_polling_daemon") if metrics_dir is not None and chunks else NullMetrics()
+                for chunk in chunks:
+                    if last_request_at is not None and min_request_interval > 0:
+                        time.sleep(max(0.0, min_request_interval - (time.monotonic() - last_request_at)))
+                    last_request_at = time.monotonic()
+                    budget.spend(time.time())
+                    requests_made += 1
+                    metrics.increment("chunks_polled")
+                    metrics.increment("shipments_polled", len(chunk))
+                    try:
+                        df, client_references = fetch_chunk_states(chunk, fetch_backend=fetch_backend, driver_pool=driver_pool,
+                                                                   html_parser=html_parser, metrics=metrics)
+                    except Exception as error:
+                        # Retry the chunk with the urgent interval
+                        report(f"--> Chunk of {len(chunk)} shipments failed ({type(error).__name__}), retrying later.")
+                        metrics.increment("chunk_failures")
+                        df, client_references = None, {}
+
+                    records_by_number = {} if df is None else {record["Shipment Number"]: record for record in df.to_dict(orient="records")}
+                    if df is not None:
+                        save_shipment_states(state_store, df, client_references)
+                    counts = scheduler.reschedule(chunk, records_by_number, client_references, time.time(), fetch_failed=df is None)
+                    report(f"--> Polled {len(chunk)} shipments: **{counts.get(0, 0)} urgent**, {counts.get(1, 0)} slow, "
+                           f"{counts.get(2, 0)} quiet, {counts.get('not returned', 0)} not returned (backed off), "
+                           f"{counts.get('stopped', 0)} no longer polled")
+                    metrics.increment("shipments_not_returned", counts.get("not returned", 0))
+                    metrics.increment("shipments_stopped", counts.get("stopped", 0))
+
+                if metrics_dir is not None and chunks:
+                    metrics.set_gauge("poll_queue_size", len(scheduler))
+                    metrics.set_gauge("request_budget_remaining", budget.remaining(time.time()))
+                    if fetch_backend == "selenium":
+                        metrics.set_gauge("lean_browser_profile", int(lean_browser))
+                    metrics.append_json_run_log(os.path.join(metrics_dir, "tnt_polling_runs.jsonl"))
+                    metrics.write_prometheus_textfile(os.path.join(metrics_dir, "tnt_polling_daemon.prom"))
+
+                if max_cycles is not None and cycle >= max_cycles:
+                    break
+
+                # Sleep until the next shipment is due, the budget allows a request, or the Excel file is read again
+                now = time.time()
+                next_due_at = scheduler.next_due_at()
+                wake_at = min(now + max_sleep, excel_loaded_at + excel_reload_interval)
+                if next_due_at is not None:
+                    wake_at = min(wake_at, max(next_due_at, budget.next_slot_at(now)))
+                time.sleep(max(0.0, wake_at - now))
+    finally:
+        state_store.close()
+
+    return requests_made
+
+# Example usage:
+# run_polling_daemon("Shipment_Data/shipments.xlsx", "Shipment_Data/tnt_state.sqlite", chromedriver_path, max_requests_per_hour=120)
+# run_polling_daemon("Shipment_Data/shipments.xlsx", "Shipment_Data/tnt_state.sqlite", chromedriver_path, metrics_dir="./TNT Track Reports/metrics")
@@ -1,16 +1,102 @@
 """
 
 Functions:
+- parse_spanish_date
+- parse_spanish_dates
 - convert_shipment_origin_date
 - process_last_update_column
 - calculate_processing_days
-- format_dates_and_processing_days
+- format_repeated_dates
+- to_typed_report
+- format_report_for_export
 - rearrange_columns_and_save_to_excel
 - global_df_transformation
 
 """
 
 
+SPANISH_MONTHS = ['enero', 'febrero', 'marzo', 'abril', 'mayo', 'junio', 'julio',
+                  'agosto', 'septiembre', 'octubre', 'noviembre', 'diciembre']
+
+# Parsed Spanish dates, filled by parse_spanish_date
+_SPANISH_DATE_CACHE = {}
+
+# Columns of the TNT Track Report, in report order
+REPORT_COLUMNS = ['Client Reference', 'Shipment Number', 'TNT Status',
+                  'Shipment Origin Date', 'Shipment Destination',
+                  'Processing Days', 'Last Update', 'Last Location',
+                  'Last Action', 'TNT Exception Notification']
+
+# Typed report: few distinct values per column, kept as categoricals
+REPORT_CATEGORY_COLUMNS = ['TNT Status', 'Shipment Destination', 'Last Location', 'Last Action']
+
+# Date format of the exported report
+REPORT_DATE_FORMAT = '%d/%m/%y'
+
+
+def parse_spanish_date(text):
+    """
+    Parse one Spanish long date such as "12 de noviembre de 2023" (memoized).
+
+    Args:
+    - text (str): Date as shown on the TNT tracking page.
+
+    Returns:
+    - pd.Timestamp: Parsed date, or NaT if the value is malformed.
+    """
+    import re
+    import pandas as pd
+
+    if text in _SPANISH_DATE_CACHE:
+        return _SPANISH_DATE_CACHE[text]
+
+    parsed_date = pd.NaT
+    match = re.fullmatch(r"\s*(\d{1,2})\s+de\s+(\w+)\s+de\s+(\d{4})\s*", text) if isinstance(text, str) else None
+    if match:
+        day, month_name, year = match.groups()
+        month_name = month_name.lower()
+        if month_name == 'setiembre':
+            month_name = 'septiembre'
+        if month_name in SPANISH_MONTHS:
+            try:
+                parsed_date = pd.Timestamp(year=int(year), month=SPANISH_MONTHS.index(month_name) + 1, day=int(day))
+            except ValueError:
+                # Impossible day for the month, e.g. "31 de febrero de 2023"
+                parsed_date = pd.NaT
+
+    _SPANISH_DATE_CACHE[text] = parsed_date
+    return parsed_date
+
+# Example usage:
+# parse_spanish_date("12 de noviembre de 2023")
+
+
+
+def parse_spanish_dates(dates):
+    """
+    Parse a Series of Spanish long dates, parsing each distinct value only once.
+
+    Args:
+    - dates (pd.Series): Dates such as "12 de noviembre de 2023".
+
+    Returns:
+    - pd.Series: datetime64 Series (NaT for malformed values).
+    """
+    import pandas as pd
+    import numpy as np
+
+    codes, unique_dates = pd.factorize(dates)
+
+    # NaN/None get code -1, which picks the NaT appended at the end
+    parsed_dates = pd.DatetimeIndex([parse_spanish_date(text) for text in unique_dates] + [pd.NaT])
+
+    return pd.Series(parsed_dates[np.asarray(codes)], index=dates.index)
+
+# Example usage:
+# df['Shipment Origin Date'] = parse_spanish_dates(df['Shipment Origin Date'])
+
+
+
 def convert_shipment_origin_date(dataframe):
     """
     Convert 'Shipment Origin Date' column to the desired format.
@@ -23,33 +109,13 @@ def convert_shipment_origin_date(dataframe):
     """
     
     import pandas as pd
-    from datetime import datetime
-    
-    # Define a mapping for Spanish month names to English
-    month_mapping = {
-        'enero': 'January',
-        'febrero': 'February',
-        'marzo': 'March',
-        'abril': 'April',
-        'mayo': 'May',
-        'junio': 'June',
-        'julio': 'July',
-        'agosto': 'August',
-        'septiembre': 'September',
-        'octubre': 'October',
-        'noviembre': 'November',
-        'diciembre': 'December'
-    }
 
     # Check if 'Shipment Origin Date' is already in the desired format
-    if pd.api.types.is_datetime64_ns_dtype(dataframe['Shipment Origin Date']):
+    if pd.api.types.is_datetime64_any_dtype(dataframe['Shipment Origin Date']):
         return dataframe
     else:
-        # Apply the conversion to the 'Shipment Origin Date' column
-        dataframe['Shipment Origin Date'] = dataframe['Shipment Origin Date'].replace(month_mapping, regex=True).apply(
-            lambda x: datetime.strptime(x, "%d de %B de %Y").strftime("%d/%m/%y")
-        )
-        dataframe['Shipment Origin Date'] = pd.to_datetime(dataframe['Shipment Origin Date'], format="%d/%m/%y", errors='coerce')
+        # Parse the distinct Spanish dates ("12 de noviembre de 2023") straight to datetime64
+        dataframe['Shipment Origin Date'] = parse_spanish_dates(dataframe['Shipment Origin Date'])
         return dataframe
 
 # Example usage:
@@ -73,8 +139,8 @@ def process_last_update_column(dataframe):
     # Convert 'Last Update' to datetime format
     dataframe['Last Update'] = pd.to_datetime(dataframe['Last Update'], format="%d/%m/%y %H:%M", errors='coerce')
 
-    # Format 'Last Update' to YYYY-MM-DD
-    dataframe['Last Update'] = dataframe['Last Update'].dt.strftime('%Y-%m-%d')
+    # Keep the day only (formatted as a string at export)
+    dataframe['Last Update'] = dataframe['Last Update'].dt.normalize()
 
     return dataframe
 
@@ -84,48 +150,36 @@ def process_last_update_column(dataframe):
 
 
 
-def calculate_processing_days(dataframe):
+def calculate_processing_days(dataframe, reference_time=None):
     """
     Calculate the processing days for each shipment and add a 'Processing Days' column.
 
+    Delivered shipments ("Entregado") are measured up to their 'Last Update', the others
+    up to one reference time shared by the whole run. The column is a native timedelta64.
+
     Args:
     - dataframe (pd.DataFrame): Input DataFrame containing shipment data.
+    - reference_time (datetime, optional): End time for shipments not delivered. Defaults to now.
 
     Returns:
     - pd.DataFrame: DataFrame with the 'Processing Days' column added.
     """
     
     import pandas as pd
-    from datetime import datetime, timedelta
+    from datetime import datetime
     
-    # Create a new column 'Processing Days'
-    dataframe['Processing Days'] = None
-
-    # Iterate through each row
-    for index, row in dataframe.iterrows():
-        if row['TNT Status'] == "Entregado":
-            # Calculate processing time for delivered shipments
-            processing_time = pd.to_datetime(row['Last Update']) - row['Shipment Origin Date']
-        else:
-            # Calculate processing time using current date for other cases
-            current_date = datetime.now().replace(microsecond=0)
-            processing_time = current_date - row['Shipment Origin Date']
-        
-        #if row['TNT Status'] != "Entregado" and row['TNT Exception Notification'] != "EXCEPTION ALERT":
-            # Calculate processing time for non-delivered shipments
-         #   current_date = datetime.now().replace(microsecond=0)
-         #   processing_time = current_date - row['Shipment Origin Date']
-        #else:
-        #    # For delivered shipments, use 'Last Update'
-        #    processing_time = pd.to_datetime(row['Last Update']) - row['Shipment Origin Date']
-
-        
-        # Format processing time to display only days, months, and years
-        days, seconds = processing_time.days, processing_time.seconds
-        formatted_processing_time = timedelta(days=days, seconds=seconds)
-
-        # Assign the formatted processing time to the 'Processing Days' column
-        dataframe.at[index, 'Processing Days'] = formatted_processing_time
+    # One reference timestamp for the whole run
+    if reference_time is None:
+        reference_time = datetime.now()
+    reference_time = pd.Timestamp(reference_time).replace(microsecond=0)
+
+    # Delivered shipments end at their last update, the others at the reference time
+    delivered = dataframe['TNT Status'] == "Entregado"
+    last_update = pd.to_datetime(dataframe['Last Update'], errors='coerce')
+    end_time = last_update.where(delivered, reference_time)
+
+    # Processing time truncated to whole seconds
+    dataframe['Processing Days'] = (end_time - dataframe['Shipment Origin Date']).dt.floor('s')
 
     return dataframe
 
@@ -134,71 +188,159 @@ def calculate_processing_days(dataframe):
 
 
 
-def format_dates_and_processing_days(dataframe):
+def format_repeated_dates(dates, date_format):
     """
-    Format 'Shipment Origin Date' and 'Last Update' columns as dd/mm/yy,
-    and modify 'Processing Days' to only show the number of days.
+    Format a datetime Series as strings, calling strftime once per distinct date.
 
     Args:
-    - dataframe (pd.DataFrame): Input DataFrame containing shipment data.
+    - dates (pd.Series): datetime64 Series (NaT allowed).
+    - date_format (str): strftime format.
 
     Returns:
-    - pd.DataFrame: DataFrame with formatted columns.
+    - pd.Series: Formatted strings (NaN where the date is NaT).
     """
-    
     import pandas as pd
-    from datetime import datetime, timedelta
-    
-    # Format 'Shipment Origin Date' and 'Last Update' columns
-    dataframe['Shipment Origin Date'] = dataframe['Shipment Origin Date'].dt.strftime('%d/%m/%y')
-    dataframe['Last Update'] = pd.to_datetime(dataframe['Last Update']).dt.strftime('%d/%m/%y')
+    import numpy as np
 
-    # Modify 'Processing Days' column to only show the number of days
-    dataframe['Processing Days'] = dataframe['Processing Days'].apply(lambda x: str(x).split(',')[0])
+    codes, unique_dates = pd.factorize(dates)
 
-    return dataframe
+    # NaT gets code -1, which picks the NaN appended at the end
+    formatted = np.append(np.asarray(unique_dates.strftime(date_format), dtype=object), np.nan)
+
+    return pd.Series(formatted[codes], index=dates.index)
 
 # Example usage:
-# processed_df = format_dates_and_processing_days(processed_df)
+# df['Shipment Origin Date'] = format_repeated_dates(df['Shipment Origin Date'], '%d/%m/%y')
 
 
 
-def rearrange_columns_and_save_to_excel(dataframe, folder_save_to_excel_path):
+def to_typed_report(dataframe):
     """
-    Rearrange DataFrame columns and save it to an Excel file.
+    Convert report columns to the typed schema of the processed report.
+
+    Statuses, destinations, locations and actions become categoricals, dates datetime64,
+    'Processing Days' whole days (Int32) and 'TNT Exception Notification' a boolean flag.
+    Accepts the frame of calculate_processing_days as well as a saved report (formatted
+    strings), and leaves typed columns and the other columns as they are.
+
+    Args:
+    - dataframe (pd.DataFrame): Report frame, typed or formatted.
+
+    Returns:
+    - pd.DataFrame: New frame with the report columns typed.
+    """
+    import pandas as pd
+
+    typed_df = dataframe.copy(deep=False)
+
+    for column in ['Client Reference', 'Shipment Number']:
+        if column in typed_df:
+            typed_df[column] = typed_df[column].astype(str)
+
+    for column in REPORT_CATEGORY_COLUMNS:
+        if column in typed_df:
+            typed_df[column] = typed_df[column].astype('category')
+
+    for column in ['Shipment Origin Date', 'Last Update']:
+        if column in typed_df and not pd.api.types.is_datetime64_any_dtype(typed_df[column]):
+            typed_df[column] = pd.to_datetime(typed_df[column], format=REPORT_DATE_FORMAT, errors='coerce')
+
+    if 'Processing Days' in typed_df:
+        processing_days = typed_df['Processing Days']
+        if pd.api.types.is_timedelta64_dtype(processing_days):
+            processing_days = processing_days.dt.days
+        elif not pd.api.types.is_numeric_dtype(processing_days):
+            # "41 days" in a saved report
+            processing_days = pd.to_numeric(processing_days.astype('string').str.extract(r'(-?\d+)', expand=False), errors='coerce')
+        typed_df['Processing Days'] = processing_days.astype('Int32')
+
+    if 'TNT Exception Notification' in typed_df:
+        exception_flags = typed_df['TNT Exception Notification']
+        if not pd.api.types.is_bool_dtype(exception_flags):
+            # "EXCEPTION ALERT" or a blank
+            exception_flags = exception_flags.astype('string').fillna('').str.strip().ne('')
+        typed_df['TNT Exception Notification'] = exception_flags.astype('boolean')
+
+    return typed_df
+
+# Example usage:
+# processed_df = to_typed_report(calculate_processing_days(df))
+# previous_df = to_typed_report(pd.read_excel(previous_report_path, dtype=str))
+
+
+
+def format_report_for_export(dataframe):
+    """
+    Format the typed report columns as they are shown in the report files.
+
+    Dates become dd/mm/yy, 'Processing Days' "1 day" / "41 days" and the exception flag
+    "EXCEPTION ALERT" or a blank. "Previous <column>" columns of the changes report are
+    formatted like their column.
+
+    Args:
+    - dataframe (pd.DataFrame): Typed report (to_typed_report output).
+
+    Returns:
+    - pd.DataFrame: New frame with string columns, ready to export.
+    """
+    import numpy as np
+    import pandas as pd
+
+    formatted_df = dataframe.copy(deep=False)
+
+    for column in formatted_df.columns:
+        values = formatted_df[column]
+        report_column = column[len('Previous '):] if column.startswith('Previous ') else column
+
+        if report_column in ('Shipment Origin Date', 'Last Update') and pd.api.types.is_datetime64_any_dtype(values):
+            formatted_df[column] = format_repeated_dates(values, REPORT_DATE_FORMAT)
+        elif report_column == 'Processing Days' and pd.api.types.is_numeric_dtype(values):
+            days = values.astype('Int32')
+            # Unknown days (malformed origin date, delivered without a last update) are left as empty cells
+            unit = np.where((days.abs() == 1).fillna(False).to_numpy(), ' day', ' days')
+            formatted_df[column] = (days.astype(str) + unit).astype(object).where(days.notna())
+        elif report_column == 'TNT Exception Notification' and pd.api.types.is_bool_dtype(values):
+            formatted_df[column] = pd.Series(np.where(values.fillna(False), 'EXCEPTION ALERT', ' '),
+                                             index=values.index, dtype=object).where(values.notna())
+
+    return formatted_df
+
+# Example usage:
+# report_df = format_report_for_export(processed_df)
+
+
+
+def rearrange_columns_and_save_to_excel(dataframe, folder_save_to_excel_path, report_formats=("xlsx",), background_write=False):
+    """
+    Rearrange DataFrame columns and save it to an Excel file (and/or the other report formats).
 
     Args:
     - dataframe (pd.DataFrame): Input DataFrame.
     - folder_save_to_excel_path (str): Folder path to save the Excel file.
+    - report_formats (tuple): Report formats to write ("xlsx", "parquet", "csv"), all from the same frame.
+    - background_write (bool): Write the files on a background thread and return at once.
 
     Returns:
     - pd.DataFrame: Rearranged DataFrame.
-    - str: Full path of the saved Excel file.
+    - str: Full path of the saved Excel file (of the first report format).
+    - ReportWriteHandle: Only if background_write is True, handle to wait for the files (wait() raises the write failures).
     """
     
-    import os
-    import pandas as pd
-    from datetime import datetime
+    from functions_report_writers import write_report
 
     # Rearrange DataFrame columns
-    dataframe = dataframe[['Client Reference', 'Shipment Number', 'TNT Status',
-                           'Shipment Origin Date', 'Shipment Destination',
-                           'Processing Days', 'Last Update', 'Last Location',
-                           'Last Action', 'TNT Exception Notification']]
+    dataframe = dataframe[REPORT_COLUMNS]
 
-    # Get current date and time for creating a unique filename
-    current_datetime = datetime.now().strftime("%d-%m-%Y %H_%M_%S")
-    excel_filename = f"TNT Track Report {current_datetime}.xlsx"
-
-    # Create the full path for saving the file
-    full_path = os.path.join(folder_save_to_excel_path, excel_filename)
-
-    # Save the DataFrame to Excel
-    dataframe.to_excel(full_path, index=False)
+    # Save the DataFrame in every format, named "TNT Track Report <date time>" (the typed columns are formatted by the writer)
+    report_write = write_report(dataframe, folder_save_to_excel_path, formats=report_formats, background=background_write,
+                                export_formatter=format_report_for_export)
+    full_path = report_write.paths[report_formats[0]]
     
     # Print path
     # print(f"Excel file saved at: {full_path}")
 
+    if background_write:
+        return dataframe, full_path, report_write
     return dataframe, full_path
 
 # Example usage:
@@ -208,23 +350,24 @@ def rearrange_columns_and_save_to_excel(dataframe, folder_save_to_excel_path):
 
 
 
-def global_df_transformation(dataframe, folder_save_to_excel_path):
+def global_df_transformation(dataframe, folder_save_to_excel_path, report_formats=("xlsx",), background_write=False):
     """
     Perform the global processing of the input DataFrame.
 
     Args:
     - dataframe (pd.DataFrame): Input DataFrame containing shipment data.
     - folder_save_to_excel_path (str): Folder path to save the Excel file.
+    - report_formats (tuple): Report formats to write ("xlsx", "parquet", "csv").
+    - background_write (bool): Write the report files on a background thread and return at once.
 
     Returns:
-    - pd.DataFrame: Processed and rearranged DataFrame.
-    - str: Full path of the saved Excel file.
+    - pd.DataFrame: Processed and rearranged DataFrame, typed (see to_typed_report); only the files are formatted.
+    - str: Full path of the saved Excel file (of the first report format).
+    - ReportWriteHandle: Only if background_write is True, handle to wait for the report files.
     """
     # Import libraries
-    import pandas as pd
-    from datetime import datetime, timedelta
     import os
-    from IPython.display import display, Markdown
+    from functions_reporting import report
 
     # Function 1: Convert 'Shipment Origin Date'
     dataframe = convert_shipment_origin_date(dataframe)
@@ -235,19 +378,30 @@ def global_df_transformation(dataframe, folder_save_to_excel_path):
     # Function 3: Calculate processing days and add 'Processing Days' column
     dataframe = calculate_processing_days(dataframe)
 
-    # Function 4: Format 'Shipment Origin Date', 'Last Update', and 'Processing Days'
-    dataframe = format_dates_and_processing_days(dataframe)
+    # Function 4: Typed report columns (categoricals, dates, whole days, exception flag), formatted only at export
+    dataframe = to_typed_report(dataframe)
 
     # Function 5: Rearrange columns and save to Excel
-    processed_df, excel_file_path = rearrange_columns_and_save_to_excel(dataframe, folder_save_to_excel_path)
+    if background_write:
+        processed_df, excel_file_path, report_write = rearrange_columns_and_save_to_excel(dataframe, folder_save_to_excel_path,
+                                                                                          report_formats, background_write=True)
+        report(f"--> Writing the report in the background: {', '.join(report_write.paths.values())}")
+        return processed_df, excel_file_path, report_write
 
-    display(Markdown(f"--> Excel file saved at: {excel_file_path}"))
+    processed_df, excel_file_path = rearrange_columns_and_save_to_excel(dataframe, folder_save_to_excel_path, report_formats)
+
+    if tuple(report_formats) == ("xlsx",):
+        report(f"--> Excel file saved at: {excel_file_path}")
+    else:
+        report_base_path = os.path.splitext(excel_file_path)[0]
+        report(f"--> Report saved at: {', '.join(f'{report_base_path}.{report_format}' for report_format in report_formats)}")
 
     return processed_df, excel_file_path
 
 # Example usage:
 # folder_save_to_excel_path = "/path/to/save/excel/files"
 # processed_df, excel_file_path = global_df_transformation(df, folder_save_to_excel_path)
+# processed_df, excel_file_path, report_write = global_df_transformation(df, folder_save_to_excel_path, ("xlsx", "parquet"), background_write=True)
 
 
 
@@ -0,0 +1,244 @@
+"""
+
+Report writers: the same in-memory report frame is written in one or several formats
+(Excel, Parquet, CSV), in the calling thread or on a background thread while the caller
+continues.
+
+Classes:
+- ReportWriteHandle
+
+Functions:
+- write_excel_report
+- write_parquet_report
+- write_csv_report
+- write_report
+
+"""
+
+
+# Rows converted at once by the streaming Excel writer (bounds the memory of the conversion)
+EXCEL_ROWS_PER_BLOCK = 10_000
+
+# Formats written as text, from the export formatter's strings; Parquet keeps the typed columns
+FORMATTED_REPORT_FORMATS = ("xlsx", "csv")
+
+
+
+def write_excel_report(dataframe, path):
+    """
+    Write the report to an Excel file, row by row in constant memory.
+
+    With xlsxwriter installed, rows are streamed to the worksheet (constant_memory mode)
+    in blocks of EXCEL_ROWS_PER_BLOCK; otherwise falls back to DataFrame.to_excel.
+
+    Args:
+    - dataframe (pd.DataFrame): Report to write.
+    - path (str): Path of the .xlsx file.
+
+    Returns:
+    - None
+    """
+    try:
+        import xlsxwriter
+    except ImportError:
+        dataframe.to_excel(path, index=False, engine="openpyxl")
+        return
+
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "default_date_format": "dd/mm/yy",
+                                          "nan_inf_to_errors": True})
+    try:
+        worksheet = workbook.add_worksheet("Sheet1")
+
+        # Same header style as DataFrame.to_excel
+        header_format = workbook.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+        worksheet.write_row(0, 0, [str(column) for column in dataframe.columns], header_format)
+
+        # constant_memory flushes each row once the next one starts, so rows go strictly in order
+        for block_start in range(0, len(dataframe), EXCEL_ROWS_PER_BLOCK):
+            block = dataframe.iloc[block_start:block_start + EXCEL_ROWS_PER_BLOCK]
+            rows = block.astype(object).where(block.notna(), None).to_numpy().tolist()
+            for row_offset, row in enumerate(rows):
+                worksheet.write_row(block_start + row_offset + 1, 0, row)
+    finally:
+        workbook.close()
+
+# Example usage:
+# write_excel_report(processed_df, "TNT Track Report.xlsx")
+
+
+
+def write_parquet_report(dataframe, path):
+    """
+    Write the report to a Parquet file (requires pyarrow or fastparquet).
+
+    Args:
+    - dataframe (pd.DataFrame): Report to write.
+    - path (str): Path of the .parquet file.
+
+    Returns:
+    - None
+    """
+    dataframe.to_parquet(path, index=False)
+
+# Example usage:
+# write_parquet_report(processed_df, "TNT Track Report.parquet")
+
+
+
+def write_csv_report(dataframe, path):
+    """
+    Write the report to a CSV file, with a BOM so Excel opens the accents correctly.
+
+    Args:
+    - dataframe (pd.DataFrame): Report to write.
+    - path (str): Path of the .csv file.
+
+    Returns:
+    - None
+    """
+    dataframe.to_csv(path, index=False, encoding="utf-8-sig")
+
+# Example usage:
+# write_csv_report(processed_df, "TNT Track Report.csv")
+
+
+
+# Report writers by format, the format is also the file extension
+REPORT_WRITERS = {
+    "xlsx": write_excel_report,
+    "parquet": write_parquet_report,
+    "csv": write_csv_report,
+}
+
+
+
+class ReportWriteHandle:
+    """
+    Progress of one report write, in one or several formats.
+
+    Returned by write_report. `wait` blocks until every format is written and raises
+    the write failures, so a background write never fails silently for the caller.
+
+    Args:
+    - paths (dict): Output path keyed by format.
+    """
+
+    def __init__(self, paths):
+        import threading
+
+        self.paths = paths
+        self.errors = {}
+        self.seconds = {}
+        self._finished = threading.Event()
+
+    def done(self):
+        """
+        Check whether every format has been written (or has failed).
+
+        Returns:
+        - bool: True once the write is over.
+        """
+        return self._finished.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Wait until every format is written.
+
+        Args:
+        - timeout (float, optional): Maximum seconds to wait. Defaults to no limit.
+
+        Returns:
+        - dict: Output path keyed by format.
+        """
+        if not self._finished.wait(timeout):
+            raise TimeoutError(f"Report write still running after {timeout} seconds.")
+
+        if self.errors:
+            failed_formats = ", ".join(f"{report_format} ({type(error).__name__}: {error})" for report_format, error in self.errors.items())
+            raise RuntimeError(f"Report write failed for: {failed_formats}") from next(iter(self.errors.values()))
+
+        return self.paths
+
+# Example usage:
+# report_write = write_report(processed_df, folder_save_to_excel_path, formats=("xlsx", "parquet"), background=True)
+# report_paths = report_write.wait()
+
+
+
+def write_report(dataframe, folder, formats=("xlsx",), background=False, basename=None, export_formatter=None):
+    """
+    Write the report frame in every requested format.
+
+    Each file is written next to its target and renamed, so a partial report never
+    appears in the folder. One failing format does not stop the others. In background
+    mode, the frame must not be modified in place until the handle has been waited on.
+
+    Args:
+    - dataframe (pd.DataFrame): Report to write.
+    - folder (str): Folder of the report files.
+    - formats (tuple): Formats to write, among REPORT_WRITERS ("xlsx", "parquet", "csv").
+    - background (bool): Write on a background thread and return at once.
+    - basename (str, optional): File name without extension. Defaults to "TNT Track Report <date time>".
+    - export_formatter (callable, optional): Turns the typed frame into the strings shown in the Excel and CSV
+      files (e.g. format_report_for_export). Called once, by the writer, only if one of these formats is written.
+
+    Returns:
+    - ReportWriteHandle: Handle with the output paths; in the foreground the write is already over and failures are raised.
+    """
+    import os
+    import threading
+    import time
+    from datetime import datetime
+    from functions_reporting import report
+
+    unknown_formats = [report_format for report_format in formats if report_format not in REPORT_WRITERS]
+    if unknown_formats or not formats:
+        raise ValueError(f"Unknown report formats {unknown_formats}, expected some of {tuple(REPORT_WRITERS)}.")
+
+    if basename is None:
+        # Get current date and time for creating a unique filename
+        basename = f"TNT Track Report {datetime.now().strftime('%d-%m-%Y %H_%M_%S')}"
+
+    handle = ReportWriteHandle({report_format: os.path.join(folder, f"{basename}.{report_format}") for report_format in formats})
+
+    # Shallow copy: columns replaced by the caller meanwhile do not reach the writer
+    dataframe = dataframe.copy(deep=False)
+
+    formatted_frames = {}
+
+    def frame_for(report_format):
+        if export_formatter is None or report_format not in FORMATTED_REPORT_FORMATS:
+            return dataframe
+        if "formatted" not in formatted_frames:
+            formatted_frames["formatted"] = export_formatter(dataframe)
+        return formatted_frames["formatted"]
+
+    def write_all():
+        try:
+            for report_format, path in handle.paths.items():
+                start_time = time.perf_counter()
+                # The extension stays last, the Excel engines check it
+                temporary_path = f"{os.path.splitext(path)[0]}.{os.getpid()}.tmp.{report_format}"
+                try:
+                    REPORT_WRITERS[report_format](frame_for(report_format), temporary_path)
+                    os.replace(temporary_path, path)
+                except Exception as error:
+                    handle.errors[report_format] = error
+                    if os.path.exists(temporary_path):
+                        os.remove(temporary_path)
+                    if background:
+                        report(f"--> Could not write the {report_format} report ({type(error).__name__}): {error}")
+                handle.seconds[report_format] = time.perf_counter() - start_time
+        finally:
+            handle._finished.set()
+
+    if background:
+        threading.Thread(target=write_all, name="report-writer", daemon=False).start()
+        return handle
+
+    write_all()
+    handle.wait()
+    return handle
+
+# Example usage:
+# report_paths = write_report(processed_df, folder_save_to_excel_path, formats=("xlsx", "csv")).paths
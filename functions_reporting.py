@@ -0,0 +1,140 @@
+"""
+
+Progress reporting of the tracker: the same Markdown messages go to a notebook,
+a terminal or the logging module, so the pipeline also runs from cron or a container.
+
+Classes:
+- NotebookReporter
+- TerminalReporter
+- LoggingReporter
+
+Functions:
+- default_reporter
+- set_reporter
+- report
+
+"""
+
+
+# Reporter currently used by report(), set by set_reporter
+_ACTIVE_REPORTER = {}
+
+
+
+class NotebookReporter:
+    """
+    Render the progress messages as Markdown in a Jupyter notebook.
+    """
+
+    def report(self, message):
+        from IPython.display import display, Markdown
+        display(Markdown(message))
+
+
+
+class TerminalReporter:
+    """
+    Print the progress messages as plain text.
+
+    Args:
+    - stream (file, optional): Stream to write to. Defaults to sys.stdout.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream
+
+    def report(self, message):
+        import sys
+        print(message.replace("**", "").strip(), file=self.stream or sys.stdout, flush=True)
+
+
+
+class LoggingReporter:
+    """
+    Send the progress messages to a logger.
+
+    Args:
+    - logger_name (str): Name of the logger.
+    - level (int): Logging level of the messages.
+    """
+
+    def __init__(self, logger_name="tnt_shipment_tracker", level=20):
+        self.logger_name = logger_name
+        self.level = level
+
+    def report(self, message):
+        import logging
+        logging.getLogger(self.logger_name).log(self.level, message.replace("**", "").strip())
+
+
+
+# Reporters selectable by name (command line --reporter)
+REPORTERS = {"notebook": NotebookReporter, "terminal": TerminalReporter, "logging": LoggingReporter}
+
+
+
+def default_reporter():
+    """
+    Pick the reporter of the current environment: notebook inside an IPython kernel, terminal otherwise.
+
+    Returns:
+    - object: Reporter with a report(message) method.
+    """
+    import sys
+
+    # Only look at IPython if it is already loaded, importing it just to check costs startup time
+    ipython_module = sys.modules.get("IPython")
+    shell = ipython_module.get_ipython() if ipython_module is not None else None
+    if shell is not None and hasattr(shell, "kernel"):
+        return NotebookReporter()
+    return TerminalReporter()
+
+# Example usage:
+# reporter = default_reporter()
+
+
+
+def set_reporter(reporter):
+    """
+    Choose where the progress messages of every stage are sent.
+
+    Args:
+    - reporter (str or object): "notebook", "terminal", "logging", an object with a report(message) method, or None for the default.
+
+    Returns:
+    - object: Previous reporter (None if the default was used), to restore it afterwards.
+    """
+    if isinstance(reporter, str):
+        if reporter not in REPORTERS:
+            raise ValueError(f"Unknown reporter '{reporter}', expected one of {tuple(REPORTERS)}.")
+        reporter = REPORTERS[reporter]()
+
+    previous_reporter = _ACTIVE_REPORTER.get("reporter")
+    if reporter is None:
+        _ACTIVE_REPORTER.pop("reporter", None)
+    else:
+        _ACTIVE_REPORTER["reporter"] = reporter
+    return previous_reporter
+
+# Example usage:
+# set_reporter("logging")
+
+
+
+def report(message):
+    """
+    Send one progress message (Markdown) to the active reporter.
+
+    Args:
+    - message (str): Message, with Markdown bold markers.
+
+    Returns:
+    - None
+    """
+    reporter = _ACTIVE_REPORTER.get("reporter")
+    if reporter is None:
+        reporter = _ACTIVE_REPORTER["reporter"] = default_reporter()
+    reporter.report(message)
+
+# Example usage:
+# report(f"--> Chunked URLs to be consulted: **{len(url_list)}**")
@@ -0,0 +1,121 @@
+"""
+
+Routing of the scraped shipments to one report per team, by client reference prefix: the
+shipment lists are scraped once and every shipment goes to the report of the longest
+prefix it matches, or to the "unrouted" report.
+
+Classes:
+- ClientReferenceRouter
+
+Functions:
+- parse_route_specs
+
+"""
+
+
+# Report of the shipments whose client reference matches no route
+UNROUTED_REPORT = "unrouted"
+
+
+
+class ClientReferenceRouter:
+    """
+    Prefix -> report routes, matched in one pass by a single compiled regular expression.
+
+    The prefixes are the alternatives of one anchored pattern, longest first, so a client
+    reference matching several prefixes ("DSD/" and "DSD/FR/") goes to the longest one.
+    Several prefixes can share a report. Report names are the subfolders of the reports, so
+    path separators, "." and ".." are rejected (ValueError).
+
+    Args:
+    - routes (dict): Report name keyed by client reference prefix, e.g. {"DSD/": "dsd", "ACM/": "acme"}.
+    """
+
+    def __init__(self, routes):
+        import re
+
+        if not routes:
+            raise ValueError("At least one client reference prefix route is needed.")
+        for prefix, report_name in routes.items():
+            if not prefix or not report_name:
+                raise ValueError(f"Invalid route {prefix!r} -> {report_name!r}, prefix and report name must not be empty.")
+            if report_name == UNROUTED_REPORT:
+                raise ValueError(f"'{UNROUTED_REPORT}' is the report of the shipments matching no route, use another name.")
+            # The report name is the subfolder of its reports, it must stay inside the output folder
+            if report_name in (".", "..") or any(character in report_name for character in ("/", "\\", "\0")):
+                raise ValueError(f"Invalid report name {report_name!r}, it is used as a folder name: no '/', '\\', '.' or '..'.")
+
+        self.routes = dict(routes)
+        self.report_names = list(dict.fromkeys(self.routes.values()))
+        self._pattern = re.compile("|".join(re.escape(prefix) for prefix in sorted(self.routes, key=len, reverse=True)))
+
+    def route(self, client_reference):
+        """
+        Find the report of one client reference.
+
+        Args:
+        - client_reference (str): Client reference of a shipment (None if TNT shows none).
+
+        Returns:
+        - str: Report name of the longest matching prefix, or UNROUTED_REPORT.
+        """
+        prefix_match = self._pattern.match(client_reference) if isinstance(client_reference, str) else None
+        return self.routes[prefix_match.group(0)] if prefix_match else UNROUTED_REPORT
+
+    def split(self, dataframe):
+        """
+        Split the scraped shipments into one frame per report, routing each distinct client reference once.
+
+        Args:
+        - dataframe (pd.DataFrame): Scraped shipments of every client reference (scrape_shipment_data columns).
+
+        Returns:
+        - dict: Frame of every configured report (empty if no shipment matched), in route order, then the
+          unrouted shipments if there are any, keyed by report name.
+        """
+        import numpy as np
+        import pandas as pd
+
+        codes, client_references = pd.factorize(dataframe["Client Reference"])
+
+        # Missing client references get code -1, which picks the unrouted report appended at the end
+        report_of_reference = np.array([self.route(client_reference) for client_reference in client_references] + [UNROUTED_REPORT],
+                                       dtype=object)
+        report_names = report_of_reference[codes]
+
+        report_frames = {report_name: dataframe[report_names == report_name] for report_name in self.report_names}
+        unrouted = report_names == UNROUTED_REPORT
+        if unrouted.any():
+            report_frames[UNROUTED_REPORT] = dataframe[unrouted]
+
+        return report_frames
+
+# Example usage:
+# router = ClientReferenceRouter({"DSD/": "dsd", "ACM/": "acme", "ACM/FR/": "acme-france"})
+# report_frames = router.split(df)
+
+
+
+def parse_route_specs(route_specs):
+    """
+    Parse "PREFIX=REPORT" route specifications (command line, configuration files).
+
+    Args:
+    - route_specs (list): Specifications such as ["DSD/=dsd", "ACM/=acme"].
+
+    Returns:
+    - dict: Report name keyed by client reference prefix.
+    """
+    routes = {}
+    for route_spec in route_specs:
+        prefix, separator, report_name = route_spec.partition("=")
+        if not separator or not prefix or not report_name.strip():
+            raise ValueError(f"Invalid route {route_spec!r}, expected PREFIX=REPORT (e.g. DSD/=dsd).")
+        if prefix in routes:
+            raise ValueError(f"Prefix {prefix!r} is routed twice.")
+        routes[prefix] = report_name.strip()
+
+    return routes
+
+# Example usage:
+# routes = parse_route_specs(["DSD/=dsd", "ACM/=acme"])
@@ -0,0 +1,182 @@
+"""
+
+Functions:
+- open_state_store
+- select_references_to_query
+- save_shipment_states
+- build_report_from_states
+
+"""
+
+
+# Shipments with this TNT Status never change again
+DELIVERED_TNT_STATUS = "Entregado"
+
+
+
+def open_state_store(state_store_path):
+    """
+    Open (and create if needed) the local SQLite store of shipment states.
+
+    Args:
+    - state_store_path (str): Path to the SQLite database file.
+
+    Returns:
+    - sqlite3.Connection: Open connection to the store.
+    """
+    import sqlite3
+
+    connection = sqlite3.connect(state_store_path)
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS shipment_state (
+            shipment_number TEXT PRIMARY KEY,
+            client_reference TEXT,
+            client_match INTEGER NOT NULL,
+            tnt_status TEXT,
+            record_json TEXT,
+            is_final INTEGER NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    """)
+    # Poll queue of the polling daemon (functions_polling), kept across restarts
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS poll_schedule (
+            shipment_number TEXT PRIMARY KEY,
+            next_poll_at REAL NOT NULL,
+            priority INTEGER NOT NULL,
+            empty_polls INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    # Stores created before the back-off of the shipments TNT does not return
+    poll_columns = {row[1] for row in connection.execute("PRAGMA table_info(poll_schedule)")}
+    if "empty_polls" not in poll_columns:
+        connection.execute("ALTER TABLE poll_schedule ADD COLUMN empty_polls INTEGER NOT NULL DEFAULT 0")
+    connection.commit()
+    return connection
+
+# Example usage:
+# connection = open_state_store("./Shipment_Data/tnt_state.sqlite")
+
+
+
+def select_references_to_query(connection, unique_references, client_reference_prefix=None):
+    """
+    Split the Excel references into the ones to scrape and the ones already final in the store.
+
+    A shipment is final once TNT reports it delivered ("Entregado") or once its client
+    reference is known not to match our prefix.
+
+    Args:
+    - connection (sqlite3.Connection): Open state store.
+    - unique_references (set): Shipment numbers from the Excel file.
+    - client_reference_prefix (str, optional): Prefix of the shipments of this run's report. Defaults to the
+      match recorded with the state. A final shipment that matches but was stored without its record (foreign
+      for an earlier run) is queried again; "" matches every client reference (routed reports).
+
+    Returns:
+    - set: Shipment numbers still open (or never seen) that must be scraped.
+    - list: Stored records of the final shipments whose client reference matches.
+    - int: Number of final shipments skipped because of their client reference.
+    """
+    import json
+
+    references = {str(ship_num) for ship_num in unique_references}
+    final_states = {}
+
+    # Query in batches to stay below the SQLite variable limit
+    sorted_references = sorted(references)
+    for i in range(0, len(sorted_references), 500):
+        batch = sorted_references[i:i + 500]
+        placeholders = ",".join("?" * len(batch))
+        rows = connection.execute(
+            f"SELECT shipment_number, client_reference, client_match, record_json FROM shipment_state "
+            f"WHERE is_final = 1 AND shipment_number IN ({placeholders})", batch
+        )
+        for shipment_number, client_reference, client_match, record_json in rows:
+            if client_reference_prefix is not None:
+                client_match = client_reference is not None and client_reference.startswith(client_reference_prefix)
+            if client_match and record_json is None:
+                continue
+            final_states[shipment_number] = (client_match, record_json)
+
+    stored_records = [json.loads(record_json) for client_match, record_json in final_states.values() if client_match]
+    foreign_count = sum(1 for client_match, _ in final_states.values() if not client_match)
+
+    return references - final_states.keys(), stored_records, foreign_count
+
+# Example usage:
+# references_to_query, stored_records, foreign_count = select_references_to_query(connection, unique_references)
+
+
+
+def save_shipment_states(connection, df, client_references):
+    """
+    Record the last parsed state of every scraped shipment.
+
+    Args:
+    - connection (sqlite3.Connection): Open state store.
+    - df (pd.DataFrame): Scraped shipments whose client reference matches (scrape_shipment_data output).
+    - client_references (dict): Client reference of every scraped shipment, keyed by shipment number.
+
+    Returns:
+    - int: Number of shipments recorded.
+    """
+    import json
+    from datetime import datetime
+
+    updated_at = datetime.now().isoformat(timespec="seconds")
+    records_by_number = {record["Shipment Number"]: record for record in df.to_dict(orient="records")}
+
+    rows = []
+    for shipment_number, client_reference in client_references.items():
+        record = records_by_number.get(shipment_number)
+        if record is not None:
+            tnt_status = record["TNT Status"]
+            rows.append((shipment_number, client_reference, 1, tnt_status, json.dumps(record, ensure_ascii=False),
+                         int(tnt_status == DELIVERED_TNT_STATUS), updated_at))
+        elif client_reference is not None:
+            # Foreign client reference: never part of our report, never scraped again
+            rows.append((shipment_number, client_reference, 0, None, None, 1, updated_at))
+
+    connection.executemany("""
+        INSERT INTO shipment_state (shipment_number, client_reference, client_match, tnt_status, record_json, is_final, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(shipment_number) DO UPDATE SET
+            client_reference = excluded.client_reference,
+            client_match = excluded.client_match,
+            tnt_status = excluded.tnt_status,
+            record_json = excluded.record_json,
+            is_final = excluded.is_final,
+            updated_at = excluded.updated_at
+    """, rows)
+    connection.commit()
+
+    return len(rows)
+
+# Example usage:
+# save_shipment_states(connection, df, collector.client_references)
+
+
+
+def build_report_from_states(stored_records, df):
+    """
+    Rebuild the full scraped DataFrame from the stored final shipments plus the fresh ones.
+
+    Args:
+    - stored_records (list): Stored records returned by select_references_to_query.
+    - df (pd.DataFrame): Freshly scraped shipments (scrape_shipment_data output).
+
+    Returns:
+    - pd.DataFrame: DataFrame with the scrape_shipment_data columns.
+    """
+    import pandas as pd
+    from functions_web_scraping import SHIPMENT_COLUMNS
+
+    stored_df = pd.DataFrame(stored_records, columns=SHIPMENT_COLUMNS)
+    if stored_df.empty:
+        return df
+
+    return pd.concat([df, stored_df], ignore_index=True)
+
+# Example usage:
+# df = build_report_from_states(stored_records, df)
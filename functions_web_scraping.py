@@ -1,72 +1,313 @@
 """
 
 Functions:
+- measure_page_transfer
+- scrape_page_with_pool
+- iter_scraped_pages
+- scrape_urls_concurrently
 - scrape_structure_from_urls
 - scrape_shipment_data
+- index_scraped_shipment_numbers
+- index_client_references
 - review_structure_scraped
 
 """
 
 
-def scrape_structure_from_urls(url_list, chromedriver_path):
+# Only shipments whose client reference starts with this prefix are kept in the report
+CLIENT_REFERENCE_PREFIX = "DSD/"
+
+# Columns of the DataFrame returned by scrape_shipment_data
+SHIPMENT_COLUMNS = ["Client Reference", "Shipment Number", "TNT Status", "Shipment Origin Date",
+                    "Shipment Destination", "Last Update", "Last Location", "Last Action",
+                    "TNT Exception Notification"]
+
+
+# Bytes downloaded by the current page and its resources, from the Resource Timing API
+PAGE_TRANSFER_SCRIPT = """
+const entries = performance.getEntriesByType('navigation').concat(performance.getEntriesByType('resource'));
+return entries.reduce((total, entry) => total + (entry.transferSize || 0), 0);
+"""
+
+
+
+def measure_page_transfer(driver):
+    """
+    Measure the bytes downloaded by the page loaded in a session.
+
+    Args:
+    - driver (WebDriver): Session with the page loaded.
+
+    Returns:
+    - int: Transferred bytes, or None if the session cannot run scripts.
+    """
+    try:
+        return int(driver.execute_script(PAGE_TRANSFER_SCRIPT) or 0)
+    except Exception:
+        return None
+
+# Example usage:
+# transfer_bytes = measure_page_transfer(driver)
+
+
+
+def scrape_page_with_pool(driver_pool, url, max_attempts=2, html_parser="html.parser", metrics=None, parse=True):
+    """
+    Load one URL with a pooled browser session and select its shipment divs.
+
+    The page source is read as soon as every reference of the chunk has been answered, when
+    the results shown have settled, or when the adaptive deadline of the pool passes. If the pool has a page cache, a fresh cached
+    page is parsed without using a browser, and every loaded page is stored in the cache.
+
+    Args:
+    - driver_pool (ChromeDriverPool): Pool providing the browser session.
+    - url (str): URL to scrape.
+    - max_attempts (int): Number of sessions to try if the page load crashes.
+    - html_parser (str): BeautifulSoup parser backend ("html.parser" or "lxml").
+    - metrics (RunMetrics, optional): Records a "chunk_fetch" span, the chunk latency, the readiness wait, the bytes downloaded and the page counters.
+    - parse (bool): Select the shipment divs. False returns the raw HTML, to be parsed by parse_pages.
+
+    Returns:
+    - list: BeautifulSoup elements with the shipment divs of the page (str with the page HTML if parse is False).
+    """
+
+    import time
+    from functions_parsing import parse_search_results
+    from functions_metrics import NullMetrics
+    from functions_page_readiness import expected_result_count, wait_for_results
+
+    # Only measure the page weight when the run records metrics (it costs one more browser round trip)
+    measure_transfer = metrics is not None
+    if metrics is None:
+        metrics = NullMetrics()
+
+    # Cached page younger than the TTL (in replay mode, any cached page; a miss raises LookupError)
+    if driver_pool.page_cache is not None:
+        page_source = driver_pool.page_cache.get(url)
+        if page_source is not None:
+            metrics.increment("pages_from_cache")
+            return parse_search_results(page_source, parser=html_parser) if parse else page_source
+
+    expected_count = expected_result_count(url)
+
+    start_time = time.time()
+    with metrics.span("chunk_fetch", url=url):
+        for attempt in range(1, max_attempts + 1):
+            session = driver_pool.acquire()
+            driver = session[0]
+
+            try:
+                # Load the webpage and wait until every shipment of the chunk has rendered
+                driver.get(url)
+                timeout = driver_pool.page_deadline.timeout()
+                ready, waited = wait_for_results(driver, expected_count, timeout)
+                metrics.observe("page_ready_seconds", waited)
+                # A timed-out wait is recorded at the deadline it ran into
+                driver_pool.page_deadline.record(min(waited, timeout))
+                if not ready:
+                    # Missing shipments are picked up again by review_structure_scraped
+                    metrics.increment("pages_not_ready")
+
+                # Extract page source
+                page_source = driver.page_source
+
+                transfer_bytes = measure_page_transfer(driver) if measure_transfer else None
+                if transfer_bytes is not None:
+                    metrics.increment("page_transfer_bytes", transfer_bytes)
+                    metrics.increment("pages_measured")
+            except Exception:
+                # Crashed session: recycle it and try again with a fresh one
+                driver_pool.release(session, crashed=True)
+                if attempt == max_attempts:
+                    metrics.increment("page_failures")
+                    raise
+                metrics.increment("page_retries")
+                continue
+
+            driver_pool.release(session)
+            break
+
+        # Every loaded page is cached, so a replay parses what this run parsed; live runs skip the incomplete ones
+        if driver_pool.page_cache is not None:
+            driver_pool.page_cache.put(url, page_source, complete=ready)
+
+        # Parse only the pb-search-results subtree and select the shipment divs
+        shipment_divs = parse_search_results(page_source, parser=html_parser) if parse else page_source
+
+    metrics.observe("chunk_fetch_seconds", time.time() - start_time)
+    metrics.increment("pages_fetched")
+    return shipment_divs
+
+# Example usage:
+# shipment_divs = scrape_page_with_pool(driver_pool, url_list[0])
+
+
+
+def iter_scraped_pages(url_list, driver_pool, max_workers=1, max_in_flight=None, min_request_interval=0.0, html_parser="html.parser", metrics=None, parse=True):
+    """
+    Scrape the chunk URLs and yield each page as soon as it and the pages before it are loaded.
+
+    The workers never run more than `max_in_flight` URLs ahead of the consumer, so the pages
+    held in memory do not grow with the number of URLs.
+
+    Args:
+    - url_list (list): List of URLs to scrape.
+    - driver_pool (ChromeDriverPool): Pool providing one browser session per worker.
+    - max_workers (int): Number of browser workers loading pages at the same time (1 loads them one at a time).
+    - max_in_flight (int, optional): Maximum number of URLs submitted but not yet consumed. Defaults to 2 * max_workers.
+    - min_request_interval (float): Minimum seconds between two page loads of the same worker.
+    - html_parser (str): BeautifulSoup parser backend ("html.parser" or "lxml").
+    - metrics (RunMetrics, optional): Shared by the workers to record every chunk fetch.
+    - parse (bool): Select the shipment divs. False yields the raw HTML of each page.
+
+    Returns:
+    - generator: One entry per URL, in url_list order: the list of shipment divs (or the page HTML), or the exception raised for that URL.
+    """
+
+    import threading
+    import time
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+
+    if max_workers <= 1:
+        for position, url in enumerate(url_list):
+            if position and min_request_interval > 0:
+                time.sleep(min_request_interval)
+            try:
+                yield scrape_page_with_pool(driver_pool, url, html_parser=html_parser, metrics=metrics, parse=parse)
+            except Exception as error:
+                yield error
+        return
+
+    if max_in_flight is None:
+        max_in_flight = 2 * max_workers
+
+    # Time of the last page load of each worker thread
+    worker_state = threading.local()
+
+    def scrape_one(url):
+        try:
+            # Per-worker rate limiting
+            last_request = getattr(worker_state, "last_request", None)
+            if last_request is not None and min_request_interval > 0:
+                wait_time = min_request_interval - (time.monotonic() - last_request)
+                if wait_time > 0:
+                    time.sleep(wait_time)
+            worker_state.last_request = time.monotonic()
+
+            return scrape_page_with_pool(driver_pool, url, html_parser=html_parser, metrics=metrics, parse=parse)
+        except Exception as error:
+            return error
+
+    # Futures in url_list order: results keep the chunk order, and a new URL is only
+    # submitted once the oldest page has been handed to the consumer
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for url in url_list:
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+            pending.append(executor.submit(scrape_one, url))
+
+        while pending:
+            yield pending.popleft().result()
+
+# Example usage:
+# for shipment_divs in iter_scraped_pages(url_list, driver_pool, max_workers=4):
+#     print(len(shipment_divs))
+
+
+
+def scrape_urls_concurrently(url_list, driver_pool, max_workers=4, max_in_flight=None, min_request_interval=0.0, html_parser="html.parser", metrics=None, parse=True):
+    """
+    Spread the chunk URLs over several browser workers and keep the results in chunk order.
+
+    Args:
+    - url_list (list): List of URLs to scrape.
+    - driver_pool (ChromeDriverPool): Pool providing one browser session per worker.
+    - max_workers (int): Number of browser workers loading pages at the same time.
+    - max_in_flight (int, optional): Maximum number of URLs submitted but not finished. Defaults to 2 * max_workers.
+    - min_request_interval (float): Minimum seconds between two page loads of the same worker.
+    - html_parser (str): BeautifulSoup parser backend ("html.parser" or "lxml").
+    - metrics (RunMetrics, optional): Shared by the workers to record every chunk fetch.
+    - parse (bool): Select the shipment divs. False keeps the raw HTML of each page.
+
+    Returns:
+    - list: One entry per URL, in url_list order: the list of shipment divs (or the page HTML), or the exception raised for that URL.
+    """
+    return list(iter_scraped_pages(url_list, driver_pool, max_workers=max_workers, max_in_flight=max_in_flight,
+                                   min_request_interval=min_request_interval, html_parser=html_parser, metrics=metrics, parse=parse))
+
+# Example usage:
+# results = scrape_urls_concurrently(url_list, driver_pool, max_workers=4, min_request_interval=1.0)
+
+
+
+def scrape_structure_from_urls(url_list, chromedriver_path, driver_pool=None, max_workers=1, max_in_flight=None, min_request_interval=0.0, html_parser="html.parser", metrics=None, raw_html=False):
     """
     Scrapes data from a list of URLs using Selenium and BeautifulSoup.
 
     Args:
     - url_list (list): List of URLs to scrape.
     - chromedriver_path (str): Path to the ChromeDriver executable.
+    - driver_pool (ChromeDriverPool, optional): Pool of browser sessions to reuse. If None, a pool is created for this call and closed at the end.
+    - max_workers (int): Number of browser workers. 1 scrapes the URLs one at a time.
+    - max_in_flight (int, optional): Maximum number of URLs queued to the workers at once (parallel mode only).
+    - min_request_interval (float): Minimum seconds between two page loads of the same worker.
+    - html_parser (str): BeautifulSoup parser backend ("html.parser" or "lxml").
+    - metrics (RunMetrics, optional): Records the chunk fetches (spans, latency histogram, page counters).
+    - raw_html (bool): Return the HTML of each loaded page instead of the shipment divs (to be parsed by parse_pages).
 
     Returns:
-    - list: List of BeautifulSoup objects representing scraped data.
+    - list: List of BeautifulSoup objects representing scraped data (one HTML string per loaded page if raw_html is True).
     """
     
-    from selenium import webdriver
-    from bs4 import BeautifulSoup
-    from IPython.display import Markdown, display
+    from functions_reporting import report
     import time
+    from functions_driver_pool import ChromeDriverPool
     
     # Empty list to store the divs retrieved
     all_shipment_divs = []
+
+    # Reuse the caller's browser sessions, or open a pool for this call only
+    owns_pool = driver_pool is None
+    if owns_pool:
+        driver_pool = ChromeDriverPool(chromedriver_path)
     
     # Start the timer
     start_time = time.time()
 
-    for url in url_list:
-        # Set up ChromeOptions for headless mode
-        chrome_options = webdriver.ChromeOptions()
-        chrome_options.add_argument('--headless')
-
-        # Set up ChromeDriver
-        chrome_service = webdriver.ChromeService(executable_path=chromedriver_path)
-        driver = webdriver.Chrome(service=chrome_service, options=chrome_options)
-
-        # Set up ChromeDriver - Bernat
-        #driver = webdriver.Chrome(executable_path=chromedriver_path, options=chrome_options)
-
-        
-        # Load the webpage
-        driver.get(url)
-        driver.implicitly_wait(8)
-
-        # Extract page source and parse with BeautifulSoup
-        page_source = driver.page_source
-        soup = BeautifulSoup(page_source, 'html.parser')
-
-        # Select shipment divs based on the HTML structure of the webpage
-        shipment_divs = soup.select('body > div.contentPageFullWidth.newBase.page.basicpage > div:nth-child(1) > div > pb-root > div > div > div > pb-track-trace > pb-search-results > div.__u-mb--xl')
+    try:
+        url_results = list(iter_scraped_pages(url_list, driver_pool, max_workers=max_workers, max_in_flight=max_in_flight,
+                                              min_request_interval=min_request_interval, html_parser=html_parser,
+                                              metrics=metrics, parse=not raw_html))
+    finally:
+        if owns_pool:
+            driver_pool.close()
+
+    for shipment_divs in url_results:
+        if isinstance(shipment_divs, Exception):
+            # Missing references are picked up again by review_structure_scraped
+            report(f"--> Could not load chunk URL ({type(shipment_divs).__name__}), skipping it.")
+            continue
+
+        if raw_html:
+            # Keep one HTML string per page
+            all_shipment_divs.append(shipment_divs)
+            continue
 
         # Extend the list of all shipment divs
         all_shipment_divs.extend(shipment_divs)
-
-        # Close the browser window
-        driver.quit()
     
     # Stop the timer
     end_time = time.time()
 
     # Calculate and display the elapsed time
     elapsed_time = end_time - start_time
-    display(Markdown(f"--> Elapsed time scraping data: **{elapsed_time:.2f} seconds**"))
+    report(f"--> Elapsed time scraping data: **{elapsed_time:.2f} seconds**")
+
+    if owns_pool:
+        pool_stats = driver_pool.stats()
+        report(f"--> Browser sessions launched: **{pool_stats['launched']}**, reused: **{pool_stats['reused']}**")
     
     return all_shipment_divs
 
@@ -78,176 +319,243 @@ def scrape_structure_from_urls(url_list, chromedriver_path):
 
 
 
-def scrape_shipment_data(all_shipment_divs):
+def scrape_shipment_data(all_shipment_divs, metrics=None):
     """
     Scrapes shipment data from the provided shipment divs and returns a DataFrame.
 
     Args:
     - all_shipment_divs (list): List of BeautifulSoup elements containing shipment details.
+    - metrics (RunMetrics, optional): Counts the shipment containers parsed and the records kept.
 
     Returns:
     - pd.DataFrame: DataFrame with scraped shipment data.
     """
     
     import pandas as pd
+    from functions_parsing import extract_shipment_record
+    from functions_metrics import NullMetrics
+    
+    if metrics is None:
+        metrics = NullMetrics()
     
     all_results = []
+    parsed_count = 0
     
     # From all url structure stored in all_shipment_divs, consult each one
     for shipment_divs in all_shipment_divs:
         # From each url structure, consult each "container" (each shipment) present
         for div in shipment_divs:
-            # Extract client reference for each shipment
-            client_reference_element = div.select_one('pb-shipment-reference div dl dd:nth-child(4)')
-            client_reference = client_reference_element.get_text(strip=True) if client_reference_element else None
+            parsed_count += 1
+            # Extract the fields with the precompiled selectors (None if the client reference does not match)
+            record = extract_shipment_record(div, client_reference_prefix=CLIENT_REFERENCE_PREFIX)
 
-            if client_reference.startswith("DSD/"):
-                # Extract shipment number for each shipment
-                shipment_number_element = div.select_one('pb-shipment-reference div dl dd:nth-child(2)')
-                shipment_number = shipment_number_element.get_text(strip=True) if shipment_number_element else None
+            if record is not None:
+                # Append extracted data
+                all_results.append(record)
 
-                # TNT Status - Original
-                #tnt_status_element = div.select_one('pb-shipment div div.__c-shipment__details sham-shipment-status-tnt > div > div.__c-shipment-status-tnt__summary > sham-step-label > span')
-                #tnt_status = tnt_status_element.get_text(strip=True) if tnt_status_element else None
+    metrics.increment("shipments_parsed", parsed_count)
+    metrics.increment("shipments_kept", len(all_results))
 
-                # TNT Status
-                tnt_status_element = div.select_one('pb-shipment div div.__c-shipment__details sham-shipment-status-tnt > div > div.__c-shipment-status-tnt__summary > sham-step-label')
-                tnt_status = tnt_status_element.get_text(strip=True) if tnt_status_element else None
+    # Return the DataFrame
+    df = pd.DataFrame(all_results, columns=SHIPMENT_COLUMNS)
+    return df
 
-                # Extract Shipment Origin Date
-                shipment_origin_date_element = div.select_one('pb-shipment div div.__c-shipment__details sham-shipment-addresses > div > div.__c-shipment-address.__c-shipment-address--from > div.__c-shipment-address__text > div:nth-child(3) > sham-shipment-origin-date')
-                shipment_origin_date = shipment_origin_date_element.get_text(strip=True) if shipment_origin_date_element else None
+# Example usage:
+# df = scrape_shipment_data(all_shipment_divs)
+# df.head()
 
-                # Extract Shipment Destination
-                shipment_destination_element = div.select_one('pb-shipment div div.__c-shipment__details sham-shipment-addresses > div > div.__c-shipment-address.__c-shipment-address--to > div:nth-child(2) > div.__c-heading.__c-heading--h4.__c-heading--bold.__u-mb--none')
-                shipment_destination = shipment_destination_element.get_text(strip=True) if shipment_destination_element else None
 
-                # Extract Last Update
-                last_update_element = div.select_one('pb-shipment div div.__c-shipment__history.__u-print-only sham-shipment-history > table > tbody > tr:nth-child(1) > td.__c-shipment-history__date')
-                last_update = last_update_element.get_text(strip=True) if last_update_element else None
 
-                # Extract Last Location
-                last_location_element = div.select_one('pb-shipment div div.__c-shipment__history.__u-print-only sham-shipment-history > table > tbody > tr:nth-child(1) > td.__u-hide--small-medium')
-                last_location = last_location_element.get_text(strip=True) if last_location_element else None
+def index_scraped_shipment_numbers(all_shipment_divs):
+    """
+    Build the set of shipment numbers actually parsed from the scraped divs.
 
-                # Extract Last Action
-                last_action_element = div.select_one('pb-shipment div div.__c-shipment__history sham-shipment-history > table > tbody > tr:nth-child(1) > td:nth-child(3)')
-                last_action_text = last_action_element.get_text(strip=True) if last_action_element else None
+    Args:
+    - all_shipment_divs (list): List of BeautifulSoup objects representing scraped data.
 
-                # Extract Action Message
-                if "-" in last_action_text:
-                    _, last_action = last_action_text.split("-", 1)
-                else:
-                    last_action = last_action_text
+    Returns:
+    - set: Shipment numbers (as strings) found in the scraped data.
+    """
+    from functions_parsing import compile_selector, SHIPMENT_FIELD_SELECTORS
 
-                # Check for warning badge and determine if it's a warning
-                warning_badge_element = div.select_one('.__c-badge.__c-badge--warning')
-                warning_badge = "EXCEPTION ALERT" if warning_badge_element else " "
+    shipment_number_selector = compile_selector(SHIPMENT_FIELD_SELECTORS["Shipment Number"])
+    found_numbers = set()
 
-                # Append extracted data
-                all_results.append({
-                    "Client Reference": client_reference,
-                    "Shipment Number": shipment_number,
-                    "TNT Status": tnt_status,
-                    "Shipment Origin Date": shipment_origin_date,
-                    "Shipment Destination": shipment_destination,
-                    "Last Update": last_update,
-                    "Last Location": last_location,
-                    "Last Action": last_action,
-                    "TNT Exception Notification": warning_badge
-                })
-            else:
-                pass
+    for shipment_divs in all_shipment_divs:
+        for shipment_number_element in shipment_number_selector.select(shipment_divs):
+            found_numbers.add(shipment_number_element.get_text(strip=True))
 
-    # Return the DataFrame
-    df = pd.DataFrame(all_results)
-    return df
+    return found_numbers
 
 # Example usage:
-# df = scrape_shipment_data(all_shipment_divs)
-# df.head()
+# found_numbers = index_scraped_shipment_numbers(all_shipment_divs)
+
+
+
+def index_client_references(all_shipment_divs):
+    """
+    Map every scraped shipment number to its client reference, whatever its prefix.
+
+    Args:
+    - all_shipment_divs (list): List of BeautifulSoup objects representing scraped data.
+
+    Returns:
+    - dict: Client reference (or None) keyed by shipment number.
+    """
+    from functions_parsing import compile_selector, SHIPMENT_FIELD_SELECTORS
 
+    shipment_number_selector = compile_selector(SHIPMENT_FIELD_SELECTORS["Shipment Number"])
+    client_reference_selector = compile_selector(SHIPMENT_FIELD_SELECTORS["Client Reference"])
+    client_references = {}
 
+    for shipment_divs in all_shipment_divs:
+        for div in shipment_divs:
+            shipment_number_element = shipment_number_selector.select_one(div)
+            if shipment_number_element is None:
+                continue
+            client_reference_element = client_reference_selector.select_one(div)
+            client_references[shipment_number_element.get_text(strip=True)] = (
+                client_reference_element.get_text(strip=True) if client_reference_element else None
+            )
 
+    return client_references
 
+# Example usage:
+# client_references = index_client_references(all_shipment_divs)
 
 
 
-def review_structure_scraped(unique_references, all_shipment_divs, url_list, chromedriver_path):
+def review_structure_scraped(unique_references, all_shipment_divs, url_list, chromedriver_path, driver_pool=None, max_workers=1, min_request_interval=0.0, html_parser="html.parser", metrics=None, records=False):
     """
     Review the structure of scraped data.
 
     Args:
     - unique_references (list): List of unique references to check.
     - all_shipment_divs (list): List of BeautifulSoup objects representing scraped data.
-    - url_list (list): List of URLs to scrape.
+    - url_list (list): List of URLs already scraped. Only the missing references are scraped again, re-chunked in smaller URLs;
+      those missing from a page that showed the rest of its chunk are reported as not found on TNT instead.
     - chromedriver_path (str): Path to the ChromeDriver executable.
+    - driver_pool (ChromeDriverPool, optional): Pool of browser sessions shared with scrape_structure_from_urls.
+    - max_workers (int): Number of browser workers used when scraping again.
+    - min_request_interval (float): Minimum seconds between two page loads of the same worker.
+    - html_parser (str): BeautifulSoup parser backend ("html.parser" or "lxml").
+    - metrics (RunMetrics, optional): Counts the retry rounds and records the references still missing (and not found on TNT) at the end.
+    - records (bool): all_shipment_divs is the ShipmentRecordCollector of stream_shipment_records instead of
+      shipment divs; the pages scraped again are streamed into it the same way.
 
     Returns:
-    None
+    - list: all_shipment_divs merged with the shipment divs found when scraping again (the collector if records is True).
     """
     
-    from IPython.display import Markdown, display
+    from functions_reporting import report
     import time
+    from functions_extract import create_chunked_urls, TNT_TRACKING_URL
+    from functions_metrics import NullMetrics
+    from functions_page_readiness import requested_references
+    from functions_pipeline import stream_shipment_records
+    
+    if metrics is None:
+        metrics = NullMetrics()
     
     # Start the timer
     start_time = time.time()
 
     # Count the expected shipment numbers
-    len_unique_ref = len(unique_references)
+    len_unique_ref = len({str(ship_num) for ship_num in unique_references})
 
     # Print the expected number of shipments
-    display(Markdown(f"--> Expected number of shipments: **{len_unique_ref}**"))
+    report(f"--> Expected number of shipments: **{len_unique_ref}**")
 
     # Display a message indicating that the extracted data is being reviewed or scraped
-    display(Markdown("--> Reviewing extracted data..."))
+    report("--> Reviewing extracted data...")
 
     # Set the maximum number of attempts for scraping
     max_attempts = 5
     # Initialize the current attempt counter
     current_attempt = 1
 
-    # Initialize found_shipments outside the loop
-    found_shipments = 0
+    # Index of the shipment numbers actually parsed so far (kept up to date by the collector in records mode)
+    base_url = url_list[0].split("?")[0] if url_list else TNT_TRACKING_URL
+    expected_numbers = {str(ship_num) for ship_num in unique_references}
+    if records:
+        found_numbers = all_shipment_divs.found_numbers
+    else:
+        all_shipment_divs = list(all_shipment_divs)
+        found_numbers = index_scraped_shipment_numbers(all_shipment_divs)
+
+    # References missing from a page that showed the other shipments of its chunk are unknown to TNT: the page
+    # settled without them, so they are not requested again (a page that showed nothing is)
+    not_found_numbers = set()
+    round_urls = url_list
 
     # Continue scraping until all unique references are found in the shipment data or max attempts are reached
     while current_attempt <= max_attempts:
-        # Count the number of found shipment numbers
-        found_shipments = sum(any(str(ship_num) in str(div) for div in all_shipment_divs) for ship_num in unique_references)
+        for url in round_urls:
+            url_references = set(requested_references(url))
+            if url_references & found_numbers:
+                not_found_numbers |= (url_references & expected_numbers) - found_numbers
+
+        # Shipment numbers still missing from the scraped data
+        missing_numbers = expected_numbers - found_numbers - not_found_numbers
+        found_shipments = len(expected_numbers & found_numbers)
 
         # Print a message indicating the attempt status
-        if found_shipments == len_unique_ref:
-            display(Markdown(f"--> Attempt {current_attempt} Succeeded: Found {found_shipments} out of {len_unique_ref} shipments."))
+        if not missing_numbers:
+            if not_found_numbers:
+                report(f"--> Attempt {current_attempt}: Found {found_shipments} out of {len_unique_ref} shipments, "
+                       f"{len(not_found_numbers)} not found on TNT: {', '.join(sorted(not_found_numbers))}")
+            else:
+                report(f"--> Attempt {current_attempt} Succeeded: Found {found_shipments} out of {len_unique_ref} shipments.")
             break  # Exit the loop if all unique references are found
         else:
-            display(Markdown(f"--> Attempt {current_attempt} Unsucceeded: Found {found_shipments} out of {len_unique_ref} shipments.\n**Scraping TNT web again...**"))
-
-        # Scraping data again
-        all_shipment_divs = scrape_structure_from_urls(url_list, chromedriver_path)
+            report(f"--> Attempt {current_attempt} Unsucceeded: Found {found_shipments} out of {len_unique_ref} shipments.\n**Scraping TNT web again for the {len(missing_numbers)} missing shipments...**")
+
+        # Re-chunk only the missing references, in smaller groups on every attempt (15, 7, 3, 1...)
+        retry_chunk_size = max(1, 30 // (2 ** current_attempt))
+        retry_url_list = create_chunked_urls(missing_numbers, chunk_size=retry_chunk_size, base_url=base_url)
+        round_urls = retry_url_list
+        metrics.increment("review_retries")
+
+        # Scraping the missing references again and merging them with the data already scraped
+        if records:
+            stream_shipment_records(retry_url_list, chromedriver_path, driver_pool=driver_pool, collector=all_shipment_divs,
+                                    max_workers=max_workers, min_request_interval=min_request_interval,
+                                    html_parser=html_parser, metrics=metrics)
+        else:
+            retry_shipment_divs = scrape_structure_from_urls(retry_url_list, chromedriver_path, driver_pool=driver_pool,
+                                                             max_workers=max_workers, min_request_interval=min_request_interval,
+                                                             html_parser=html_parser, metrics=metrics)
+            all_shipment_divs.extend(retry_shipment_divs)
+            found_numbers |= index_scraped_shipment_numbers(retry_shipment_divs)
 
         # Increment the attempt counter
         current_attempt += 1
-    
-    
+
+    # Count again to include the last attempt
+    found_shipments = len(expected_numbers & found_numbers)
+    metrics.set_gauge("missing_references", len_unique_ref - found_shipments)
+    metrics.set_gauge("references_not_found", len(not_found_numbers - found_numbers))
     
     # Check if all unique references are present in the scraped data
     if found_shipments == len_unique_ref:
-        display(Markdown("**All shipment numbers in your Excel file are present in the scraped data.**"))
+        report("**All shipment numbers in your Excel file are present in the scraped data.**")
         # Continue with the next stage of your code
+    elif not missing_numbers - found_numbers:
+        report(f"**{len_unique_ref - found_shipments} shipment numbers in your Excel file are not found on TNT, the others are present in the scraped data.**")
     else:
-        display(Markdown("**Unsuccessful scrap. Review code, possible errors on the dataframe, or run it again.**"))
+        report("**Unsuccessful scrap. Review code, possible errors on the dataframe, or run it again.**")
     
     # Stop the timer
     end_time = time.time()
 
     # Calculate and display the elapsed time
     elapsed_time = end_time - start_time
-    display(Markdown(f"--> Elapsed time reviewing scraped data: **{elapsed_time:.2f} seconds**"))
+    report(f"--> Elapsed time reviewing scraped data: **{elapsed_time:.2f} seconds**")
     
     # Return the updated all_shipment_divs
     return all_shipment_divs
 
 
 # Example usage:
-# all_shipment_divs = review_structure_scraped(unique_references, all_shipment_divs, url_list, chromedriver_path)
+# all_shipment_divs = review_structure_scraped(unique_references, all_shipment_divs, url_list, chromedriver_path, driver_pool=driver_pool)
 
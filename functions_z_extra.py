@@ -3,6 +3,8 @@
 Functions:
 - display_url_list
 - display_exception_shipments
+- build_shipment_analytics
+- get_shipment_analytics
 - plot_tnt_status_bar
 - check_inconsistencies
 - plot_counts_avg_shipment
@@ -10,6 +12,14 @@ Functions:
 """
 
 
+# Report columns the analytics are derived from (their content keys the analytics cache)
+ANALYTICS_SOURCE_COLUMNS = ['TNT Status', 'TNT Exception Notification', 'Shipment Destination',
+                            'Shipment Origin Date', 'Processing Days']
+
+# Analytics of the last report plotted, keyed by its content fingerprint
+_ANALYTICS_CACHE = {}
+
+
 
 def display_url_list(url_list):
     """
@@ -38,9 +48,11 @@ def display_exception_shipments(dataframe):
     - None
     """
     from IPython.display import display, Markdown, HTML
+    from functions_process_df import to_typed_report, format_report_for_export
     
-    # Extract exception shipments
-    exception_shipments = dataframe[dataframe['TNT Exception Notification'] != " "]
+    # Extract exception shipments (flag of the typed report, or "EXCEPTION ALERT" in a saved one)
+    exception_flags = to_typed_report(dataframe[['TNT Exception Notification']])['TNT Exception Notification']
+    exception_shipments = format_report_for_export(dataframe[exception_flags.fillna(False).to_numpy()])
 
     # Display a markdown message
     display(Markdown(f"**{len(exception_shipments)} Exception Notification detected!**"))
@@ -64,6 +76,98 @@ def display_exception_shipments(dataframe):
 
 
 
+def build_shipment_analytics(df):
+    """
+    Derive the typed analytics frame of a report and every aggregate the plots show, in one pass.
+
+    The report is reduced once to a cube of shipment counts and processing-day sums at the
+    finest grain (TNT Status, status category, destination country, origin month). The
+    status, country, status x country and month views are roll-ups of that cube.
+
+    Args:
+    - df (pd.DataFrame): Processed report (global_df_transformation output, or a saved report).
+
+    Returns:
+    - dict: "frame" (typed analytics frame), "cube", "status_counts" (shipments by TNT Status) and
+      one count / average frame per plot_counts_avg_shipment plot_type.
+    """
+    import numpy as np
+    import pandas as pd
+    from functions_process_df import to_typed_report
+
+    # Typed columns: whole days, datetime64 origin date, boolean exception flag
+    report_df = to_typed_report(df[ANALYTICS_SOURCE_COLUMNS])
+
+    # "City, Country": everything after the first comma is the country
+    destination = report_df['Shipment Destination'].astype(str).str.partition(',')
+
+    frame = pd.DataFrame({
+        'TNT Status': report_df['TNT Status'],
+        'TNT Status Category': pd.Categorical(np.where(report_df['TNT Exception Notification'].fillna(False),
+                                                       'Exception Notification', report_df['TNT Status'].astype(object))),
+        'Destination City': destination[0].str.strip().astype('category'),
+        'Destination Country': destination[2].str.strip().replace('', np.nan).astype('category'),
+        'Shipment Origin Month': report_df['Shipment Origin Date'].dt.month.astype('Int8'),
+        'Processing Days': report_df['Processing Days'].astype('float64'),
+    }, index=df.index)
+
+    # Counts and day sums at the finest grain; missing keys are kept here and dropped per view
+    cube_keys = ['TNT Status', 'TNT Status Category', 'Destination Country', 'Shipment Origin Month']
+    cube = frame.groupby(cube_keys, observed=True, dropna=False)['Processing Days'].agg(['size', 'count', 'sum']).reset_index()
+
+    def roll_up(keys):
+        view = cube.dropna(subset=keys).groupby(keys, observed=True)[['count', 'sum']].sum()
+        view['mean'] = (view['sum'] / view['count']).round(2)
+        return view[['count', 'mean']].rename(columns={'mean': 'Avg Processing Days', 'count': 'Shipment Count'})
+
+    status_counts = cube.groupby('TNT Status', observed=True)['size'].sum()
+
+    return {
+        'frame': frame,
+        'cube': cube,
+        'status_counts': status_counts[status_counts > 0].sort_values(ascending=True).rename('count'),
+        'TNT Status': roll_up(['TNT Status Category']).sort_values(by='Avg Processing Days', ascending=False),
+        'Destination Country': roll_up(['Destination Country']).sort_values(by='Avg Processing Days', ascending=False),
+        'Status and Country': roll_up(['TNT Status Category', 'Destination Country']).sort_values(by='Avg Processing Days', ascending=False),
+        'Month': roll_up(['Shipment Origin Month']).sort_values(by=['Shipment Origin Month', 'Avg Processing Days'], ascending=[True, False]),
+    }
+
+# Example usage:
+# analytics = build_shipment_analytics(processed_df)
+# analytics['Destination Country']
+
+
+
+
+def get_shipment_analytics(df):
+    """
+    Shipment analytics of a report, derived once and reused by every plot until the report changes.
+
+    The cache is keyed by a hash of the source columns, so a new or modified report
+    (even modified in place) is derived again.
+
+    Args:
+    - df (pd.DataFrame): Processed report (global_df_transformation output).
+
+    Returns:
+    - dict: build_shipment_analytics output.
+    """
+    import pandas as pd
+
+    fingerprint = (len(df), int(pd.util.hash_pandas_object(df[ANALYTICS_SOURCE_COLUMNS], index=False).sum()))
+    if fingerprint not in _ANALYTICS_CACHE:
+        # Only the analytics of the last report are kept
+        _ANALYTICS_CACHE.clear()
+        _ANALYTICS_CACHE[fingerprint] = build_shipment_analytics(df)
+
+    return _ANALYTICS_CACHE[fingerprint]
+
+# Example usage:
+# analytics = get_shipment_analytics(processed_df)
+
+
+
+
 def plot_tnt_status_bar(processed_df):
     """
     Create a horizontal bar plot of the number of shipments by TNT Status.
@@ -81,12 +185,14 @@ def plot_tnt_status_bar(processed_df):
     # Set Seaborn dark theme
     sns.set_theme(style="darkgrid")
     
+    # Shipments by TNT Status, from the analytics shared with plot_counts_avg_shipment
+    status_counts = get_shipment_analytics(processed_df)['status_counts']
+
     # Define a color palette with different colors for each TNT Status
-    colors = sns.color_palette("husl", len(processed_df['TNT Status'].unique()))
+    colors = sns.color_palette("husl", len(status_counts))
 
     # Create a bar plot
     plt.figure(figsize=(8, 4))
-    status_counts = processed_df['TNT Status'].value_counts().sort_values(ascending=True)
     status_counts.plot(kind='barh', color=colors)
 
     # Add labels with the number of shipments on each bar
@@ -99,44 +205,78 @@ def plot_tnt_status_bar(processed_df):
     plt.show()
 
 # Example usage:
-# plot_horizontal_bar(processed_df)
+# plot_tnt_status_bar(processed_df)
 
 
 
-def check_inconsistencies(excel_tests_file_path, df):
+def check_inconsistencies(excel_tests_file_path, df, cache_dir=None, client_references=None, client_reference_prefix=None, router=None, report_name=None):
     """
     Check inconsistencies between the original Excel file and the extracted DataFrame.
 
+    The missing references are found with a single anti-join on normalized reference keys,
+    and each one gets its reason in the same pass:
+    - "Not returned by TNT": the shipment was not on any scraped page.
+    - "Filtered out by client reference": TNT returned it, with a client reference outside client_reference_prefix.
+    - "Routed to report '<name>'": with a router, TNT returned it for another report than report_name.
+    - "Failed to parse": TNT returned it for this report (or with no client reference), but it is not in df.
+    Without client_references, the reason is "Not in extracted DataFrame".
+
     Parameters:
     - excel_tests_file_path (str): Path to the original Excel file.
     - df (pd.DataFrame): Extracted DataFrame.
+    - cache_dir (str, optional): Folder of the cache shared with extract_and_create_urls (see load_shipments_to_query).
+    - client_references (dict, optional): Client reference of every shipment returned by TNT, keyed by shipment
+      number (the client_references of the tnt_shipment_tracker run).
+    - client_reference_prefix (str, optional): Prefix of the shipments kept in df. Defaults to CLIENT_REFERENCE_PREFIX.
+    - router (ClientReferenceRouter, optional): Router of a run with report routes. Replaces client_reference_prefix.
+    - report_name (str, optional): With a router, the report df comes from. Defaults to every report of the run.
 
     Returns:
-    - pd.DataFrame: DataFrame containing rows with missing references.
+    - pd.DataFrame: DataFrame containing rows with missing references and a 'Missing Reason' column.
     """
     
+    import numpy as np
     import pandas as pd
+    from functions_extract import load_shipments_to_query, normalize_reference_keys
+    from functions_web_scraping import CLIENT_REFERENCE_PREFIX
     
-    # Read the original Excel file
-    original_excel = pd.read_excel(excel_tests_file_path)
-
-    # Filter data in original_excel
-    original_excel = original_excel[(original_excel["Carrier"] == "TNT") & (original_excel["Status"] != "DELIVERED")][["LOGIS ID", "Carrier", "T&T reference", "Status"]]
-
-    # Extract missing references
-    missing_references = original_excel[~original_excel['T&T reference'].isin(df['Shipment Number'])]['T&T reference']
+    if client_reference_prefix is None:
+        client_reference_prefix = CLIENT_REFERENCE_PREFIX
+    
+    # Read the original Excel file, filtered to Carrier = "TNT" & Status != DELIVERED (cached)
+    original_excel = load_shipments_to_query(excel_tests_file_path, cache_dir=cache_dir)
 
-    # Create an empty DataFrame to store rows from original_excel
-    df_missing_references = pd.DataFrame(columns=original_excel.columns)
+    # Anti-join on normalized keys: original rows whose reference is not in the extracted DataFrame
+    original_keys = normalize_reference_keys(original_excel['T&T reference'])
+    extracted_keys = pd.Index(normalize_reference_keys(df['Shipment Number']).unique())
+    missing_mask = ~original_keys.isin(extracted_keys)
 
-    # Iterate over each missing reference
-    for row_value in missing_references:
-        condition = original_excel['T&T reference'] == row_value
-        original_row = original_excel.loc[condition]
+    df_missing_references = original_excel[missing_mask].reset_index(drop=True)
+    missing_keys = original_keys[missing_mask].reset_index(drop=True)
 
-        # Check if the row exists
-        if not original_row.empty:
-            df_missing_references = pd.concat([df_missing_references, original_row], ignore_index=True)
+    # Reason of each missing reference
+    if client_references is None:
+        df_missing_references['Missing Reason'] = "Not in extracted DataFrame"
+    else:
+        returned = pd.Series(client_references, dtype=object)
+        returned.index = normalize_reference_keys(returned.index.to_series())
+        missing_client_references = missing_keys.map(returned)
+
+        if router is not None:
+            # A routed run keeps every shipment, in the report of its prefix
+            routed_reports = missing_client_references.map(router.route, na_action="ignore")
+            elsewhere = missing_client_references.notna() & (routed_reports != report_name) if report_name is not None \
+                else pd.Series(False, index=missing_keys.index)
+            elsewhere_reason = "Routed to report '" + routed_reports.fillna("") + "'"
+        else:
+            elsewhere = missing_client_references.notna() & ~missing_client_references.fillna("").str.startswith(client_reference_prefix)
+            elsewhere_reason = "Filtered out by client reference"
+
+        df_missing_references['Missing Reason'] = np.select(
+            [~missing_keys.isin(returned.index), elsewhere],
+            ["Not returned by TNT", elsewhere_reason],
+            default="Failed to parse"
+        )
             
     # Print the comparison information
     print(f"Original Length: {len(original_excel)}")
@@ -146,7 +286,8 @@ def check_inconsistencies(excel_tests_file_path, df):
     # Display the DataFrame with missing references
     if not df_missing_references.empty:
         print("\nShipment numbers to check:")
-        #print(df_missing_references)
+        for reason, count in df_missing_references['Missing Reason'].value_counts().items():
+            print(f"- {reason}: {count}")
     else:
         print("\nNo Missing Shipment numbers Found")
 
@@ -156,6 +297,11 @@ def check_inconsistencies(excel_tests_file_path, df):
 #excel_tests_file_path = "path/to/your/excel/file.xlsx"
 #df = pd.DataFrame(...)  # Replace ... with your actual DataFrame
 #check_inconsistencies(excel_tests_file_path, df)
+#run = tnt_shipment_tracker(excel_tests_file_path, chromedriver_path, folder_save_to_excel_path)
+#check_inconsistencies(excel_tests_file_path, run.processed_df, client_references=run.client_references)
+#run = tnt_shipment_tracker(excel_tests_file_path, chromedriver_path, folder_save_to_excel_path, report_routes=routes)
+#check_inconsistencies(excel_tests_file_path, run.reports["dsd"], client_references=run.client_references,
+#                      router=ClientReferenceRouter(routes), report_name="dsd")
 
 
 
@@ -172,40 +318,15 @@ def plot_counts_avg_shipment(df, plot_type='TNT Status'):
     - None
     """
 
-    import pandas as pd
-    import numpy as np
     import matplotlib.pyplot as plt
     import seaborn as sns
 
-    # Create a copy of the dataframe for plotting
-    plotting_df = df.copy()
-
-    # Convert 'Processing Days' to numeric
-    plotting_df['Processing Days'] = pd.to_numeric(plotting_df['Processing Days'].str.extract('(\d+)')[0], errors='coerce')
-
-    # Combine 'TNT Status' and 'TNT Exception Notification' to create a new category
-    plotting_df['TNT Status Category'] = plotting_df.apply(lambda row: 'Exception Notification' if row['TNT Exception Notification'] == 'EXCEPTION ALERT' else row['TNT Status'], axis=1)
-
-    # Assuming 'Shipment Destination' is a string column with values like "City, Country"
-    plotting_df[['Destination City', 'Destination Country']] = plotting_df['Shipment Destination'].str.split(',', 1, expand=True)
-
-    # Strip leading and trailing whitespaces from the columns
-    plotting_df['Destination City'] = plotting_df['Destination City'].str.strip()
-    plotting_df['Destination Country'] = plotting_df['Destination Country'].str.strip()
-
-    # Convert 'Shipment Origin Date' to datetime
-    plotting_df['Shipment Origin Date'] = pd.to_datetime(plotting_df['Shipment Origin Date'], errors='coerce')
-
-    # Extract month
-    plotting_df['Shipment Origin Month'] = plotting_df['Shipment Origin Date'].dt.month
-
-    plotting_df = plotting_df[['TNT Status Category', 'Destination City', 'Destination Country', 'Shipment Origin Month', 'Processing Days']]
+    # Aggregates of every plot_type, derived once per report
+    analytics = get_shipment_analytics(df)
 
     if plot_type == 'TNT Status':
         # Plotting for TNT Status
-        status_stats = plotting_df.groupby(['TNT Status Category'])['Processing Days'].agg(['count', 'mean']).round(2)
-        status_stats = status_stats.sort_values(by='mean', ascending=False)
-        status_stats = status_stats.rename(columns={'mean': 'Avg Processing Days', 'count': 'Shipment Count'})
+        status_stats = analytics['TNT Status']
 
         # Set Seaborn dark theme
         sns.set_theme(style="darkgrid")
@@ -241,10 +362,7 @@ def plot_counts_avg_shipment(df, plot_type='TNT Status'):
         plt.show()
 
     elif plot_type == 'Destination Country':
-        # Assuming you have already calculated country_stats
-        country_stats = plotting_df.groupby(['Destination Country'])['Processing Days'].agg(['count', 'mean']).round(2)
-        country_stats = country_stats.sort_values(by='mean', ascending=False)
-        country_stats = country_stats.rename(columns={'mean': 'Avg Processing Days', 'count': 'Shipment Count'})
+        country_stats = analytics['Destination Country']
 
         # Set Seaborn dark theme
         sns.set_theme(style="darkgrid")
@@ -289,20 +407,14 @@ def plot_counts_avg_shipment(df, plot_type='TNT Status'):
             plt.show()
 
     elif plot_type == 'Status and Country':
-        # Assuming you have already calculated status_country_stats
-        status_country_stats = plotting_df.groupby(['TNT Status Category', 'Destination Country'])['Processing Days'].agg(['count', 'mean']).round(2)
-        status_country_stats = status_country_stats.sort_values(by='mean', ascending=False)
-        status_country_stats = status_country_stats.rename(columns={'mean': 'Avg Processing Days', 'count': 'Shipment Count'})
+        status_country_stats = analytics['Status and Country']
 
         # Display status_country_stats
         display(status_country_stats)
 
     elif plot_type == 'Month':
-        # Assuming you have already calculated month_stats
-        month_stats = plotting_df.groupby(['Shipment Origin Month'])['Processing Days'].agg(['count', 'mean']).round(2)
-        month_stats = month_stats.rename(columns={'mean': 'Avg Processing Days', 'count': 'Shipment Count'})
-        # Sort by month and then by mean
-        month_stats = month_stats.sort_values(by=['Shipment Origin Month', 'Avg Processing Days'], ascending=[True, False])
+        # Sorted by month and then by mean
+        month_stats = analytics['Month']
         display(month_stats)
 
         # Example usage: